@@ -501,7 +501,7 @@ run_perl gen_onta.pl
 run_python  bz_simple.py
 run_sh  gen_drap.sh
 run_python xray_simple.py
-run_sh  kc2g_muf_heatmap.sh
+run_sh  update_muf_rt_maps.sh
 
 sudo chown -R www-data:www-data "$BASE"
 # ---------- footer ----------
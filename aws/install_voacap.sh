@@ -31,6 +31,26 @@ sudo chown -R www-data:www-data "$BASE/cache/voacap-cache"
 sudo chown www-data:www-data "$BASE/scripts/voacap_bandconditions.py"
 sudo chown www-data:www-data "$BASE/htdocs/ham/HamClock/fetchBandConditions.pl"
 
+echo "==> Installing band-conditions service..."
+sudo tee /etc/systemd/system/ohb-bandconditions.service >/dev/null <<EOF
+[Unit]
+Description=OHB band-conditions prediction service (fetchBandConditions.pl)
+After=network.target
+
+[Service]
+User=www-data
+Group=www-data
+ExecStart=$VENV/bin/python3 $BASE/scripts/voacap_bandconditions.py --serve $BASE/tmp/voacap-bandcond.sock
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+sudo systemctl daemon-reload
+sudo systemctl enable ohb-bandconditions.service
+sudo systemctl restart ohb-bandconditions.service
+
 echo "==> Verifying install..."
 sudo -u www-data "$VENV/bin/python" -c "import dvoacap; print('    dvoacap OK')"
 sudo -u www-data "$VENV/bin/python" "$BASE/scripts/voacap_bandconditions.py" \
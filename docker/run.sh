@@ -40,6 +40,18 @@ echo $(date -u +%s) > /opt/started-running.txt
 echo "Starting cron ..."
 /usr/sbin/cron
 
+# resident band-conditions service for fetchBandConditions.pl (needs dvoacap;
+# the CGI runs voacap_bandconditions.py itself while the service is down)
+if python3 -c 'import dvoacap' 2>/dev/null; then
+    echo "Starting band-conditions service ..."
+    /usr/sbin/runuser -u www-data -- sh -c 'while :; do
+        python3 /opt/hamclock-backend/scripts/voacap_bandconditions.py \
+            --serve /opt/hamclock-backend/tmp/voacap-bandcond.sock \
+            >> /opt/hamclock-backend/logs/voacap_bandconditions.log 2>&1
+        sleep 5
+    done' &
+fi
+
 echo "OHB is running and ready to use at: $(date -u +%H:%M:%S)"
 
 # hold the script to keep the container running
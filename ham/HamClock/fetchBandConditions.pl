@@ -2,16 +2,22 @@
 use strict;
 use warnings;
 use CGI qw(:standard);
+use IO::Socket::UNIX;
+use JSON::PP;
 
 # ---------------------------------------------------------------------------
 # fetchBandConditions.pl — local drop-in replacement for CSI's endpoint.
 # Delegates to voacap_bandconditions.py and returns identical output.
+# Asks the resident service (voacap_bandconditions.py --serve) first and
+# runs the script directly if the service is down, busy or too slow.
 # ---------------------------------------------------------------------------
 
 my $PYTHON  = '/opt/hamclock-backend/venv/bin/python3';
 my $SCRIPT  = '/opt/hamclock-backend/scripts/voacap_bandconditions.py';
 my $CACHE_DIR = '/opt/hamclock-backend/tmp/voacap-cache';
 my $CACHE_TTL = 300;   # seconds; set 0 to disable
+my $SOCKET    = '/opt/hamclock-backend/tmp/voacap-bandcond.sock';
+my $SERVICE_TIMEOUT = 30;   # seconds before giving up on the service
 
 # ---------------------------------------------------------------------------
 # Parse query string parameters
@@ -68,10 +74,9 @@ if (!$ssn || $ssn !~ /^\d+(\.\d+)?$/) {
 }
 
 # ---------------------------------------------------------------------------
-# Build command (use list form to avoid shell injection)
+# Build arguments (use list form to avoid shell injection)
 # ---------------------------------------------------------------------------
-my @cmd = (
-    $PYTHON, $SCRIPT,
+my @args = (
     '--year',   $year,
     '--month',  $month,
     '--utc',    $utc,
@@ -83,16 +88,60 @@ my @cmd = (
     '--pow',    $pow,
     '--mode',   $mode,
     '--toa',    $toa,
+    '--ssn',    $ssn,
     '--cache-dir', $CACHE_DIR,
     '--cache-ttl', $CACHE_TTL,
 );
 
 
+# ---------------------------------------------------------------------------
+# Ask the resident service; undef if it is not running or fails
+# ---------------------------------------------------------------------------
+sub ask_service {
+    my @argv = @_;
+    return undef unless -S $SOCKET;
+
+    my $body;
+    eval {
+        local $SIG{ALRM} = sub { die "timeout\n" };
+        alarm $SERVICE_TIMEOUT;
+        my $sock = IO::Socket::UNIX->new(Type => SOCK_STREAM(), Peer => $SOCKET)
+            or die "connect: $!\n";
+        binmode $sock;
+        print {$sock} encode_json({ argv => \@argv }), "\n";
+        my $line = <$sock>;
+        die "no response\n" unless defined $line;
+        my $head = decode_json($line);
+        die(($head->{error} // 'error') . "\n") unless $head->{ok};
+        $body = '';
+        while (length($body) < $head->{bytes}) {
+            my $n = read($sock, $body, $head->{bytes} - length($body), length($body));
+            die "short read\n" unless $n;
+        }
+        close $sock;
+        alarm 0;
+    };
+    alarm 0;
+    if ($@) {
+        print STDERR "fetchBandConditions: service: $@";
+        return undef;
+    }
+    return $body;
+}
+
 # ---------------------------------------------------------------------------
 # Run and capture output
 # ---------------------------------------------------------------------------
-my $output = '';
-my $errors = '';
+my $output = ask_service(@args);
+
+if (defined $output && $output ne '') {
+    print $q->header('text/plain');
+    print $output;
+    exit 0;
+}
+
+my @cmd = ($PYTHON, $SCRIPT, @args);
+$output = '';
 
 {
     local $/;
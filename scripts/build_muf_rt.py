@@ -4,37 +4,91 @@ Build HamClock MUF-RT maps:
 
   - fetch KC2G station observations from https://prop.kc2g.com/api/stations.json
   - filter stations active within last hour (+ optional confidence filter)
-  - interpolate MUF globally (IDW on sphere)
+  - --source picks what the MUF field comes from: station IDW (stations),
+    KC2G's model contours (contours, mufd-normal-now.geojson, gridded
+    once), or both (blend: stations where their coverage reaches, contours
+    elsewhere); this replaces the separate GMT pipeline of kc2g_muf_heatmap.sh
+  - interpolate MUF globally (IDW on sphere, k nearest stations from a KD-tree),
+    either exactly per pixel or once on a --grid-deg lat/lon grid resampled
+    to each size (--grid-check reports the deviation from the exact field);
+    with --weights-cache the neighbour/weight matrix is kept on disk per
+    (grid, station set) so unchanged station sets re-render as a sparse
+    matrix-vector product
+  - with --incremental, keep per-size state (--state-dir) and only recompute
+    the 128 px tiles whose neighbourhoods include a station whose value
+    changed, splicing them into the published maps
+  - with --band-rows, stream each size in horizontal bands (base decoded
+    incrementally, output fed to one zlib stream) so peak memory follows
+    the band height instead of the map size
+  - with --workers, split interpolation + colorizing into row chunks across
+    a process pool that writes straight into a shared-memory RGBA array
+  - with --extra-products, the same neighbour search and weights also give
+    foF2-RT (station fof2) and CONF-RT (station confidence faded out with
+    distance, i.e. coverage) maps at little more than the cost of MUF-RT
   - build a semi-transparent heatmap layer
   - draw KC2G-like station markers (colored filled dots + MUF number; fades with confidence)
-  - composite overlay onto Day and/or Night Countries base maps
-  - write BMPv4 RGB565 top-down + zlib-compressed .bmp.z
-
-Dependencies: python3, pillow
-Optional: numpy (strongly recommended for speed)
+  - composite overlay onto Day and/or Night Countries base maps, for every
+    requested size from one fetch (--sizes, default OHB_SIZES / map_sizes.txt)
+  - decoded base maps are kept memory-mappable in --base-cache, keyed by
+    source file and mtime, so compositing does not decompress them again
+  - write BMPv4 RGB565 top-down + zlib-compressed .bmp.z (--compressed-only:
+    just the .bmp.z, left untouched when its pixels have not changed)
+
+Dependencies: python3, pillow, numpy
+Shared modules: lib_bmp.py, lib_cpt.py, lib_idw.py, lib_sizes.py, lib_zlib.py
+Optional: scipy (KD-tree station index; required for --source contours/blend)
 """
 
 import argparse
 import datetime as dt
+import hashlib
 import json
 import os
-import struct
+import re
 import sys
 import time
-import zlib
-from collections import deque
-from io import BytesIO
+from multiprocessing import Pool, cpu_count, resource_tracker, shared_memory
 from urllib.request import Request, urlopen
 
-try:
-    import numpy as np
-except ImportError:
-    np = None
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
 
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from lib_bmp import (DECODED_CACHE_DIR, BmpBandReader, BmpStreamWriter, decoded_map, read_bmp565,
+                     rgb888_to_rgb565, write_bmp)
+from lib_cpt import get_palette
+from lib_idw import (IdwOperator, SphereIndex, cached_operator, coarse_axes, coverage_floor,
+                     deviation_stats, grid_axes, idw_grid, idw_grid_fields, resample_lonlat,
+                     resample_mask, station_fingerprint)
+from lib_sizes import load_sizes, parse_sizes
 
 
 KC2G_STATIONS_JSON = "https://prop.kc2g.com/api/stations.json"
+KC2G_MUFD_GEOJSON = "https://prop.kc2g.com/renders/current/mufd-normal-now.geojson"
+
+# Grid spacing (deg) and blur of the contour field when --grid-deg is not given
+CONTOUR_GRID_DEG = 0.5
+CONTOUR_SMOOTH_DEG = 0.75
+
+# --source contours stretches the contour field onto the 5th-95th percentile
+# of station MUFd (stations with confidence >= 0.1), kept within 5..35 MHz,
+# as kc2g_muf_heatmap.sh did
+CONTOUR_STRETCH_PCT = (5.0, 95.0)
+CONTOUR_STRETCH_MIN_CONF = 0.1
+CONTOUR_MUF_RANGE = (5.0, 35.0)
+
+# Incremental re-render granularity (pixels)
+TILE = 128
+
+# Whole-map working set per pixel: heat + overlay RGBA, base RGB/RGBA,
+# composite RGBA/RGB, RGB565 + its bytes (--max-memory estimate)
+MAP_BYTES_PER_PX = 26
+
+# --extra-products: maps the MUF-RT interpolation pass can also emit
+# (product name, palette, value range); confidence is the coverage surface
+EXTRA_PRODUCTS = {
+    "fof2": ("FOF2-RT", "fof2-rt", 0.0, 15.0),
+    "confidence": ("CONF-RT", "confidence", 0.0, 100.0),
+}
 
 
 def http_get(url: str, timeout: int = 20) -> bytes:
@@ -68,193 +122,65 @@ def lonlat_to_xy(lon_deg: float, lat_deg: float, w: int, h: int) -> tuple[int, i
     return x, y
 
 
-def haversine_rad(lon1, lat1, lon2, lat2):
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
-    c = 2.0 * np.arcsin(np.minimum(1.0, np.sqrt(a)))
-    return c
+def confidence_unit(conf: float) -> float:
+    """Station confidence as 0..1 (KC2G rows may carry 0..1 or 0..100)."""
+    c = conf / 100.0 if conf > 1.0 else conf
+    return max(0.0, min(1.0, c))
 
 
-def muf_colormap(mhz: float) -> tuple[int, int, int]:
-    """
-    Approximate HamClock-like palette: low=blue, mid=green/yellow, high=red/purple.
-    """
-    stops = [
-        (0.0,  (0, 0, 80)),
-        (5.0,  (0, 40, 180)),
-        (8.0,  (0, 140, 255)),
-        (10.0, (0, 220, 120)),
-        (14.0, (220, 220, 0)),
-        (18.0, (255, 140, 0)),
-        (22.0, (255, 60, 0)),
-        (28.0, (200, 0, 120)),
-        (35.0, (120, 0, 160)),
-    ]
-    if mhz <= stops[0][0]:
-        return stops[0][1]
-    if mhz >= stops[-1][0]:
-        return stops[-1][1]
-    for i in range(len(stops) - 1):
-        x0, c0 = stops[i]
-        x1, c1 = stops[i + 1]
-        if x0 <= mhz <= x1:
-            t = (mhz - x0) / (x1 - x0) if x1 > x0 else 0.0
-            r = int(round(c0[0] + t * (c1[0] - c0[0])))
-            g = int(round(c0[1] + t * (c1[1] - c0[1])))
-            b = int(round(c0[2] + t * (c1[2] - c0[2])))
-            return (r, g, b)
-    return stops[-1][1]
-
-
-def load_base_map(path: str) -> Image.Image:
-    if path.endswith(".bmp.z"):
-        raw = open(path, "rb").read()
-        bmp = zlib.decompress(raw)
-        return Image.open(BytesIO(bmp)).convert("RGB")
-    return Image.open(path).convert("RGB")
-
-
-def _rgb888_to_rgb565_le_bytes(img_rgb: Image.Image) -> bytes:
-    if img_rgb.mode != "RGB":
-        img_rgb = img_rgb.convert("RGB")
-    w, h = img_rgb.size
-    data = img_rgb.tobytes()
-    row_bytes = w * 2
-    pad = (4 - (row_bytes % 4)) % 4
-    out = bytearray((row_bytes + pad) * h)
-
-    oi = 0
-    di = 0
-    for _y in range(h):
-        for _x in range(w):
-            r = data[di]
-            g = data[di + 1]
-            b = data[di + 2]
-            di += 3
-            v = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
-            out[oi] = v & 0xFF
-            out[oi + 1] = (v >> 8) & 0xFF
-            oi += 2
-        if pad:
-            out[oi:oi + pad] = b"\x00" * pad
-            oi += pad
-    return bytes(out)
-
-
-def write_bmpv4_rgb565_topdown_and_z(img_rgb: Image.Image, out_bmp: str, out_bmp_z: str, zlevel: int = 9) -> None:
-    if img_rgb.mode != "RGB":
-        img_rgb = img_rgb.convert("RGB")
-
-    w, h = img_rgb.size
-    pixel_bytes = _rgb888_to_rgb565_le_bytes(img_rgb)
-    row_bytes = w * 2
-    pad = (4 - (row_bytes % 4)) % 4
-    image_size = (row_bytes + pad) * h
-
-    bfType = b"BM"
-    bfOffBits = 14 + 108
-    bfSize = bfOffBits + image_size
-
-    file_header = struct.pack("<2sIHHI", bfType, bfSize, 0, 0, bfOffBits)
-
-    # BITMAPV4HEADER (108 bytes)
-    bV4Size = 108
-    bV4Width = w
-    bV4Height = -h           # top-down
-    bV4Planes = 1
-    bV4BitCount = 16
-    BI_BITFIELDS = 3
-    bV4Compression = BI_BITFIELDS
-    bV4SizeImage = image_size
-
-    bV4RedMask = 0xF800
-    bV4GreenMask = 0x07E0
-    bV4BlueMask = 0x001F
-    bV4AlphaMask = 0x0000
-
-    bV4CSType = 0x73524742    # 'sRGB'
-    endpoints = b"\x00" * 36
-    gamma0 = gamma1 = gamma2 = 0
-
-    v4_header = struct.pack(
-        "<IiiHHIIiiII"
-        "IIII"
-        "I"
-        "36s"
-        "III",
-        bV4Size,
-        bV4Width,
-        bV4Height,
-        bV4Planes,
-        bV4BitCount,
-        bV4Compression,
-        bV4SizeImage,
-        0, 0,           # XPelsPerMeter, YPelsPerMeter
-        0, 0,           # ClrUsed, ClrImportant
-        bV4RedMask,
-        bV4GreenMask,
-        bV4BlueMask,
-        bV4AlphaMask,
-        bV4CSType,
-        endpoints,
-        gamma0, gamma1, gamma2
-    )
-
-    bmp_bytes = file_header + v4_header + pixel_bytes
-
-    with open(out_bmp, "wb") as f:
-        f.write(bmp_bytes)
-
-    comp = zlib.compress(bmp_bytes, level=zlevel)
-    with open(out_bmp_z, "wb") as f:
-        f.write(comp)
-
+def load_base_map(path: str, cache_dir: str = None) -> Image.Image:
+    """Decoded base map, from the memory-mapped decoded-map cache when enabled."""
+    return Image.fromarray(np.asarray(decoded_map(path, cache_dir=cache_dir)), "RGB")
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--width", type=int, required=True)
-    ap.add_argument("--height", type=int, required=True)
 
-    # Day/night bases:
-    ap.add_argument("--base-day", help="Countries Day base (.bmp|.bmp.z|.png)")
-    ap.add_argument("--base-night", help="Countries Night base (.bmp|.bmp.z|.png)")
+def write_bmpv4_rgb565_topdown_and_z(img_rgb: Image.Image, out_bmp: str, out_bmp_z: str, zlevel: int = 9,
+                                     skip_unchanged: bool = False, zworkers: int = 1) -> bool:
+    """Publish .bmp (unless out_bmp is None) + .bmp.z atomically; False if skipped as unchanged."""
+    return write_bmp(img_rgb, out_bmp, out_bmp_z, zlevel=zlevel, skip_unchanged=skip_unchanged,
+                     zworkers=zworkers)
 
-    ap.add_argument("--outdir", required=True)
-    ap.add_argument("--product", default="MUF-RT")
 
-    ap.add_argument("--alpha", type=float, default=0.55, help="heatmap opacity 0..1")
-    ap.add_argument("--active-seconds", type=int, default=3600)
-    ap.add_argument("--min-confidence", type=float, default=0.0)
-    ap.add_argument("--k", type=int, default=24)
-    ap.add_argument("--p", type=float, default=2.0)
-    ap.add_argument("--muf-min", type=float, default=0.0)
-    ap.add_argument("--muf-max", type=float, default=35.0)
-    ap.add_argument("--stations-url", default=KC2G_STATIONS_JSON)
-    ap.add_argument("--debug-png", action="store_true")
-    args = ap.parse_args()
+def publish_targets(args, out_bmp: str) -> tuple:
+    """
+    (out_bmp or None, out_bmp_z, skip_unchanged) for one map. In
+    --compressed-only mode a stale uncompressed copy is removed.
+    """
+    if not args.compressed_only:
+        return out_bmp, out_bmp + ".z", False
+    if os.path.exists(out_bmp):
+        os.unlink(out_bmp)
+    return None, out_bmp + ".z", True
 
-    if np is None:
-        print("ERROR: numpy is required for reasonable performance. Try: apt install python3-numpy", file=sys.stderr)
-        return 2
 
-    w, h = args.width, args.height
-    os.makedirs(args.outdir, exist_ok=True)
+def output_stamps(outs: list) -> dict:
+    """Published .bmp.z stamps; incremental mode splices into these."""
+    return {p: file_stamp(p + ".z") for p in outs}
 
-    if not args.base_day and not args.base_night:
-        print("ERROR: Provide at least one of --base-day or --base-night", file=sys.stderr)
-        return 2
 
-    # Fetch stations
-    stations = json.loads(http_get(args.stations_url).decode("utf-8", errors="replace"))
+def fetch_station_points(url: str, active_seconds: int, min_confidence: float, calib: list = None) -> list:
+    """
+    Fetch stations.json once; return [(lon, lat, mufd, conf, code, fof2), ...]
+    for active stations (fof2 is NaN when the row has none). calib, if
+    given, receives the MUFd of every station (active or not) used by
+    contour_stretch().
+    """
+    stations = json.loads(http_get(url).decode("utf-8", errors="replace"))
     now = time.time()
 
     pts = []
     for row in stations:
+        if calib is not None:
+            try:
+                mufd = row.get("mufd") or row.get("muf")
+                if mufd is not None and float(row.get("confidence", 1.0) or 1.0) >= CONTOUR_STRETCH_MIN_CONF:
+                    calib.append(float(mufd))
+            except (TypeError, ValueError):
+                pass
         st = row.get("station") or {}
         lon = st.get("longitude")
         lat = st.get("latitude")
         mufd = row.get("mufd") or row.get("mufD") or row.get("muf")
+        fof2 = row.get("fof2") or row.get("foF2")
         conf = row.get("confidence", 1.0)
         t = parse_kc2g_time(row.get("time"))
 
@@ -267,6 +193,10 @@ def main():
             conf = float(conf) if conf is not None else 1.0
         except Exception:
             continue
+        try:
+            fof2 = float(fof2) if fof2 is not None else float("nan")
+        except (TypeError, ValueError):
+            fof2 = float("nan")
 
         # Option A: Normalize longitude to [-180, 180]
         if lon > 180.0:
@@ -274,89 +204,118 @@ def main():
         elif lon < -180.0:
             lon += 360.0
 
-        if (now - t) > args.active_seconds:
+        if (now - t) > active_seconds:
             continue
-        if conf < args.min_confidence:
+        if conf < min_confidence:
             continue
 
         code = (st.get("code") or "").strip()
-        pts.append((lon, lat, mufd, conf, code))
-
-    if len(pts) < 4:
-        print(f"ERROR: only {len(pts)} active stations found; refusing to render.", file=sys.stderr)
-        return 2
-
-    # Prepare arrays for interpolation
-    lons = np.array([p[0] for p in pts], dtype=np.float64)
-    lats = np.array([p[1] for p in pts], dtype=np.float64)
-    vals = np.array([p[2] for p in pts], dtype=np.float64)
-    confs = np.array([p[3] for p in pts], dtype=np.float64)
+        pts.append((lon, lat, mufd, conf, code, fof2))
+    return pts
 
-    lons_r = np.deg2rad(lons)
-    lats_r = np.deg2rad(lats)
 
-    xs = np.linspace(-180.0, 180.0, w, dtype=np.float64)
-    ys = np.linspace(90.0, -90.0, h, dtype=np.float64)
-    grid_lon, grid_lat = np.meshgrid(xs, ys)
-    grid_lon_r = np.deg2rad(grid_lon)
-    grid_lat_r = np.deg2rad(grid_lat)
-
-    k = max(4, min(args.k, len(pts)))
-    pwr = float(args.p)
-    eps = 1e-6
+def fetch_contour_points(url: str) -> np.ndarray:
+    """Fetch KC2G's MUF contour geojson once; (n, 3) lon, lat, MHz of every contour vertex."""
+    gj = json.loads(http_get(url).decode("utf-8", errors="replace"))
+    pts = []
+    for feat in gj.get("features") or []:
+        try:
+            value = float(feat["properties"]["level-value"])
+            geom = feat["geometry"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        coords = geom.get("coordinates") or []
+        lines = [coords] if geom.get("type") == "LineString" else coords
+        for line in lines:
+            for vertex in line:
+                pts.append((float(vertex[0]), float(vertex[1]), value))
+    return np.array(pts, dtype=np.float64).reshape(-1, 3)
 
-    out_muf = np.empty((h, w), dtype=np.float32)
-    chunk_rows = 40
 
-    for y0 in range(0, h, chunk_rows):
-        y1 = min(h, y0 + chunk_rows)
-        glon = grid_lon_r[y0:y1, :, None]
-        glat = grid_lat_r[y0:y1, :, None]
+def contour_field(cpts, lon_axis, lat_axis, smooth_deg: float = CONTOUR_SMOOTH_DEG) -> np.ndarray:
+    """
+    Contour vertices on a coarse_axes() grid: linear (Delaunay)
+    interpolation, nearest vertex outside the hull, then a gaussian blur of
+    smooth_deg. Vertices near the antimeridian are repeated across it and
+    the blur wraps in longitude, so the field has no seam.
+    """
+    from scipy.interpolate import griddata
+    from scipy.ndimage import gaussian_filter
+
+    near = np.abs(cpts[:, 0]) > 150.0
+    wrapped = cpts[near].copy()
+    wrapped[:, 0] -= 360.0 * np.sign(wrapped[:, 0])
+    pts = np.vstack([cpts, wrapped])
+    glon, glat = np.meshgrid(lon_axis, lat_axis)
+    grid = griddata(pts[:, :2], pts[:, 2], (glon, glat), method="linear")
+    holes = np.isnan(grid)
+    if holes.any():
+        grid[holes] = griddata(pts[:, :2], pts[:, 2], (glon[holes], glat[holes]), method="nearest")
+    step = abs(float(lat_axis[1] - lat_axis[0]))
+    grid = gaussian_filter(grid, sigma=smooth_deg / step, mode=("nearest", "wrap"))
+    return grid.astype(np.float32)
+
+
+def contour_stretch(grid, station_mufd) -> np.ndarray:
+    """
+    Linear stretch of a contour field onto the CONTOUR_STRETCH_PCT range of
+    station MUFd (bounded by CONTOUR_MUF_RANGE), then clipped to that range.
+    Without station values the field is only clipped.
+    """
+    lo, hi = CONTOUR_MUF_RANGE
+    sta = np.asarray(station_mufd, dtype=np.float64)
+    g_min, g_max = float(grid.min()), float(grid.max())
+    if len(sta) and g_max > g_min:
+        sta_lo = max(lo, float(np.percentile(sta, CONTOUR_STRETCH_PCT[0])))
+        sta_hi = min(hi, float(np.percentile(sta, CONTOUR_STRETCH_PCT[1])))
+        print(f"Contours: stretched onto station {CONTOUR_STRETCH_PCT[0]:g}-{CONTOUR_STRETCH_PCT[1]:g}pct "
+              f"{sta_lo:.1f} - {sta_hi:.1f} MHz")
+        grid = sta_lo + (grid - g_min) / (g_max - g_min) * (sta_hi - sta_lo)
+    return np.clip(grid, lo, hi).astype(np.float32)
 
-        d = haversine_rad(glon, glat, lons_r[None, None, :], lats_r[None, None, :])
-        idx = np.argpartition(d, kth=k - 1, axis=2)[:, :, :k]
-        d_k = np.take_along_axis(d, idx, axis=2)
 
-        w_k = 1.0 / (np.power(d_k + eps, pwr))
-        w_k = w_k * confs[idx]
+def marker_radius(w: int, h: int) -> int:
+    # Dot radius: slightly smaller than the earlier outline circle
+    return max(3, int(round(min(w, h) / 140)))
 
-        v_k = vals[idx]
-        muf = np.sum(w_k * v_k, axis=2) / (np.sum(w_k, axis=2) + eps)
-        muf = np.clip(muf, args.muf_min, args.muf_max)
-        out_muf[y0:y1, :] = muf.astype(np.float32)
 
-    # Build overlay RGBA: heatmap + station marks (no base yet)
-    overlay = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-    px = overlay.load()
-    a = int(round(max(0.0, min(1.0, args.alpha)) * 255))
+def marker_reach(w: int, h: int) -> int:
+    """Pixels around a station that its dot and label can touch."""
+    return marker_radius(w, h) + 16
 
-    for y in range(h):
-        row = out_muf[y, :]
-        for x in range(w):
-            r, g, b = muf_colormap(float(row[x]))
-            px[x, y] = (r, g, b, a)
 
+def draw_station_markers(overlay: Image.Image, pts: list, size: tuple = None, origin: tuple = (0, 0),
+                         palette: str = "muf-rt") -> None:
+    """
+    KC2G-like markers for [(lon, lat, value, conf, code), ...] (colored filled
+    dots + value; alpha fades with confidence). overlay may be a window of a
+    size=(w, h) map whose top-left corner is origin.
+    """
+    ow, oh = overlay.size
+    w, h = size or (ow, oh)
+    ox, oy = origin
+    reach = marker_reach(w, h)
     draw = ImageDraw.Draw(overlay)
     try:
         font = ImageFont.load_default()
     except Exception:
         font = None
 
-    # KC2G-like markers (colored filled dots + MUF number; alpha fades with confidence)
+    pal = get_palette(palette)
     for lon, lat, mufd, conf, code in pts:
         x, y = lonlat_to_xy(lon, lat, w, h)
+        if x + reach < ox or x - reach >= ox + ow or y + reach < oy or y - reach >= oy + oh:
+            continue
+        x -= ox
+        y -= oy
 
-        # Dot radius: slightly smaller than the earlier outline circle
-        rad = max(3, int(round(min(w, h) / 140)))
+        rad = marker_radius(w, h)
 
-        # Color keyed to MUF value
-        fill_r, fill_g, fill_b = muf_colormap(float(mufd))
+        # Color keyed to the station value
+        fill_r, fill_g, fill_b = pal.rgb(float(mufd))
 
-        # Confidence -> alpha. If confidence is 0..100, scale to 0..1.
-        c = conf
-        if c > 1.0:
-            c = c / 100.0
-        c = max(0.0, min(1.0, c))
+        # Confidence -> alpha
+        c = confidence_unit(conf)
         alpha = int(round(80 + c * 175))  # keep visible even if low confidence
 
         fill = (fill_r, fill_g, fill_b, alpha)
@@ -384,31 +343,634 @@ def main():
         draw.text((tx + 1, ty + 1), label, fill=(0, 0, 0, 255), font=font)
         draw.text((tx, ty), label, fill=(255, 255, 255, 255), font=font)
 
-    def render_variant(prefix: str, base_path: str):
-        base = load_base_map(base_path)
-        if base.size != (w, h):
-            base = base.resize((w, h), resample=Image.BILINEAR)
 
-        comp = Image.alpha_composite(base.convert("RGBA"), overlay).convert("RGB")
+def heatmap_rgba(field, alpha: int, palette: str = "muf-rt") -> np.ndarray:
+    return get_palette(palette).colorize(field, alpha=alpha)
+
+
+def render_overlay(heat, pts: list, size: tuple, origin: tuple = (0, 0), palette: str = "muf-rt") -> Image.Image:
+    """Heatmap RGBA + station marks (no base yet) for a map, or a window of one."""
+    overlay = Image.fromarray(heat, "RGBA")
+    draw_station_markers(overlay, pts, size=size, origin=origin, palette=palette)
+    return overlay
+
+
+def product_marks(pts: list, key: str) -> list:
+    """Marker tuples (lon, lat, value, conf, code) of one product's station field."""
+    if key == "mufd":
+        return [p[:5] for p in pts]
+    if key == "fof2":
+        return [(p[0], p[1], p[5], p[3], p[4]) for p in pts if p[5] == p[5]]
+    return [(p[0], p[1], 100.0 * confidence_unit(p[3]), p[3], p[4]) for p in pts]
+
+
+# Per-process state of --workers pool members (see _worker_init)
+_W = {}
+
+
+def _worker_init(lons, lats, fields, confs, coverage, coarse, k, p, specs, resample, alpha, idw_bytes):
+    _W.update(index=SphereIndex(lons, lats) if coarse is None else None,
+              fields=fields, confs=confs, coverage=coverage, coarse=coarse, k=k, p=p, specs=specs,
+              resample=resample, alpha=alpha, idw_bytes=idw_bytes, shm=None)
+
+
+def _worker_rows(task):
+    """Interpolate + colorize map rows y0..y1 of every product into row row0.. of the shared array."""
+    shm_name, shape, w, h, y0, y1, row0 = task
+    if _W["shm"] is None or _W["shm"].name != shm_name:
+        if _W["shm"] is not None:
+            _W["shm"].close()
+        _W["shm"] = shared_memory.SharedMemory(name=shm_name)
+        # The parent owns (and unlinks) the segment; keep this process's
+        # resource tracker from unlinking it again at exit
+        resource_tracker.unregister(_W["shm"]._name, "shared_memory")
+    out = np.ndarray(shape, dtype=np.uint8, buffer=_W["shm"].buf)
+    if _W["coarse"] is not None:
+        fields = [resample_lonlat(grid, w, h, _W["resample"], vmin=vmin, vmax=vmax, window=(0, w, y0, y1))
+                  for grid, (_, vmin, vmax) in zip(_W["coarse"], _W["specs"])]
+    else:
+        xs, ys = grid_axes(w, h)
+        fields = idw_grid_fields(_W["index"], _W["fields"], _W["confs"], xs, ys[y0:y1], _W["k"], _W["p"],
+                                 coverage=_W["coverage"], max_bytes=_W["idw_bytes"])
+    for j, (field, (palette, _, _)) in enumerate(zip(fields, _W["specs"])):
+        out[j, row0:row0 + (y1 - y0)] = heatmap_rgba(field, _W["alpha"], palette)
+    del out
+    return y1 - y0
+
+
+def parallel_heat_rows(pool: Pool, workers: int, nprod: int, w: int, h: int, y0: int, y1: int) -> list:
+    """Heatmap RGBA of each product for map rows y0..y1, computed in row chunks across the pool."""
+    shape = (nprod, y1 - y0, w, 4)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    heats = None
+    try:
+        step = max(8, -(-(y1 - y0) // (workers * 4)))
+        tasks = [(shm.name, shape, w, h, r, min(r + step, y1), r - y0) for r in range(y0, y1, step)]
+        pool.map(_worker_rows, tasks, chunksize=1)
+        heats = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        return [heats[j].copy() for j in range(nprod)]
+    finally:
+        # The view has to go before the segment can close; unlink even if close fails
+        heats = None
+        try:
+            shm.close()
+        finally:
+            shm.unlink()
 
-        size_tag = f"{w}x{h}"
-        out_bmp = os.path.join(args.outdir, f"{prefix}-{size_tag}-{args.product}.bmp")
-        out_bmp_z = out_bmp + ".z"
-        write_bmpv4_rgb565_topdown_and_z(comp, out_bmp, out_bmp_z, zlevel=9)
 
-        if args.debug_png:
-            comp.save(os.path.join(args.outdir, f"{prefix}-{size_tag}-{args.product}.png"), format="PNG")
+def dirty_regions(mask, tile: int = TILE) -> list:
+    """
+    (x0, x1, y0, y1) windows covering every tile that holds a True pixel;
+    neighbouring dirty tiles in a tile row are merged into one window.
+    """
+    h, w = mask.shape
+    th, tw = -(-h // tile), -(-w // tile)
+    pad = np.zeros((th * tile, tw * tile), dtype=bool)
+    pad[:h, :w] = mask
+    tiles = pad.reshape(th, tile, tw, tile).any(axis=(1, 3))
+    regions = []
+    for ty in range(th):
+        row = np.concatenate(([False], tiles[ty], [False])).astype(np.int8)
+        edges = np.flatnonzero(np.diff(row))
+        for t0, t1 in zip(edges[::2], edges[1::2]):
+            regions.append((t0 * tile, min(t1 * tile, w), ty * tile, min((ty + 1) * tile, h)))
+    return regions
+
+
+def file_stamp(path: str) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    return f"{st.st_size}:{st.st_mtime_ns}"
 
-        print(f"OK: {out_bmp_z} (stations used: {len(pts)})")
 
-    if args.base_day:
-        render_variant("map-D", args.base_day)
-    if args.base_night:
-        render_variant("map-N", args.base_night)
+def load_state(path: str):
+    try:
+        with np.load(path) as z:
+            return {k: z[k] for k in z.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_state(path: str, params: str, fingerprint: str, vals, confs, outputs: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        np.savez(f, params=np.array(params), fingerprint=np.array(fingerprint),
+                 vals=vals, confs=confs, outputs=np.array(json.dumps(outputs, sort_keys=True)))
+    os.replace(tmp, path)
+
+
+def resolve_bases(args, w: int, h: int) -> list:
+    """[(prefix, base_path), ...] for one size; explicit --base-* win over --mapdir."""
+    bases = []
+    for prefix, dn, explicit in (("map-D", "D", args.base_day), ("map-N", "N", args.base_night)):
+        path = explicit
+        if not path and args.mapdir:
+            path = os.path.join(args.mapdir, f"map-{dn}-{w}x{h}-Countries.bmp.z")
+        if not path:
+            continue
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            print(f"WARN: missing base {path}; skipping {prefix} {w}x{h}", file=sys.stderr)
+            continue
+        bases.append((prefix, path))
+    return bases
+
+
+def load_sized_base(path: str, w: int, h: int, cache_dir: str = None) -> Image.Image:
+    base = load_base_map(path, cache_dir)
+    if base.size != (w, h):
+        base = base.resize((w, h), resample=Image.BILINEAR)
+    return base
+
+
+def base_bands(path: str, w: int, h: int, band_rows: int, cache_dir: str = None):
+    """(y0, (n, w, 3) uint8) bands of a base map; streamed when it is a w x h BMP."""
+    if DECODED_CACHE_DIR if cache_dir is None else cache_dir:
+        rgb = decoded_map(path, cache_dir=cache_dir)
+        if rgb.shape[:2] == (h, w):
+            for y0 in range(0, h, band_rows):
+                yield y0, np.asarray(rgb[y0:y0 + band_rows])
+            return
+    elif path.endswith(".bmp") or path.endswith(".bmp.z"):
+        try:
+            reader = BmpBandReader(path)
+        except ValueError:
+            reader = None
+        if reader is not None and (reader.width, reader.height) == (w, h):
+            yield from reader.bands_rgb(band_rows)
+            return
+    rgb = np.asarray(load_sized_base(path, w, h, cache_dir))
+    for y0 in range(0, h, band_rows):
+        yield y0, rgb[y0:y0 + band_rows]
+
+
+def render_streaming(args, w: int, h: int, band_rows: int, heat_rows, bases: list, products: list,
+                     outs: list) -> None:
+    """
+    Render one size band by band: heat_rows(y0, y1) gives each product's
+    heatmap RGBA rows, each base is read once per band and every
+    product/base output (outs[product][base]) is written as a stream.
+    """
+    readers = [base_bands(path, w, h, band_rows, args.base_cache) for _, path in bases]
+    writers = []
+    try:
+        for out_bmp in (o for prod_outs in outs for o in prod_outs):
+            bmp, bmp_z, skip = publish_targets(args, out_bmp)
+            writers.append(BmpStreamWriter(w, h, bmp, bmp_z, zlevel=9, skip_unchanged=skip,
+                                           zworkers=args.zlib_workers))
+        for y0 in range(0, h, band_rows):
+            y1 = min(h, y0 + band_rows)
+            base_rows = []
+            for reader in readers:
+                by0, band = next(reader)
+                if by0 != y0 or band.shape[0] != y1 - y0:
+                    raise ValueError(f"base band {by0}+{band.shape[0]} does not match rows {y0}-{y1}")
+                base_rows.append(Image.fromarray(band, "RGB").convert("RGBA"))
+            for j, ((_, palette, _, _, marks), heat) in enumerate(zip(products, heat_rows(y0, y1))):
+                overlay = render_overlay(heat, marks, (w, h), origin=(0, y0), palette=palette)
+                for b, base in enumerate(base_rows):
+                    writers[j * len(bases) + b].write(Image.alpha_composite(base, overlay).convert("RGB"))
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    for j, (_, _, _, _, marks) in enumerate(products):
+        for b, out_bmp in enumerate(outs[j]):
+            writer = writers[j * len(bases) + b]
+            writer.close()
+            print(f"{'OK' if writer.changed else 'UNCHANGED'}: {out_bmp}.z "
+                  f"(stations used: {len(marks)}, {band_rows}-row bands)")
+
+
+def stations_changed(old_vals, old_confs, vals, confs) -> np.ndarray:
+    """Per station: any field value (NaN = no value) or the confidence differs from the state."""
+    same = (old_vals == vals) | (np.isnan(old_vals) & np.isnan(vals))
+    return ~same.all(axis=0) | (old_confs != confs)
+
+
+def render_incremental(args, w: int, h: int, op, coarse, window_fields, bases: list, products: list,
+                       outs: list, pts: list, vals, confs, alpha: int, state, params: str,
+                       fingerprint: str, markers_only: bool = False) -> bool:
+    """
+    Splice the tiles touched by changed stations into the published maps of
+    every product (outs[product][base]); window_fields(window) evaluates
+    all product fields for a block. vals is the (fields, stations) array
+    kept in the state. markers_only: no field depends on the stations (no
+    op), so only their markers are redrawn. Returns False (after saying
+    why) when a full render is needed instead.
+    """
+    size_tag = f"{w}x{h}"
+    flat_outs = [o for prod_outs in outs for o in prod_outs]
+    stamps = output_stamps(flat_outs)
+    reason = None
+    if state is None:
+        reason = "no previous state"
+    elif str(state["params"]) != params:
+        reason = "parameters or base maps changed"
+    elif str(state["fingerprint"]) != fingerprint:
+        reason = "station set changed"
+    elif op is None and not markers_only:
+        reason = "no cached IDW operator for this grid"
+    elif json.loads(str(state["outputs"])) != stamps or not all(stamps.values()):
+        reason = "published maps missing or modified"
+    if reason:
+        print(f"INCREMENTAL: {size_tag} full render ({reason})")
+        return False
+
+    changed = stations_changed(state["vals"], state["confs"], vals, confs)
+    if not changed.any():
+        print(f"INCREMENTAL: {size_tag} unchanged")
+        return True
+
+    # Pixels whose field or markers can differ from the published maps
+    if op is None:
+        mask = np.zeros((h, w), dtype=bool)
+    elif coarse is None:
+        mask = op.touches(changed)
+    else:
+        mask = resample_mask(op.touches(changed), w, h, args.resample)
+    reach = marker_reach(w, h)
+    for i in np.flatnonzero(changed):
+        x, y = lonlat_to_xy(pts[i][0], pts[i][1], w, h)
+        mask[max(0, y - reach):y + reach + 1, max(0, x - reach):x + reach + 1] = True
+
+    regions = dirty_regions(mask)
+    overlays = [[] for _ in products]
+    for x0, x1, y0, y1 in regions:
+        fields = window_fields((x0, x1, y0, y1))
+        for j, ((_, palette, _, _, marks), field) in enumerate(zip(products, fields)):
+            overlays[j].append(render_overlay(heatmap_rgba(field, alpha, palette), marks, (w, h),
+                                              origin=(x0, y0), palette=palette))
+
+    ntiles = (-(-w // TILE)) * (-(-h // TILE))
+    ndirty = sum(-(-(x1 - x0) // TILE) for x0, x1, _, _ in regions)
+    for b, (prefix, base_path) in enumerate(bases):
+        base = load_sized_base(base_path, w, h, args.base_cache)
+        for j in range(len(products)):
+            out_bmp = outs[j][b]
+            px = read_bmp565(out_bmp + ".z")
+            if px.shape != (h, w):
+                print(f"INCREMENTAL: {size_tag} full render ({out_bmp} is {px.shape[1]}x{px.shape[0]})")
+                return False
+            png = os.path.join(args.outdir, os.path.basename(out_bmp)[:-4] + ".png")
+            dbg = Image.open(png).convert("RGB") if args.debug_png and os.path.exists(png) else None
+            for (x0, x1, y0, y1), overlay in zip(regions, overlays[j]):
+                tile = Image.alpha_composite(base.crop((x0, y0, x1, y1)).convert("RGBA"), overlay).convert("RGB")
+                px[y0:y1, x0:x1] = rgb888_to_rgb565(np.asarray(tile))
+                if dbg is not None:
+                    dbg.paste(tile, (x0, y0))
+            # Compression is whole-file: zlib output cannot be patched in place
+            bmp, bmp_z, skip = publish_targets(args, out_bmp)
+            changed_px = write_bmp(px, bmp, bmp_z, zlevel=9, skip_unchanged=skip, zworkers=args.zlib_workers)
+            if dbg is not None:
+                dbg.save(png, format="PNG")
+            print(f"{'OK' if changed_px else 'UNCHANGED'}: {out_bmp}.z (incremental: {ndirty}/{ntiles} tiles, "
+                  f"stations changed: {int(changed.sum())}/{len(pts)})")
+
+    save_state(os.path.join(args.state_dir, f"{args.product}-{size_tag}.npz"), params, fingerprint,
+               vals, confs, output_stamps(flat_outs))
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--width", type=int, help="single size (with --height)")
+    ap.add_argument("--height", type=int)
+    ap.add_argument("--sizes", help="WxH list, e.g. 660x330,1320x660 (default: OHB_SIZES / map_sizes.txt)")
+
+    # Day/night bases:
+    ap.add_argument("--base-day", help="Countries Day base (.bmp|.bmp.z|.png), single size only")
+    ap.add_argument("--base-night", help="Countries Night base (.bmp|.bmp.z|.png), single size only")
+    ap.add_argument("--mapdir", help="directory holding map-{D,N}-<size>-Countries.bmp.z")
 
+    ap.add_argument("--base-cache",
+                    help="directory of memory-mapped decoded base maps (default: lib_bmp DECODED_CACHE_DIR, '' = off)")
+    ap.add_argument("--outdir", required=True)
+    ap.add_argument("--zlib-workers", type=int, default=1,
+                    help="threads deflating each .bmp.z as one zlib stream (0 = all cores)")
+    ap.add_argument("--compressed-only", action="store_true",
+                    help="publish only .bmp.z (atomic rename), untouched when the pixels are unchanged")
+    ap.add_argument("--product", default="MUF-RT")
+    ap.add_argument("--source", choices=("stations", "contours", "blend"), default="stations",
+                    help="MUF field from station IDW, KC2G model contours, or stations blended into contours "
+                         "by station coverage (contours/blend use a --grid-deg grid, default "
+                         f"{CONTOUR_GRID_DEG:g})")
+    ap.add_argument("--contours-url", default=KC2G_MUFD_GEOJSON)
+    ap.add_argument("--palette", default="muf-rt", help="MUF-RT palette (lib_cpt name or .cpt path)")
+    ap.add_argument("--extra-products", default="",
+                    help="comma list of maps to emit from the same interpolation pass: "
+                         "fof2 (FOF2-RT), confidence (CONF-RT station coverage)")
+    ap.add_argument("--coverage-deg", type=float, default=10.0,
+                    help="CONF-RT: distance (deg) from a lone station at which coverage has halved")
+
+    ap.add_argument("--alpha", type=float, default=0.55, help="heatmap opacity 0..1")
+    ap.add_argument("--active-seconds", type=int, default=3600)
+    ap.add_argument("--min-confidence", type=float, default=0.0)
+    ap.add_argument("--k", type=int, default=24)
+    ap.add_argument("--p", type=float, default=2.0)
+    ap.add_argument("--muf-min", type=float, default=0.0)
+    ap.add_argument("--muf-max", type=float, default=35.0)
+    ap.add_argument("--grid-deg", type=float, default=0.0,
+                    help="interpolate once on a lat/lon grid of this spacing and resample to every size (0 = exact per pixel)")
+    ap.add_argument("--resample", choices=("bilinear", "bicubic"), default="bilinear")
+    ap.add_argument("--grid-check", action="store_true",
+                    help="also compute the exact per-pixel field and report the --grid-deg deviation per size")
+    ap.add_argument("--weights-cache", help="directory for reusable IDW neighbour/weight matrices")
+    ap.add_argument("--weights-cache-max-mb", type=int, default=256,
+                    help="only cache grids whose weight matrix fits this size")
+    ap.add_argument("--incremental", action="store_true",
+                    help="re-render only tiles affected by changed stations (needs --weights-cache, --state-dir)")
+    ap.add_argument("--state-dir", help="directory for per-size --incremental state")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="processes for interpolation + colorizing (0 = cores - 1)")
+    ap.add_argument("--band-rows", type=int, default=0,
+                    help="render in bands of this many rows to bound memory (0 = whole map)")
+    ap.add_argument("--max-memory", type=int, default=0,
+                    help="working-memory budget in MB: float32 IDW in budget-sized chunks, and "
+                         "sizes that would not fit whole are rendered in bands (0 = no limit)")
+    ap.add_argument("--stations-url", default=KC2G_STATIONS_JSON)
+    ap.add_argument("--debug-png", action="store_true")
+    args = ap.parse_args()
+
+    if (args.width is None) != (args.height is None):
+        print("ERROR: --width and --height go together", file=sys.stderr)
+        return 2
+    try:
+        if args.width is not None:
+            sizes = [(args.width, args.height)]
+        elif args.sizes:
+            sizes = parse_sizes(args.sizes)
+        else:
+            sizes = load_sizes()
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+
+    if len(sizes) > 1 and (args.base_day or args.base_night):
+        print("ERROR: --base-day/--base-night take one size; use --mapdir for a size list", file=sys.stderr)
+        return 2
+    if not args.base_day and not args.base_night and not args.mapdir:
+        print("ERROR: Provide --mapdir or at least one of --base-day or --base-night", file=sys.stderr)
+        return 2
+
+    if args.incremental and not (args.weights_cache and args.state_dir):
+        print("ERROR: --incremental needs --weights-cache and --state-dir", file=sys.stderr)
+        return 2
+
+    extras = [e for e in re.sub(r"\s+", "", args.extra_products).split(",") if e]
+    unknown = sorted(set(extras) - set(EXTRA_PRODUCTS))
+    if unknown:
+        print(f"ERROR: unknown --extra-products {','.join(unknown)} (choose from {','.join(EXTRA_PRODUCTS)})",
+              file=sys.stderr)
+        return 2
+
+    if args.band_rows < 0 or args.max_memory < 0:
+        print("ERROR: --band-rows and --max-memory must be >= 0", file=sys.stderr)
+        return 2
+    if args.band_rows and (args.grid_check or args.debug_png):
+        print("WARN: --grid-check/--debug-png need whole maps; ignored with --band-rows", file=sys.stderr)
+    if args.grid_check and args.source != "stations":
+        print(f"WARN: --grid-check compares station IDW only; ignored with --source {args.source}",
+              file=sys.stderr)
+        args.grid_check = False
+    try:
+        get_palette(args.palette)
+    except (KeyError, OSError, ValueError) as e:
+        print(f"ERROR: --palette: {e}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.outdir, exist_ok=True)
+
+    # One fetch: every size renders from the same station snapshot
+    calib = [] if args.source == "contours" else None
+    pts = fetch_station_points(args.stations_url, args.active_seconds, args.min_confidence, calib)
+
+    if len(pts) < 4:
+        if args.source != "contours":
+            print(f"ERROR: only {len(pts)} active stations found; refusing to render.", file=sys.stderr)
+            return 2
+        # The contours define the field alone; stations are just markers
+        print(f"WARN: only {len(pts)} active stations found; drawing them as markers only", file=sys.stderr)
+        if extras:
+            print(f"WARN: too few stations for --extra-products; skipping {','.join(extras)}", file=sys.stderr)
+            extras = []
+
+    cpts = None
+    if args.source != "stations":
+        cpts = fetch_contour_points(args.contours_url)
+        if len(cpts) < 3:
+            print(f"ERROR: only {len(cpts)} contour points in {args.contours_url}; refusing to render.",
+                  file=sys.stderr)
+            return 2
+        print(f"Contours: {len(cpts)} points, levels {sorted(set(cpts[:, 2].tolist()))}")
+
+    # Canonical station order so cached neighbour indices stay valid between runs
+    pts.sort(key=lambda p: (p[4], p[0], p[1]))
+
+    # Prepare arrays for interpolation
+    lons = np.array([p[0] for p in pts], dtype=np.float64)
+    lats = np.array([p[1] for p in pts], dtype=np.float64)
+    vals = np.array([p[2] for p in pts], dtype=np.float64)
+    confs = np.array([p[3] for p in pts], dtype=np.float64)
+    fof2s = np.array([p[5] for p in pts], dtype=np.float64)
+
+    # Products of the one interpolation pass, MUF-RT first and the coverage
+    # surface (not a station field) last: (name, palette, vmin, vmax, marks)
+    products = [(args.product, args.palette, args.muf_min, args.muf_max, product_marks(pts, "mufd"))]
+    fields = [(vals, args.muf_min, args.muf_max)]
+    for key, (name, palette, vmin, vmax) in EXTRA_PRODUCTS.items():
+        if key not in extras:
+            continue
+        if key == "fof2":
+            if np.isnan(fof2s).all():
+                print(f"WARN: no active station reports fof2; skipping {name}", file=sys.stderr)
+                continue
+            fields.append((fof2s, vmin, vmax))
+        products.append((name, palette, vmin, vmax, product_marks(pts, key)))
+    coverage = None
+    if "confidence" in extras:
+        levels = np.array([100.0 * confidence_unit(c) for c in confs])
+        coverage = (levels, coverage_floor(args.coverage_deg, float(args.p)))
+    # Per-station values of every field (NaN = none), kept by --incremental
+    station_vals = np.vstack([f[0] for f in fields] + ([coverage[0]] if coverage else []))
+    # Station fields to interpolate: contours replace the MUF one outright
+    idw_fields = fields[1:] if args.source == "contours" else fields
+    station_field = bool(idw_fields) or coverage is not None or args.source == "blend"
+
+    # k nearest stations per pixel from a KD-tree on the unit sphere, built once
+    index = SphereIndex(lons, lats) if len(pts) >= 4 else None
+    k = max(4, min(args.k, len(pts)))
+    a = int(round(max(0.0, min(1.0, args.alpha)) * 255))
+
+    fingerprint = station_fingerprint(lons, lats, [p[4] for p in pts])
+    max_cache_bytes = args.weights_cache_max_mb * 1024 * 1024
+
+    # --max-memory: half for the IDW working set (split across workers),
+    # half for the map buffers of the size being rendered
+    workers = args.workers if args.workers > 0 else max(1, cpu_count() - 1)
+    budget = args.max_memory * 1024 * 1024
+    idw_bytes = budget // 2 // workers if budget else None
+    map_bytes = budget // 2
+
+    def operator(lon_axis, lat_axis, grid_tag: str):
+        """Cached sparse operator for a grid, or None when caching is off / over budget."""
+        npix = len(lon_axis) * len(lat_axis)
+        if args.weights_cache and IdwOperator.nbytes_for(npix, k, len(pts)) <= max_cache_bytes:
+            return cached_operator(args.weights_cache, grid_tag, index, lon_axis, lat_axis,
+                                   k, float(args.p), fingerprint, log=print)
+        return None
+
+    def interpolate(op, lon_axis, lat_axis, cover=coverage) -> list:
+        """IDW field of every product on a grid; the cached operator when there is one."""
+        if not idw_fields and cover is None:
+            return []
+        if op is not None:
+            return op.apply_fields(idw_fields, confs, coverage=cover)
+        return idw_grid_fields(index, idw_fields, confs, lon_axis, lat_axis, k, float(args.p),
+                               coverage=cover, max_bytes=idw_bytes)
+
+    # Optional shared coarse fields: one interpolation for every size.
+    # Contours are always gridded once, so they imply a coarse grid.
+    grid_deg = args.grid_deg
+    if grid_deg <= 0 and cpts is not None:
+        grid_deg = CONTOUR_GRID_DEG
+    coarse = coarse_op = None
+    source_tag = args.source
+    if grid_deg > 0:
+        gx, gy = coarse_axes(grid_deg)
+        coarse_op = operator(gx, gy, f"grid{grid_deg:g}") if station_field else None
+        if args.source == "blend" and coverage is None:
+            # Blend weights only: coverage of station confidence, 0..100
+            levels = np.array([100.0 * confidence_unit(c) for c in confs])
+            coarse = interpolate(coarse_op, gx, gy, (levels, coverage_floor(args.coverage_deg, float(args.p))))
+            cover = coarse.pop()
+        else:
+            coarse = interpolate(coarse_op, gx, gy)
+            cover = coarse[-1] if coverage is not None else None
+        if cpts is not None:
+            muf = contour_field(cpts, gx, gy)
+            if args.source == "contours":
+                muf = contour_stretch(muf, calib)
+                coarse.insert(0, None)
+            if args.source == "blend":
+                c = cover / np.float32(100.0)
+                muf = c * coarse[0] + (1 - c) * muf
+            coarse[0] = np.clip(muf, args.muf_min, args.muf_max).astype(np.float32)
+            # The stretch follows every station, so contours key on the field itself
+            tagged = coarse[0] if args.source == "contours" else cpts
+            source_tag = f"{args.source}:{hashlib.sha1(tagged.tobytes()).hexdigest()[:16]}"
+
+    pool = None
+    if workers > 1:
+        pool = Pool(processes=workers, initializer=_worker_init,
+                    initargs=(lons, lats, fields, confs, coverage, coarse, k, float(args.p),
+                              [prod[1:4] for prod in products], args.resample, a, idw_bytes))
+
+    # Workers are torn down on any failure too (their shared-memory views go with them)
+    try:
+        rendered = 0
+        for w, h in sizes:
+            bases = resolve_bases(args, w, h)
+            if not bases:
+                continue
+
+            names = [prod[0] for prod in products]
+            print(f"Rendering {'+'.join(names)} {w}x{h} ({'+'.join(p[-1] for p, _ in bases)}) ...")
+            size_tag = f"{w}x{h}"
+            xs, ys = grid_axes(w, h)
+            op = coarse_op if coarse is not None else operator(xs, ys, size_tag)
+            outs = [[os.path.join(args.outdir, f"{prefix}-{size_tag}-{name}.bmp") for prefix, _ in bases]
+                    for name in names]
+
+            def window_fields(window):
+                if coarse is not None:
+                    return [resample_lonlat(grid, w, h, args.resample, vmin=vmin, vmax=vmax, window=window)
+                            for grid, (_, _, vmin, vmax, _) in zip(coarse, products)]
+                if op is not None:
+                    return op.apply_fields(fields, confs, coverage=coverage, window=window)
+                x0, x1, y0, y1 = window
+                return idw_grid_fields(index, fields, confs, xs[x0:x1], ys[y0:y1], k, float(args.p),
+                                       coverage=coverage, max_bytes=idw_bytes)
+
+            if args.incremental:
+                state_path = os.path.join(args.state_dir, f"{args.product}-{size_tag}.npz")
+                params = json.dumps({
+                    "k": k, "p": args.p, "alpha": a, "muf": [args.muf_min, args.muf_max],
+                    "grid_deg": grid_deg, "resample": args.resample, "source": source_tag,
+                    "palette": args.palette,
+                    "products": names, "coverage_deg": args.coverage_deg,
+                    "bases": [[prefix, path, file_stamp(path)] for prefix, path in bases],
+                }, sort_keys=True)
+                done = render_incremental(args, w, h, op, coarse, window_fields, bases, products, outs, pts,
+                                          station_vals, confs, a, load_state(state_path), params, fingerprint,
+                                      markers_only=not station_field)
+                if done:
+                    rendered += len(bases) * len(products)
+                    continue
+
+            def heat_rows(y0, y1):
+                # A cached operator is one sparse product: cheaper in-process than shipping it
+                if pool is not None and (coarse is not None or op is None):
+                    return parallel_heat_rows(pool, workers, len(products), w, h, y0, y1)
+                return [heatmap_rgba(field, a, prod[1])
+                        for field, prod in zip(window_fields((0, w, y0, y1)), products)]
+
+            band_rows = args.band_rows
+            px_bytes = MAP_BYTES_PER_PX * len(products)
+            if budget and not band_rows and w * h * px_bytes > map_bytes:
+                band_rows = max(16, map_bytes // (w * px_bytes))
+                print(f"MEMORY: {w}x{h} does not fit --max-memory {args.max_memory} MB whole; "
+                      f"streaming {band_rows}-row bands")
+
+            if band_rows:
+                render_streaming(args, w, h, band_rows, heat_rows, bases, products, outs)
+                rendered += len(bases) * len(products)
+            else:
+                if coarse is not None and args.grid_check:
+                    exact = idw_grid(index, vals, confs, xs, ys, k, float(args.p),
+                                     vmin=args.muf_min, vmax=args.muf_max, max_bytes=idw_bytes)
+                    st = deviation_stats(window_fields((0, w, 0, h))[0], exact)
+                    print(f"GRID-CHECK: {w}x{h} grid={grid_deg:g}deg {args.resample} "
+                          f"max={st['max']:.3f} p99={st['p99']:.3f} mean={st['mean']:.4f} MHz")
+
+                # Build overlay RGBA per product: heatmap + station marks (no base yet)
+                overlays = [render_overlay(heat, marks, (w, h), palette=palette)
+                            for heat, (_, palette, _, _, marks) in zip(heat_rows(0, h), products)]
+
+                for b, (prefix, base_path) in enumerate(bases):
+                    base = load_sized_base(base_path, w, h, args.base_cache).convert("RGBA")
+                    for j, overlay in enumerate(overlays):
+                        comp = Image.alpha_composite(base, overlay).convert("RGB")
+
+                        bmp, out_bmp_z, skip = publish_targets(args, outs[j][b])
+                        changed = write_bmpv4_rgb565_topdown_and_z(comp, bmp, out_bmp_z, zlevel=9,
+                                                                   skip_unchanged=skip, zworkers=args.zlib_workers)
+
+                        if args.debug_png:
+                            comp.save(os.path.join(args.outdir, f"{prefix}-{size_tag}-{names[j]}.png"), format="PNG")
+
+                        print(f"{'OK' if changed else 'UNCHANGED'}: {out_bmp_z} (stations used: {len(products[j][4])})")
+                        rendered += 1
+
+            if args.incremental:
+                save_state(state_path, params, fingerprint, station_vals, confs,
+                           output_stamps([o for prod_outs in outs for o in prod_outs]))
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if not rendered:
+        print("ERROR: no base maps found; nothing rendered.", file=sys.stderr)
+        return 2
     return 0
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
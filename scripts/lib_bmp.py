@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+"""
+lib_bmp.py - shared BMPv4 RGB565 encode/decode for OHB map generators
+
+HamClock core maps are BMPv4 (BITMAPV4HEADER), 16bpp RGB565 bitfields,
+top-down, and are served zlib-compressed as .bmp.z. This module packs
+RGB888 arrays to that format with numpy array operations and reads
+.bmp / .bmp.z files back into arrays, so every generator shares one
+implementation instead of a per-pixel Python loop.
+
+Importable:
+
+  from lib_bmp import write_bmp, read_bmp_rgb
+  write_bmp(rgb, "map-D-660x330-MUF-RT.bmp", "map-D-660x330-MUF-RT.bmp.z")
+
+Batch CLI (one process for every size / variant of a job):
+
+  lib_bmp.py encode --job IN OUT.bmp WxH [--job ...] [--zlevel 9] [--compressed-only]
+                    [--zlib-workers N]
+      IN is raw RGB888 (.rgb/.raw) or any image PIL can open (.png ...).
+      Writes OUT.bmp and OUT.bmp.z; with --compressed-only just OUT.bmp.z
+      (removing a stale OUT.bmp), left untouched if its pixels are the same.
+  lib_bmp.py decode IN.bmp[.z] OUT.rgb
+  lib_bmp.py verify --file FILE.bmp[.z] WxH [--file ...]
+
+Decoded base-map cache (raw arrays on disk, memory-mapped; rebuilt only
+when the source file changes):
+
+  rgb = decoded_map("map-D-660x330-Countries.bmp.z")          # (h, w, 3)
+  px = decoded_map("map-D-660x330-Countries.bmp.z", "rgb565")  # (h, w)
+
+Streaming (bounded memory for the largest sizes):
+
+  with BmpStreamWriter(w, h, out_bmp_z="map.bmp.z") as out:
+      for y0, band in BmpBandReader("base.bmp.z").bands(64):
+          out.write(band)
+
+Dependencies: python3, numpy
+Shared modules: lib_zlib.py
+Optional: pillow (image inputs, non-RGB565 BMPs)
+"""
+
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+import lib_zlib
+
+
+BMP_FILE_HEADER_SIZE = 14
+BMP_V4_HEADER_SIZE = 108
+BMP_PIXEL_OFFSET = BMP_FILE_HEADER_SIZE + BMP_V4_HEADER_SIZE   # 122
+
+# Decoded map arrays for decoded_map(); OHB_DECODED_CACHE overrides, "" disables
+DECODED_CACHE_DIR = os.environ.get("OHB_DECODED_CACHE", "/opt/hamclock-backend/cache/decoded-maps")
+
+BI_BITFIELDS = 3
+RGB565_MASKS = (0xF800, 0x07E0, 0x001F)
+
+
+def row_stride(w: int) -> int:
+    """Bytes per BMP row for a 16bpp image (rows are padded to 4 bytes)."""
+    return ((w * 2 + 3) // 4) * 4
+
+
+def bmpv4_rgb565_header(w: int, h: int) -> bytes:
+    """File header + BITMAPV4HEADER for a top-down RGB565 image."""
+    image_size = row_stride(w) * h
+
+    file_header = struct.pack("<2sIHHI", b"BM", BMP_PIXEL_OFFSET + image_size, 0, 0, BMP_PIXEL_OFFSET)
+
+    v4_header = struct.pack(
+        "<IiiHHIIiiII"
+        "IIII"
+        "I"
+        "36s"
+        "III",
+        BMP_V4_HEADER_SIZE,
+        w,
+        -h,             # top-down
+        1,              # planes
+        16,             # bpp
+        BI_BITFIELDS,
+        image_size,
+        0, 0,           # XPelsPerMeter, YPelsPerMeter
+        0, 0,           # ClrUsed, ClrImportant
+        RGB565_MASKS[0],
+        RGB565_MASKS[1],
+        RGB565_MASKS[2],
+        0x0000,         # alpha mask
+        0x73524742,     # 'sRGB'
+        b"\x00" * 36,   # endpoints
+        0, 0, 0         # gamma
+    )
+    return file_header + v4_header
+
+
+def rgb888_to_rgb565(rgb) -> np.ndarray:
+    """Pack an (h, w, 3) uint8 array to (h, w) uint16 RGB565."""
+    rgb = np.asarray(rgb)
+    r = rgb[..., 0].astype(np.uint16)
+    g = rgb[..., 1].astype(np.uint16)
+    b = rgb[..., 2].astype(np.uint16)
+    return ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+
+
+def rgb565_to_rgb888(px) -> np.ndarray:
+    """Expand (h, w) RGB565 to (h, w, 3) uint8, scaled the same way PIL decodes it."""
+    px = np.asarray(px, dtype=np.uint16)
+    out = np.empty(px.shape + (3,), dtype=np.uint8)
+    out[..., 0] = ((px >> 11) & 0x1F).astype(np.uint32) * 255 // 31
+    out[..., 1] = ((px >> 5) & 0x3F).astype(np.uint32) * 255 // 63
+    out[..., 2] = (px & 0x1F).astype(np.uint32) * 255 // 31
+    return out
+
+
+def rgb565_pixel_bytes(px565) -> bytes:
+    """Little-endian, row-padded pixel array bytes for (h, w) RGB565."""
+    px565 = np.asarray(px565, dtype="<u2")
+    h, w = px565.shape
+    pad = row_stride(w) - w * 2
+    if not pad:
+        return np.ascontiguousarray(px565).tobytes()
+    out = np.zeros((h, row_stride(w)), dtype=np.uint8)
+    out[:, :w * 2] = np.ascontiguousarray(px565).view(np.uint8).reshape(h, w * 2)
+    return out.tobytes()
+
+
+def encode_bmp(img) -> bytes:
+    """
+    Encode an image to BMPv4 RGB565 top-down bytes.
+
+    img may be an (h, w, 3) uint8 array, an (h, w) uint16 RGB565 array
+    or a PIL image.
+    """
+    arr = _as_array(img)
+    px = arr if arr.ndim == 2 else rgb888_to_rgb565(arr)
+    h, w = px.shape
+    return bmpv4_rgb565_header(w, h) + rgb565_pixel_bytes(px)
+
+
+def write_bmp(img, out_bmp: str = None, out_bmp_z: str = None, zlevel: int = 9,
+              skip_unchanged: bool = False, zworkers: int = 1) -> bool:
+    """
+    Encode img and publish .bmp and/or .bmp.z atomically. Returns False
+    when skip_unchanged found the same pixels already published.
+    """
+    arr = _as_array(img)
+    px = arr if arr.ndim == 2 else rgb888_to_rgb565(arr)
+    h, w = px.shape
+    with BmpStreamWriter(w, h, out_bmp, out_bmp_z, zlevel=zlevel, skip_unchanged=skip_unchanged,
+                         zworkers=zworkers) as out:
+        out.write(px)
+    return out.changed
+
+
+def read_bmp_bytes(path: str) -> bytes:
+    """Raw BMP bytes from a .bmp or zlib-compressed .bmp.z file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".z"):
+        data = zlib.decompress(data)
+    return data
+
+
+def parse_bmp_header(data: bytes) -> dict:
+    if data[:2] != b"BM":
+        raise ValueError("not a BMP (missing 'BM')")
+    off = struct.unpack_from("<I", data, 10)[0]
+    dib = struct.unpack_from("<I", data, 14)[0]
+    w, h = struct.unpack_from("<ii", data, 18)
+    bpp = struct.unpack_from("<H", data, 28)[0]
+    comp = struct.unpack_from("<I", data, 30)[0]
+    masks = struct.unpack_from("<III", data, 54) if dib >= 52 or comp == BI_BITFIELDS else None
+    return {
+        "offset": off,
+        "dib": dib,
+        "width": w,
+        "height": abs(h),
+        "topdown": h < 0,
+        "bpp": bpp,
+        "compression": comp,
+        "masks": masks,
+    }
+
+
+def is_rgb565(hdr: dict) -> bool:
+    return (hdr["bpp"] == 16 and hdr["compression"] == BI_BITFIELDS
+            and hdr["masks"] is not None and tuple(hdr["masks"]) == RGB565_MASKS)
+
+
+def decode_rgb565(data: bytes, hdr: dict = None) -> np.ndarray:
+    """
+    Decode BMP bytes into an (h, w) uint16 RGB565 array (top-down).
+
+    Native RGB565 bitfield files are decoded with array views only; any
+    other BMP is decoded with PIL and packed.
+    """
+    hdr = hdr or parse_bmp_header(data)
+    if not is_rgb565(hdr):
+        return rgb888_to_rgb565(_pil_decode(data))
+    w, h = hdr["width"], hdr["height"]
+    rows = np.frombuffer(data, dtype=np.uint8, count=row_stride(w) * h, offset=hdr["offset"])
+    px = rows.reshape(h, row_stride(w))[:, :w * 2].copy().view("<u2")
+    if not hdr["topdown"]:
+        px = px[::-1]
+    return np.ascontiguousarray(px, dtype=np.uint16)
+
+
+def read_bmp565(path: str) -> np.ndarray:
+    """Read a .bmp/.bmp.z into an (h, w) uint16 RGB565 array (top-down)."""
+    return decode_rgb565(read_bmp_bytes(path))
+
+
+def read_bmp_rgb(path: str) -> np.ndarray:
+    """Read a .bmp/.bmp.z (or any PIL-readable image) into (h, w, 3) uint8."""
+    if not (path.endswith(".bmp") or path.endswith(".bmp.z")):
+        with open(path, "rb") as f:
+            return _pil_decode(f.read())
+    data = read_bmp_bytes(path)
+    hdr = parse_bmp_header(data)
+    if is_rgb565(hdr):
+        return rgb565_to_rgb888(decode_rgb565(data, hdr))
+    return _pil_decode(data)
+
+
+def _tmp_path(path: str) -> str:
+    """Temp name next to path, unique per process and thread (services decode on several threads)."""
+    return f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+
+
+def decoded_map(path: str, fmt: str = "rgb", cache_dir: str = None) -> np.ndarray:
+    """
+    Read-only (h, w, 3) uint8 ("rgb") or (h, w) uint16 ("rgb565") array of
+    a .bmp/.bmp.z/image file, memory-mapped from a .npy in cache_dir. The
+    entry is keyed by the source path, size and mtime, and is rebuilt
+    (replacing the stale one) only when the source changes. Falls back to
+    an in-memory decode when the cache cannot be written.
+    """
+    if fmt not in ("rgb", "rgb565"):
+        raise ValueError(f"unknown decoded format: {fmt}")
+    cache_dir = DECODED_CACHE_DIR if cache_dir is None else cache_dir
+    st = os.stat(path)
+    src = os.path.abspath(path)
+    prefix = f"{os.path.basename(src)}-{hashlib.sha1(src.encode()).hexdigest()[:10]}-{fmt}-"
+    name = f"{prefix}{st.st_size}-{st.st_mtime_ns}.npy"
+
+    if cache_dir:
+        cached = os.path.join(cache_dir, name)
+        try:
+            return np.load(cached, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+
+    if not cache_dir:
+        return _decode_as(path, fmt)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Stale entries only: temp files belong to writers still running
+        for old in os.listdir(cache_dir):
+            if old.startswith(prefix) and old != name and ".tmp" not in old:
+                try:
+                    os.unlink(os.path.join(cache_dir, old))
+                except FileNotFoundError:
+                    pass
+        tmp = _tmp_path(cached)
+        try:
+            _fill_decoded(path, fmt, tmp)
+            os.replace(tmp, cached)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        return np.load(cached, mmap_mode="r")
+    except OSError:
+        return _decode_as(path, fmt)
+
+
+def _decode_as(path: str, fmt: str) -> np.ndarray:
+    if fmt == "rgb565" and (path.endswith(".bmp") or path.endswith(".bmp.z")):
+        return read_bmp565(path)
+    arr = read_bmp_rgb(path)
+    return rgb888_to_rgb565(arr) if fmt == "rgb565" else arr
+
+
+def _fill_decoded(path: str, fmt: str, out_npy: str, band_rows: int = 256) -> None:
+    """Write path decoded as a .npy; BMPs are decoded band by band into the mapping."""
+    reader = None
+    if path.endswith(".bmp") or path.endswith(".bmp.z"):
+        try:
+            reader = BmpBandReader(path)
+        except ValueError:
+            reader = None
+    if reader is None:
+        with open(out_npy, "wb") as f:
+            np.save(f, np.ascontiguousarray(_decode_as(path, fmt)))
+        return
+    w, h = reader.width, reader.height
+    shape, dtype = ((h, w, 3), np.uint8) if fmt == "rgb" else ((h, w), np.uint16)
+    out = np.lib.format.open_memmap(out_npy, mode="w+", dtype=dtype, shape=shape)
+    for y0, px in reader.bands(band_rows):
+        out[y0:y0 + px.shape[0]] = rgb565_to_rgb888(px) if fmt == "rgb" else px
+    out.flush()
+    del out
+
+
+def verify_bmp(path: str, w: int, h: int) -> list:
+    """Return a list of problems with a HamClock map file (empty if good)."""
+    data = read_bmp_bytes(path)
+    errs = []
+    try:
+        hdr = parse_bmp_header(data)
+    except ValueError as e:
+        return [str(e)]
+    exp_size = BMP_PIXEL_OFFSET + row_stride(w) * h
+    if hdr["offset"] != BMP_PIXEL_OFFSET:
+        errs.append(f"bfOffBits={hdr['offset']} (expected {BMP_PIXEL_OFFSET})")
+    if hdr["dib"] != BMP_V4_HEADER_SIZE:
+        errs.append(f"DIB size={hdr['dib']} (expected {BMP_V4_HEADER_SIZE} BMPv4)")
+    if hdr["width"] != w or hdr["height"] != h or not hdr["topdown"]:
+        errs.append(f"w,h={hdr['width']},{'-' if hdr['topdown'] else ''}{hdr['height']} (expected {w},-{h})")
+    if hdr["bpp"] != 16:
+        errs.append(f"bpp={hdr['bpp']} (expected 16)")
+    if hdr["compression"] != BI_BITFIELDS:
+        errs.append(f"comp={hdr['compression']} (expected {BI_BITFIELDS})")
+    if hdr["masks"] is None or tuple(hdr["masks"]) != RGB565_MASKS:
+        errs.append(f"masks={hdr['masks']}")
+    if len(data) != exp_size:
+        errs.append(f"file size={len(data)} (expected {exp_size})")
+    return errs
+
+
+class _ZReader:
+    """read(n) over a .bmp or, through one decompressobj, a .bmp.z file."""
+
+    def __init__(self, path: str, chunk: int = 1 << 16):
+        self._f = open(path, "rb")
+        self._z = zlib.decompressobj() if path.endswith(".z") else None
+        self._tail = b""
+        self._chunk = chunk
+
+    def read(self, n: int) -> bytes:
+        if self._z is None:
+            return self._f.read(n)
+        parts = []
+        got = 0
+        while got < n:
+            if not self._tail:
+                self._tail = self._f.read(self._chunk)
+                if not self._tail:
+                    break
+            d = self._z.decompress(self._tail, n - got)
+            self._tail = self._z.unconsumed_tail
+            parts.append(d)
+            got += len(d)
+        return b"".join(parts)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class BmpBandReader:
+    """
+    Read a .bmp/.bmp.z as top-down bands of RGB565 rows. Top-down RGB565
+    files (every OHB map) are decompressed incrementally, so memory is
+    bounded by the band height; any other BMP is decoded whole first.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        r = _ZReader(path)
+        head = r.read(BMP_PIXEL_OFFSET)
+        try:
+            self.header = parse_bmp_header(head)
+        except (ValueError, struct.error):
+            r.close()
+            raise ValueError(f"{path}: not a BMP")
+        self.width = self.header["width"]
+        self.height = self.header["height"]
+        self._streamable = self.header["topdown"] and is_rgb565(self.header)
+        r.close()
+
+    def bands(self, band_rows: int):
+        """Yield (y0, (n, w) uint16) top to bottom."""
+        w, h = self.width, self.height
+        if not self._streamable:
+            px = read_bmp565(self.path)
+            for y0 in range(0, h, band_rows):
+                yield y0, px[y0:y0 + band_rows]
+            return
+        stride = row_stride(w)
+        r = _ZReader(self.path)
+        try:
+            if len(r.read(self.header["offset"])) != self.header["offset"]:
+                raise ValueError(f"{self.path}: truncated header")
+            for y0 in range(0, h, band_rows):
+                n = min(band_rows, h - y0)
+                data = r.read(stride * n)
+                if len(data) != stride * n:
+                    raise ValueError(f"{self.path}: truncated at row {y0}")
+                rows = np.frombuffer(data, dtype=np.uint8).reshape(n, stride)
+                yield y0, rows[:, :w * 2].copy().view("<u2").astype(np.uint16)
+        finally:
+            r.close()
+
+    def bands_rgb(self, band_rows: int):
+        """Yield (y0, (n, w, 3) uint8) top to bottom."""
+        for y0, px in self.bands(band_rows):
+            yield y0, rgb565_to_rgb888(px)
+
+
+class BmpStreamWriter:
+    """
+    Write a top-down BMPv4 RGB565 .bmp and/or .bmp.z band by band. The
+    .bmp.z goes through one zlib.compressobj, so only the current band is
+    held in memory; the output is the same as write_bmp().
+
+    Files are written next to their targets and published with an atomic
+    rename on close(). With skip_unchanged the compressed stream is kept in
+    memory and nothing is written when the pixels hash the same as the
+    published file (changed is then False). zworkers != 1 deflates on
+    several cores (lib_zlib; 0 = all), still as one zlib stream.
+    """
+
+    def __init__(self, w: int, h: int, out_bmp: str = None, out_bmp_z: str = None,
+                 zlevel: int = 9, skip_unchanged: bool = False, zworkers: int = 1):
+        self.w, self.h = w, h
+        self.rows = 0
+        self.changed = True
+        self._tmps = []
+        self._ref = (out_bmp_z or out_bmp) if skip_unchanged else None
+        self._sha = hashlib.sha1(f"{w}x{h}".encode()) if skip_unchanged else None
+        self._bmp = self._open(out_bmp) if out_bmp else None
+        self._out_bmp_z = out_bmp_z
+        self._zchunks = [] if out_bmp_z and skip_unchanged else None
+        self._bmpz = self._open(out_bmp_z) if out_bmp_z and not skip_unchanged else None
+        # Last, so a failed open above leaves no deflate threads behind
+        self._z = lib_zlib.compressobj(zlevel, zworkers) if out_bmp_z else None
+        self._put(bmpv4_rgb565_header(w, h))
+
+    def _open(self, path: str):
+        tmp = _tmp_path(path)
+        self._tmps.append((tmp, path))
+        return open(tmp, "wb")
+
+    def _put(self, data: bytes) -> None:
+        if self._bmp:
+            self._bmp.write(data)
+        if self._z:
+            zdata = self._z.compress(data)
+            if self._zchunks is not None:
+                self._zchunks.append(zdata)
+            else:
+                self._bmpz.write(zdata)
+
+    def write(self, band) -> None:
+        """Append rows: (n, w, 3) uint8, (n, w) uint16 RGB565 or a PIL image."""
+        arr = _as_array(band)
+        px = arr if arr.ndim == 2 else rgb888_to_rgb565(arr)
+        if px.shape[1] != self.w or self.rows + px.shape[0] > self.h:
+            raise ValueError(f"band {px.shape[1]}x{px.shape[0]} does not fit {self.w}x{self.h} at row {self.rows}")
+        data = rgb565_pixel_bytes(px)
+        if self._sha:
+            self._sha.update(data)
+        self._put(data)
+        self.rows += px.shape[0]
+
+    def _close_files(self) -> None:
+        for f in (self._bmp, self._bmpz):
+            if f:
+                f.close()
+        self._bmp = self._bmpz = None
+
+    def abort(self) -> None:
+        """Drop everything written so far; the published files are left alone."""
+        # A parallel deflate holds threads until flushed or closed (zlib's does not)
+        if isinstance(self._z, lib_zlib.ParallelCompressobj):
+            self._z.close()
+        self._z = None
+        self._close_files()
+        for tmp, _ in self._tmps:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self._tmps = []
+
+    def close(self) -> None:
+        if self.rows != self.h:
+            self.abort()
+            raise ValueError(f"wrote {self.rows} of {self.h} rows")
+        try:
+            if self._z:
+                tail = self._z.flush()
+                if self._zchunks is not None:
+                    self._zchunks.append(tail)
+                else:
+                    self._bmpz.write(tail)
+            self._close_files()
+            if self._sha and os.path.exists(self._ref):
+                try:
+                    self.changed = bmp_pixel_digest(self._ref) != self._sha.hexdigest()
+                except (OSError, ValueError, zlib.error):
+                    self.changed = True
+            if not self.changed:
+                self.abort()
+                return
+            if self._zchunks is not None:
+                with self._open(self._out_bmp_z) as f:
+                    f.writelines(self._zchunks)
+                self._zchunks = None
+            for tmp, path in self._tmps:
+                os.replace(tmp, path)
+            self._tmps = []
+        except BaseException:
+            self.abort()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
+
+
+def bmp_pixel_digest(path: str, band_rows: int = 256) -> str:
+    """sha1 of a .bmp/.bmp.z's size and RGB565 pixel rows, as BmpStreamWriter hashes them."""
+    reader = BmpBandReader(path)
+    sha = hashlib.sha1(f"{reader.width}x{reader.height}".encode())
+    for _, px in reader.bands(band_rows):
+        sha.update(rgb565_pixel_bytes(px))
+    return sha.hexdigest()
+
+
+def _pil_decode(data: bytes) -> np.ndarray:
+    from io import BytesIO
+    from PIL import Image
+    return np.asarray(Image.open(BytesIO(data)).convert("RGB"))
+
+
+def _as_array(img) -> np.ndarray:
+    if isinstance(img, np.ndarray):
+        return img
+    # PIL image
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img)
+
+
+def _parse_size(s: str) -> tuple:
+    w, _, h = s.lower().partition("x")
+    return int(w), int(h)
+
+
+def _load_job_input(path: str, w: int, h: int) -> np.ndarray:
+    if path.endswith(".rgb") or path.endswith(".raw"):
+        raw = np.fromfile(path, dtype=np.uint8)
+        if raw.size != w * h * 3:
+            raise ValueError(f"RAW size {raw.size} != expected {w * h * 3}")
+        return raw.reshape(h, w, 3)
+    rgb = read_bmp_rgb(path)
+    if rgb.shape[:2] != (h, w):
+        raise ValueError(f"image size {rgb.shape[1]}x{rgb.shape[0]} != expected {w}x{h}")
+    return rgb
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="BMPv4 RGB565 encode/decode for HamClock maps")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    enc = sub.add_parser("encode", help="encode RGB888 inputs to .bmp + .bmp.z")
+    enc.add_argument("--job", nargs=3, action="append", required=True, metavar=("IN", "OUT_BMP", "WxH"))
+    enc.add_argument("--zlevel", type=int, default=9)
+    enc.add_argument("--zlib-workers", type=int, default=1, help="deflate threads (0 = all cores)")
+    enc.add_argument("--compressed-only", action="store_true",
+                     help="write only OUT.bmp.z, and skip it when the pixels are unchanged")
+
+    dec = sub.add_parser("decode", help="decode .bmp/.bmp.z to raw RGB888")
+    dec.add_argument("src")
+    dec.add_argument("dst")
+
+    ver = sub.add_parser("verify", help="check HamClock BMPv4 RGB565 headers and sizes")
+    ver.add_argument("--file", nargs=2, action="append", required=True, metavar=("PATH", "WxH"))
+
+    args = ap.parse_args(argv)
+
+    if args.cmd == "encode":
+        failed = 0
+        for src, out_bmp, size in args.job:
+            try:
+                w, h = _parse_size(size)
+                rgb = _load_job_input(src, w, h)
+                if args.compressed_only:
+                    changed = write_bmp(rgb, None, out_bmp + ".z", zlevel=args.zlevel, skip_unchanged=True,
+                                        zworkers=args.zlib_workers)
+                    if os.path.exists(out_bmp):
+                        os.unlink(out_bmp)
+                    print(f"{'OK' if changed else 'UNCHANGED'}: {out_bmp}.z")
+                else:
+                    write_bmp(rgb, out_bmp, out_bmp + ".z", zlevel=args.zlevel, zworkers=args.zlib_workers)
+                    print(f"OK: {out_bmp}")
+            except Exception as e:
+                print(f"ERROR: {src} -> {out_bmp}: {e}", file=sys.stderr)
+                failed += 1
+        return 1 if failed else 0
+
+    if args.cmd == "decode":
+        read_bmp_rgb(args.src).tofile(args.dst)
+        return 0
+
+    if args.cmd == "verify":
+        bad = 0
+        for p, size in args.file:
+            w, h = _parse_size(size)
+            try:
+                errs = verify_bmp(p, w, h)
+            except (OSError, zlib.error) as e:
+                errs = [str(e)]
+            if errs:
+                print(f"BAD: {p}\n  " + "\n  ".join(errs), file=sys.stderr)
+                bad += 1
+        return 1 if bad else 0
+
+    return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
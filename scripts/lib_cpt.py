@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+lib_cpt.py - shared palettes and lookup-table colorizer for OHB heatmaps
+
+A Palette is loaded once from a GMT .cpt file (muf_hamclock.cpt, drap.cpt,
+aurora.cpt ...) or from one of the built-in stop tables, expanded into a
+dense LUT, and then maps a whole float grid to RGB/RGBA/RGB565 in a single
+array lookup instead of a per-pixel Python call.
+
+Importable:
+
+  from lib_cpt import get_palette
+  pal = get_palette("muf-rt")
+  rgba = pal.colorize(muf_grid, alpha=140)     # (h, w, 4) uint8
+  px565 = pal.colorize565(muf_grid)            # (h, w) uint16
+
+CLI (writes a palette as a GMT .cpt, so shell pipelines share the same
+definition as the python renderers):
+
+  lib_cpt.py dump drap > drap.cpt
+  lib_cpt.py dump aurora --vmax 37 > aurora.cpt
+
+Dependencies: python3, numpy
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+
+LUT_SIZE = 4096
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Palette:
+    """
+    Piecewise-linear colour table: a list of (z0, rgb0, z1, rgb1) segments
+    plus the GMT B (below), F (above) and N (NaN) colours.
+    """
+
+    def __init__(self, segments, below=None, above=None, nan=None, name=""):
+        if not segments:
+            raise ValueError("palette has no segments")
+        self.segments = sorted(segments, key=lambda s: s[0])
+        self.zmin = self.segments[0][0]
+        self.zmax = self.segments[-1][2]
+        # B/F default to the end colours and N to black; only explicit ones
+        # are written back out by to_cpt()
+        self._bfn = (below, above, nan)
+        self.below = tuple(below) if below is not None else tuple(self.segments[0][1])
+        self.above = tuple(above) if above is not None else tuple(self.segments[-1][3])
+        self.nan = tuple(nan) if nan is not None else (0, 0, 0)
+        self.name = name
+        self._lut = None
+        self._lut565 = None
+
+    @classmethod
+    def from_stops(cls, stops, **kw):
+        """Build from [(z, (r, g, b)), ...] stops (continuous colours)."""
+        segs = [(stops[i][0], stops[i][1], stops[i + 1][0], stops[i + 1][1]) for i in range(len(stops) - 1)]
+        return cls(segs, **kw)
+
+    @classmethod
+    def from_cpt(cls, path: str, name: str = ""):
+        with open(path, "r", encoding="utf-8") as f:
+            return parse_cpt(f.read(), name=name or os.path.basename(path))
+
+    def rgb(self, z: float) -> tuple:
+        """Exact colour of one value (used for markers and legends)."""
+        if z != z:
+            return self.nan
+        if z < self.zmin:
+            return self.below
+        if z > self.zmax:
+            return self.above
+        for z0, c0, z1, c1 in reversed(self.segments):
+            if z0 <= z <= z1:
+                t = (z - z0) / (z1 - z0) if z1 > z0 else 0.0
+                return tuple(int(round(c0[i] + t * (c1[i] - c0[i]))) for i in range(3))
+        return self.above
+
+    def lut(self) -> np.ndarray:
+        """
+        (LUT_SIZE + 3, 3) uint8 table: LUT_SIZE samples over [zmin, zmax]
+        followed by the below, above and NaN colours.
+        """
+        if self._lut is None:
+            zs = np.linspace(self.zmin, self.zmax, LUT_SIZE)
+            tab = np.empty((LUT_SIZE + 3, 3), dtype=np.float64)
+            # Walk segments in order so a later segment owns a shared boundary,
+            # matching GMT (z0 <= z < z1) for discontinuous tables.
+            for z0, c0, z1, c1 in self.segments:
+                m = (zs >= z0) & (zs <= z1)
+                t = (zs[m] - z0) / (z1 - z0) if z1 > z0 else np.zeros(m.sum())
+                for i in range(3):
+                    tab[:LUT_SIZE][m, i] = c0[i] + t * (c1[i] - c0[i])
+            tab[LUT_SIZE] = self.below
+            tab[LUT_SIZE + 1] = self.above
+            tab[LUT_SIZE + 2] = self.nan
+            self._lut = np.clip(np.round(tab), 0, 255).astype(np.uint8)
+        return self._lut
+
+    def lut565(self) -> np.ndarray:
+        if self._lut565 is None:
+            from lib_bmp import rgb888_to_rgb565
+            self._lut565 = rgb888_to_rgb565(self.lut())
+        return self._lut565
+
+    def index(self, grid) -> np.ndarray:
+        """Map a float grid to LUT indices (see lut())."""
+        g = np.asarray(grid, dtype=np.float32)
+        scale = (LUT_SIZE - 1) / (self.zmax - self.zmin) if self.zmax > self.zmin else 0.0
+        with np.errstate(invalid="ignore"):
+            t = (g - np.float32(self.zmin)) * np.float32(scale) + np.float32(0.5)
+            np.clip(t, 0, LUT_SIZE - 1, out=t)
+            idx = np.nan_to_num(t, nan=0.0).astype(np.int32)
+            idx[g < self.zmin] = LUT_SIZE
+            idx[g > self.zmax] = LUT_SIZE + 1
+        idx[np.isnan(g)] = LUT_SIZE + 2
+        return idx
+
+    def colorize_rgb(self, grid) -> np.ndarray:
+        """(h, w) float -> (h, w, 3) uint8."""
+        return self.lut()[self.index(grid)]
+
+    def colorize(self, grid, alpha: int = 255) -> np.ndarray:
+        """(h, w) float -> (h, w, 4) uint8 with constant alpha."""
+        idx = self.index(grid)
+        out = np.empty(idx.shape + (4,), dtype=np.uint8)
+        out[..., :3] = self.lut()[idx]
+        out[..., 3] = alpha
+        return out
+
+    def colorize565(self, grid) -> np.ndarray:
+        """(h, w) float -> (h, w) uint16 RGB565."""
+        return self.lut565()[self.index(grid)]
+
+    def to_cpt(self) -> str:
+        def c(rgb):
+            return "/".join(str(int(v)) for v in rgb)
+
+        def z(v):
+            return f"{v:g}"
+
+        lines = [f"# {self.name}"] if self.name else []
+        for z0, c0, z1, c1 in self.segments:
+            lines.append(f"{z(z0)}\t{c(c0)}\t{z(z1)}\t{c(c1)}")
+        for key, given, rgb in zip("BFN", self._bfn, (self.below, self.above, self.nan)):
+            if given is not None:
+                lines.append(f"{key}\t{c(rgb)}")
+        return "\n".join(lines) + "\n"
+
+
+def _parse_color(tokens):
+    """Parse 'r/g/b' or 'r g b' from the front of tokens; returns (rgb, rest)."""
+    if "/" in tokens[0]:
+        r, g, b = (int(float(v)) for v in tokens[0].split("/")[:3])
+        return (r, g, b), tokens[1:]
+    return tuple(int(float(v)) for v in tokens[:3]), tokens[3:]
+
+
+def parse_cpt(text: str, name: str = "") -> Palette:
+    """Parse a GMT colour table (z0 color z1 color lines, B/F/N, # comments)."""
+    segs = []
+    extra = {}
+    for line in text.splitlines():
+        s = line.split("#", 1)[0].strip()
+        if not s:
+            continue
+        tok = s.split()
+        if tok[0] in ("B", "F", "N"):
+            extra[tok[0]], _ = _parse_color(tok[1:])
+            continue
+        z0 = float(tok[0])
+        c0, rest = _parse_color(tok[1:])
+        z1 = float(rest[0])
+        c1, _ = _parse_color(rest[1:])
+        segs.append((z0, c0, z1, c1))
+    return Palette(segs, below=extra.get("B"), above=extra.get("F"), nan=extra.get("N"), name=name)
+
+
+# ---------------------------------------------------------------------------
+# Built-in palettes
+# ---------------------------------------------------------------------------
+
+# MUF-RT station heatmap (low=blue, mid=green/yellow, high=red/purple), MHz
+MUF_RT_STOPS = [
+    (0.0,  (0, 0, 80)),
+    (5.0,  (0, 40, 180)),
+    (8.0,  (0, 140, 255)),
+    (10.0, (0, 220, 120)),
+    (14.0, (220, 220, 0)),
+    (18.0, (255, 140, 0)),
+    (22.0, (255, 60, 0)),
+    (28.0, (200, 0, 120)),
+    (35.0, (120, 0, 160)),
+]
+
+# foF2 from the same stations: the MUF-RT colours over the 0-15 MHz range
+FOF2_RT_STOPS = [(z * 15.0 / 35.0, rgb) for z, rgb in MUF_RT_STOPS]
+
+# Station coverage / confidence, percent (none=dark red, full=green)
+CONFIDENCE_STOPS = [
+    (0.0,   (60, 0, 0)),
+    (20.0,  (200, 0, 0)),
+    (45.0,  (255, 140, 0)),
+    (70.0,  (230, 230, 0)),
+    (100.0, (0, 200, 60)),
+]
+
+# muf_map.py jet scale, 3-35 MHz (segments are not continuous, as drawn by
+# the original per-pixel _jet())
+MUF_JET_SEGMENTS = [
+    (3.0,  (0, 128, 255), 7.0,  (0, 255, 255)),
+    (7.0,  (0, 255, 255), 15.0, (0, 255, 0)),
+    (15.0, (0, 255, 255), 23.0, (255, 255, 0)),
+    (23.0, (255, 255, 0), 31.0, (255, 0, 0)),
+    (31.0, (255, 0, 0),   35.0, (127, 0, 0)),
+]
+
+# DRAP highest affected frequency, MHz
+DRAP_CPT = """\
+0.0    0/0/0         0.1   20/0/40
+0.1   20/0/40        1.0   60/0/90
+1.0   60/0/90        2.0   100/0/150
+2.0   100/0/150      4.0   130/0/200
+4.0   130/0/200      6.0   80/0/255
+6.0   80/0/255       9.0   0/80/255
+9.0   0/80/255      12.0   0/200/220
+12.0  0/200/220     16.0   0/220/100
+16.0  0/220/100     20.0   180/255/0
+20.0  180/255/0     24.0   255/200/0
+24.0  255/200/0     28.0   255/100/0
+28.0  255/100/0     35.0   255/0/0
+N     0/0/0
+"""
+
+
+def aurora_palette(vmax: float) -> Palette:
+    """OVATION aurora probability, scaled so the brightest green hits vmax."""
+    vmax = int(max(20, vmax))
+    v15 = vmax * 15 // 100
+    v40 = vmax * 40 // 100
+    v65 = vmax * 65 // 100
+    return Palette([
+        (0,   (0, 0, 0),    1,    (0, 0, 0)),
+        (1,   (0, 20, 0),   v15,  (0, 80, 0)),
+        (v15, (0, 80, 0),   v40,  (0, 160, 0)),
+        (v40, (0, 160, 0),  v65,  (0, 220, 0)),
+        (v65, (0, 220, 0),  vmax, (1, 251, 0)),
+    ], name="aurora")
+
+
+_PALETTES = {}
+
+
+def get_palette(name: str, **kw) -> Palette:
+    """
+    Built-in palette by name, or a .cpt path. Palettes (and their LUTs)
+    are cached for the life of the process.
+    """
+    key = (name, tuple(sorted(kw.items())))
+    pal = _PALETTES.get(key)
+    if pal is not None:
+        return pal
+    if name == "muf-rt":
+        pal = Palette.from_stops(MUF_RT_STOPS, name=name)
+    elif name == "fof2-rt":
+        pal = Palette.from_stops(FOF2_RT_STOPS, name=name)
+    elif name == "confidence":
+        pal = Palette.from_stops(CONFIDENCE_STOPS, name=name)
+    elif name == "muf-jet":
+        pal = Palette(MUF_JET_SEGMENTS, name=name)
+    elif name == "muf-hamclock":
+        pal = Palette.from_cpt(os.path.join(SCRIPT_DIR, "muf_hamclock.cpt"), name=name)
+    elif name == "drap":
+        pal = parse_cpt(DRAP_CPT, name=name)
+    elif name == "aurora":
+        pal = aurora_palette(**kw)
+    elif os.path.exists(name):
+        pal = Palette.from_cpt(name)
+    else:
+        raise KeyError(f"unknown palette: {name}")
+    _PALETTES[key] = pal
+    return pal
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="OHB shared heatmap palettes")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    dump = sub.add_parser("dump", help="write a palette as a GMT .cpt to stdout")
+    dump.add_argument("name", help="muf-rt | fof2-rt | confidence | muf-jet | muf-hamclock | drap | aurora | path.cpt")
+    dump.add_argument("--vmax", type=float, default=20.0, help="aurora scale maximum")
+    args = ap.parse_args(argv)
+
+    kw = {"vmax": args.vmax} if args.name == "aurora" else {}
+    try:
+        sys.stdout.write(get_palette(args.name, **kw).to_cpt())
+    except (KeyError, OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+lib_idw.py - spherical nearest-neighbour index and IDW for station maps
+
+Stations are stored as 3D unit vectors in a KD-tree; the chord distance
+between unit vectors is monotonic in great-circle distance, so the k
+nearest stations by chord are the k nearest on the sphere. Chord lengths
+are converted back to central angles so weights match the haversine
+formulation exactly:
+
+  w_i = conf_i / (d_i + eps) ** p        d_i = central angle (radians)
+  v   = sum(w_i * v_i) / (sum(w_i) + eps)
+
+One neighbour search serves several station fields (idw_grid_fields,
+IdwOperator.apply_fields): a field may leave stations out (NaN), which
+then carry no weight for it, and a coverage surface
+
+  c = sum(r_i * l_i) / (sum(r_i) + floor)    r_i = 1 / (d_i + eps) ** p
+
+fades station levels l_i (e.g. confidence) out with distance, floor being
+the raw weight of a station coverage_floor() degrees away.
+
+Dependencies: python3, numpy
+Optional: scipy (KD-tree; without it a dense chunked search is used)
+"""
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+IDW_EPS = 1e-6
+
+
+def unit_vectors(lon_deg, lat_deg) -> np.ndarray:
+    """(..., 3) unit vectors for lon/lat in degrees."""
+    lon = np.deg2rad(np.asarray(lon_deg, dtype=np.float64))
+    lat = np.deg2rad(np.asarray(lat_deg, dtype=np.float64))
+    cl = np.cos(lat)
+    return np.stack([cl * np.cos(lon), cl * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_angle(chord):
+    """Central angle (radians) from unit-sphere chord length."""
+    return 2.0 * np.arcsin(np.minimum(1.0, chord * 0.5))
+
+
+def haversine_rad(lon1, lat1, lon2, lat2):
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+    c = 2.0 * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    return c
+
+
+def grid_axes(w: int, h: int) -> tuple:
+    """Pixel-centre lon/lat axes (degrees) of an equirectangular w x h map."""
+    xs = np.linspace(-180.0, 180.0, w, dtype=np.float64)
+    ys = np.linspace(90.0, -90.0, h, dtype=np.float64)
+    return xs, ys
+
+
+class SphereIndex:
+    """k-nearest-neighbour index over points on the unit sphere."""
+
+    def __init__(self, lons_deg, lats_deg):
+        self.lons = np.asarray(lons_deg, dtype=np.float64)
+        self.lats = np.asarray(lats_deg, dtype=np.float64)
+        self.n = len(self.lons)
+        self.xyz = unit_vectors(self.lons, self.lats)
+        self.tree = cKDTree(self.xyz) if cKDTree is not None else None
+
+    def query_xyz(self, xyz, k: int, dense_chunk: int = 20000) -> tuple:
+        """
+        k nearest points to each row of xyz (..., 3).
+        Returns (angle_rad, idx), each shaped (..., k).
+        """
+        shape = xyz.shape[:-1]
+        flat = xyz.reshape(-1, 3)
+        if self.tree is not None:
+            chord, idx = self.tree.query(flat, k=k)
+            if k == 1:
+                chord, idx = chord[:, None], idx[:, None]
+            ang = chord_to_angle(chord)
+        else:
+            ang, idx = self._query_dense(flat, k, dense_chunk)
+        return ang.reshape(shape + (k,)), idx.reshape(shape + (k,))
+
+    def query_lonlat(self, lon_deg, lat_deg, k: int) -> tuple:
+        return self.query_xyz(unit_vectors(lon_deg, lat_deg), k)
+
+    def query_grid(self, lon_axis, lat_axis, k: int, chunk_rows: int = 64, dense_chunk: int = 20000):
+        """
+        Yield (y0, y1, angle_rad, idx) for row bands of the lon x lat grid,
+        shapes (y1 - y0, len(lon_axis), k).
+        """
+        lon_r = np.deg2rad(np.asarray(lon_axis, dtype=np.float64))
+        lat_r = np.deg2rad(np.asarray(lat_axis, dtype=np.float64))
+        clon, slon = np.cos(lon_r), np.sin(lon_r)
+        h = len(lat_r)
+        for y0 in range(0, h, chunk_rows):
+            y1 = min(h, y0 + chunk_rows)
+            cl = np.cos(lat_r[y0:y1])[:, None]
+            xyz = np.empty((y1 - y0, len(lon_r), 3), dtype=np.float64)
+            xyz[..., 0] = cl * clon[None, :]
+            xyz[..., 1] = cl * slon[None, :]
+            xyz[..., 2] = np.sin(lat_r[y0:y1])[:, None]
+            ang, idx = self.query_xyz(xyz, k, dense_chunk)
+            yield y0, y1, ang, idx
+
+    def _query_dense(self, xyz, k: int, chunk: int = 20000) -> tuple:
+        # No scipy: exact search against every station, in bounded chunks
+        ang = np.empty((len(xyz), k), dtype=np.float64)
+        idx = np.empty((len(xyz), k), dtype=np.intp)
+        for i0 in range(0, len(xyz), chunk):
+            i1 = min(len(xyz), i0 + chunk)
+            dot = np.clip(xyz[i0:i1] @ self.xyz.T, -1.0, 1.0)
+            part = np.argpartition(-dot, kth=k - 1, axis=1)[:, :k]
+            ang[i0:i1] = np.arccos(np.take_along_axis(dot, part, axis=1))
+            idx[i0:i1] = part
+        return ang, idx
+
+
+def idw_weights(ang, idx, confs, p: float, eps: float = IDW_EPS) -> np.ndarray:
+    """Confidence-weighted inverse-distance weights for neighbour sets."""
+    w = 1.0 / np.power(ang + eps, p)
+    return w * np.asarray(confs)[idx]
+
+
+def idw_apply(weights, idx, vals, eps: float = IDW_EPS) -> np.ndarray:
+    """Weighted mean of vals over neighbour sets (last axis)."""
+    v = np.asarray(vals)[idx]
+    return np.sum(weights * v, axis=-1) / (np.sum(weights, axis=-1) + eps)
+
+
+def idw_row_bytes(ncols: int, k: int, nstations: int, dense: bool, itemsize: int = 4) -> int:
+    """
+    Peak working bytes of one grid row in idw_grid(): float64 xyz, then
+    per neighbour the float64 chord, intp index and angle temporaries plus
+    about six itemsize weight/value temporaries, and for the dense search
+    a dot product + argpartition per station.
+    """
+    per_px = 3 * 8 + k * (32 + 6 * itemsize)
+    if dense:
+        per_px += nstations * 16
+    return ncols * per_px
+
+
+def coverage_floor(deg: float, p: float, eps: float = IDW_EPS) -> float:
+    """Raw weight of a station deg degrees away: coverage halves about there."""
+    return float(1.0 / np.power(np.radians(deg) + eps, p))
+
+
+def _field_confs(fields, confs) -> list:
+    """Per field: (vals with NaN -> 0, confs with NaN stations -> 0, or None if complete)."""
+    out = []
+    for vals, _, _ in fields:
+        vals = np.asarray(vals)
+        missing = np.isnan(vals)
+        if missing.any():
+            out.append((np.where(missing, 0, vals).astype(vals.dtype),
+                        np.where(missing, 0, confs).astype(confs.dtype)))
+        else:
+            out.append((vals, None))
+    return out
+
+
+def idw_grid_fields(index: SphereIndex, fields, confs, lon_axis, lat_axis, k: int, p: float,
+                    coverage=None, chunk_rows: int = 64, max_bytes: int = None) -> list:
+    """
+    IDW-interpolate several station fields onto a lon x lat grid with one
+    neighbour search: fields is [(vals, vmin, vmax), ...] and coverage an
+    optional (levels, floor). Returns one float32 (lat, lon) grid per field,
+    then the coverage grid.
+
+    max_bytes switches to a memory budget: weights are computed in float32
+    and the row chunk (and the dense-search chunk) are sized so the working
+    set stays under the budget for this grid width and station count.
+    """
+    nout = len(fields) + (coverage is not None)
+    outs = [np.empty((len(lat_axis), len(lon_axis)), dtype=np.float32) for _ in range(nout)]
+    dense_chunk = 20000
+    dtype, eps = np.float64, IDW_EPS
+    if max_bytes:
+        dense = index.tree is None
+        row_bytes = idw_row_bytes(len(lon_axis), k, index.n, dense) + len(lon_axis) * k * 4 * (nout - 1)
+        chunk_rows = max(1, int(max_bytes // row_bytes))
+        dense_chunk = max(1, int(max_bytes // (index.n * 16 + k * 40)))
+        dtype, eps = np.float32, np.float32(IDW_EPS)
+    confs = np.asarray(confs, dtype=dtype)
+    fields = [(np.asarray(v, dtype=dtype), lo, hi) for v, lo, hi in fields]
+    prepared = _field_confs(fields, confs)
+    if coverage is not None:
+        levels = np.asarray(coverage[0], dtype=dtype)
+        floor = dtype(coverage[1])
+    for y0, y1, ang, idx in index.query_grid(lon_axis, lat_axis, k, chunk_rows=chunk_rows,
+                                             dense_chunk=dense_chunk):
+        if max_bytes:
+            ang = ang.astype(np.float32)
+        raw = 1.0 / np.power(ang + eps, p)
+        wts = raw * confs[idx]
+        den = np.sum(wts, axis=-1) + eps
+        for out, (_, vmin, vmax), (vals, fconfs) in zip(outs, fields, prepared):
+            if fconfs is None:
+                v = np.sum(wts * vals[idx], axis=-1) / den
+            else:
+                fw = raw * fconfs[idx]
+                v = idw_apply(fw, idx, vals, eps=eps)
+            if vmin is not None or vmax is not None:
+                v = np.clip(v, vmin, vmax)
+            out[y0:y1, :] = v
+        if coverage is not None:
+            outs[-1][y0:y1, :] = np.sum(raw * levels[idx], axis=-1) / (np.sum(raw, axis=-1) + floor)
+    return outs
+
+
+def idw_grid(index: SphereIndex, vals, confs, lon_axis, lat_axis,
+             k: int, p: float, vmin: float = None, vmax: float = None,
+             chunk_rows: int = 64, max_bytes: int = None) -> np.ndarray:
+    """IDW-interpolate station values onto a lon x lat grid (float32, rows = lat)."""
+    return idw_grid_fields(index, [(vals, vmin, vmax)], confs, lon_axis, lat_axis, k, p,
+                           chunk_rows=chunk_rows, max_bytes=max_bytes)[0]
+
+
+# ---------------------------------------------------------------------------
+# Coarse lat/lon grid + resampling to map sizes
+# ---------------------------------------------------------------------------
+
+def coarse_axes(deg: float) -> tuple:
+    """
+    Periodic lon axis (-180 .. 180-deg) and lat axis (90 .. -90, poles
+    included) of a regular grid with spacing deg.
+    """
+    nlon = int(round(360.0 / deg))
+    nlat = int(round(180.0 / deg)) + 1
+    lons = -180.0 + np.arange(nlon, dtype=np.float64) * (360.0 / nlon)
+    lats = np.linspace(90.0, -90.0, nlat, dtype=np.float64)
+    return lons, lats
+
+
+def _taps(pos, n: int, method: str, wrap: bool) -> tuple:
+    """
+    Interpolation taps along one axis for fractional sample positions pos
+    (in source-index units). Returns (idx, weights), each (ntaps, len(pos)).
+    Wrapping axes (longitude) index modulo n; others clamp at the edges.
+    """
+    if not wrap:
+        pos = np.clip(pos, 0.0, n - 1)
+    i0 = np.floor(pos).astype(np.intp)
+    t = pos - i0
+    if method == "bilinear":
+        offs = (0, 1)
+        wts = (1.0 - t, t)
+    elif method == "bicubic":
+        # Catmull-Rom
+        t2, t3 = t * t, t * t * t
+        offs = (-1, 0, 1, 2)
+        wts = (
+            -0.5 * t3 + t2 - 0.5 * t,
+            1.5 * t3 - 2.5 * t2 + 1.0,
+            -1.5 * t3 + 2.0 * t2 + 0.5 * t,
+            0.5 * t3 - 0.5 * t2,
+        )
+    else:
+        raise ValueError(f"unknown resample method: {method}")
+    idx = np.stack([(i0 + o) % n if wrap else np.clip(i0 + o, 0, n - 1) for o in offs])
+    return idx, np.stack(wts).astype(np.float32)
+
+
+def _map_taps(nlat: int, nlon: int, w: int, h: int, method: str, window=None) -> tuple:
+    xs, ys = grid_axes(w, h)
+    if window is not None:
+        x0, x1, y0, y1 = window
+        xs, ys = xs[x0:x1], ys[y0:y1]
+    xi, xw = _taps((xs + 180.0) * (nlon / 360.0), nlon, method, wrap=True)
+    yi, yw = _taps((90.0 - ys) * ((nlat - 1) / 180.0), nlat, method, wrap=False)
+    return xi, xw, yi, yw
+
+
+def resample_lonlat(grid, w: int, h: int, method: str = "bilinear",
+                    vmin: float = None, vmax: float = None, window=None) -> np.ndarray:
+    """
+    Resample a coarse_axes() grid (nlat, nlon) to a w x h equirectangular
+    map (pixel axes from grid_axes()). Longitude wraps across the dateline.
+    window=(x0, x1, y0, y1) returns only that part of the map.
+    """
+    grid = np.asarray(grid, dtype=np.float32)
+    nlat, nlon = grid.shape
+    xi, xw, yi, yw = _map_taps(nlat, nlon, w, h, method, window)
+
+    # Separable: along lon into (nlat, w), then along lat into (h, w)
+    tmp = np.zeros((nlat, xi.shape[1]), dtype=np.float32)
+    for i, wt in zip(xi, xw):
+        tmp += grid[:, i] * wt[None, :]
+    out = np.zeros((yi.shape[1], xi.shape[1]), dtype=np.float32)
+    for j, wt in zip(yi, yw):
+        out += tmp[j, :] * wt[:, None]
+    if vmin is not None or vmax is not None:
+        np.clip(out, vmin, vmax, out=out)
+    return out
+
+
+def resample_mask(mask, w: int, h: int, method: str = "bilinear") -> np.ndarray:
+    """Map pixels whose resampling taps touch any True node of a coarse mask."""
+    mask = np.asarray(mask, dtype=bool)
+    nlat, nlon = mask.shape
+    xi, _, yi, _ = _map_taps(nlat, nlon, w, h, method)
+    tmp = np.zeros((nlat, w), dtype=bool)
+    for i in xi:
+        tmp |= mask[:, i]
+    out = np.zeros((h, w), dtype=bool)
+    for j in yi:
+        out |= tmp[j, :]
+    return out
+
+
+def deviation_stats(approx, exact) -> dict:
+    """Max / p99 / mean absolute deviation between two grids."""
+    d = np.abs(np.asarray(approx, dtype=np.float64) - np.asarray(exact, dtype=np.float64))
+    return {"max": float(d.max()), "p99": float(np.percentile(d, 99)), "mean": float(d.mean())}
+
+
+# ---------------------------------------------------------------------------
+# Reusable sparse IDW operator (cached on disk per grid + station set)
+# ---------------------------------------------------------------------------
+
+def station_fingerprint(lons, lats, codes=None) -> str:
+    """Stable hash of the station set (codes and positions, in index order)."""
+    import hashlib
+    hsh = hashlib.sha1()
+    codes = codes if codes is not None else [""] * len(lons)
+    for code, lon, lat in zip(codes, lons, lats):
+        hsh.update(f"{code}:{lon:.4f}:{lat:.4f};".encode("utf-8"))
+    return hsh.hexdigest()
+
+
+class IdwOperator:
+    """
+    Sparse (npix x nstations) matrix of raw inverse-distance weights, k
+    non-zeros per row, for one output grid and one station set.
+
+    Confidence is applied at evaluation time, so the operator only depends
+    on station positions and survives confidence changes between runs:
+
+      v = W @ (conf * vals) / (W @ conf + eps)
+    """
+
+    def __init__(self, idx, wts, shape):
+        self.idx = idx              # (npix, k) station indices
+        self.wts = wts              # (npix, k) float32 1/(d + eps)**p
+        self.shape = tuple(shape)   # (h, w) of the output grid
+        self._csr = None
+
+    @classmethod
+    def build(cls, index: SphereIndex, lon_axis, lat_axis, k: int, p: float,
+              chunk_rows: int = 64, eps: float = IDW_EPS):
+        h, w = len(lat_axis), len(lon_axis)
+        idx_dtype = np.uint16 if index.n < 65536 else np.int32
+        idx = np.empty((h * w, k), dtype=idx_dtype)
+        wts = np.empty((h * w, k), dtype=np.float32)
+        for y0, y1, ang, nn in index.query_grid(lon_axis, lat_axis, k, chunk_rows=chunk_rows):
+            idx[y0 * w:y1 * w] = nn.reshape(-1, k)
+            wts[y0 * w:y1 * w] = (1.0 / np.power(ang + eps, p)).reshape(-1, k)
+        return cls(idx, wts, (h, w))
+
+    @staticmethod
+    def nbytes_for(npix: int, k: int, nstations: int) -> int:
+        return npix * k * ((2 if nstations < 65536 else 4) + 4)
+
+    def matrix(self):
+        """scipy.sparse CSR view of the operator (None without scipy)."""
+        if self._csr is None:
+            try:
+                from scipy.sparse import csr_matrix
+            except ImportError:
+                return None
+            npix, k = self.idx.shape
+            indptr = np.arange(0, npix * k + 1, k, dtype=np.int64)
+            nst = int(self.idx.max()) + 1 if self.idx.size else 0
+            self._csr = csr_matrix((self.wts.ravel(), self.idx.ravel().astype(np.int32), indptr),
+                                   shape=(npix, nst))
+        return self._csr
+
+    def apply_fields(self, fields, confs, coverage=None, eps: float = IDW_EPS, window=None) -> list:
+        """
+        Evaluate several station fields ([(vals, vmin, vmax), ...], NaN =
+        station has no value) and an optional (levels, floor) coverage
+        surface, slicing the operator once. window=(x0, x1, y0, y1)
+        evaluates only that block of the grid.
+        """
+        confs = np.asarray(confs, dtype=np.float64)
+        fields = [(np.asarray(v, dtype=np.float64), lo, hi) for v, lo, hi in fields]
+        shape, rows = self.shape, None
+        if window is not None and tuple(window) != (0, shape[1], 0, shape[0]):
+            x0, x1, y0, y1 = window
+            rows = (np.arange(y0, y1)[:, None] * shape[1] + np.arange(x0, x1)[None, :]).ravel()
+            shape = (y1 - y0, x1 - x0)
+        m = self.matrix()
+        if m is not None:
+            # Row slices keep each row's summation order, so a window is
+            # bit-identical to the same block of a full evaluation
+            if rows is not None:
+                m = m[rows]
+            n = m.shape[1]
+
+            def wsum(col):
+                return m @ col[:n]
+        else:
+            idx, wts = self.idx, self.wts
+            if rows is not None:
+                idx, wts = idx[rows], wts[rows]
+
+            def wsum(col):
+                return np.sum(wts * col[idx], axis=1)
+
+        den = wsum(confs)
+        outs = []
+        for (_, vmin, vmax), (vals, fconfs) in zip(fields, _field_confs(fields, confs)):
+            fden = den if fconfs is None else wsum(fconfs)
+            out = (wsum(confs * vals if fconfs is None else fconfs * vals) / (fden + eps))
+            out = out.astype(np.float32).reshape(shape)
+            if vmin is not None or vmax is not None:
+                np.clip(out, vmin, vmax, out=out)
+            outs.append(out)
+        if coverage is not None:
+            levels, floor = coverage
+            ones = np.ones(len(confs))
+            cov = wsum(np.asarray(levels, dtype=np.float64)) / (wsum(ones) + floor)
+            outs.append(cov.astype(np.float32).reshape(shape))
+        return outs
+
+    def apply(self, vals, confs, vmin: float = None, vmax: float = None,
+              eps: float = IDW_EPS, window=None) -> np.ndarray:
+        """Evaluate the field for station values (see apply_fields)."""
+        return self.apply_fields([(vals, vmin, vmax)], confs, eps=eps, window=window)[0]
+
+    def touches(self, station_mask) -> np.ndarray:
+        """(h, w) bool: grid points with any selected station among their neighbours."""
+        return np.asarray(station_mask, dtype=bool)[self.idx].any(axis=1).reshape(self.shape)
+
+    def save(self, path: str) -> None:
+        import os
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            np.savez(f, idx=self.idx, wts=self.wts, shape=np.array(self.shape))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as z:
+            return cls(z["idx"], z["wts"], tuple(int(v) for v in z["shape"]))
+
+
+def cached_operator(cache_dir: str, grid_tag: str, index: SphereIndex, lon_axis, lat_axis,
+                    k: int, p: float, fingerprint: str, log=None) -> IdwOperator:
+    """
+    Load the IdwOperator for (grid, k, p, station set) from cache_dir, or
+    build and store it. Operators for other station sets on the same grid
+    are removed, so the directory holds one file per grid.
+    """
+    import glob
+    import os
+    prefix = f"idw-{grid_tag}-k{k}-p{p:g}-"
+    path = os.path.join(cache_dir, f"{prefix}{fingerprint[:16]}.npz")
+    if os.path.exists(path):
+        try:
+            op = IdwOperator.load(path)
+            if op.shape == (len(lat_axis), len(lon_axis)):
+                if log:
+                    log(f"IDW cache hit: {os.path.basename(path)}")
+                return op
+        except Exception as e:
+            if log:
+                log(f"IDW cache unreadable ({e}); rebuilding")
+
+    op = IdwOperator.build(index, lon_axis, lat_axis, k, p)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for old in glob.glob(os.path.join(cache_dir, f"{prefix}*.npz")):
+            if old != path:
+                os.unlink(old)
+        op.save(path)
+        if log:
+            log(f"IDW cache stored: {os.path.basename(path)}")
+    except OSError as e:
+        if log:
+            log(f"IDW cache not written ({e})")
+    return op
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+lib_sizes.py - shared size selection for OHB map generators (python side)
+
+Same precedence as lib_sizes.sh:
+  1) OHB_SIZES env var: "660x330,1320x660"
+  2) OHB_SIZES=... in /opt/hamclock-backend/etc/ohb-sizes.conf
+  3) map_sizes.txt next to this file (empty lines and comments ignored)
+"""
+
+import os
+import re
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SIZES_CONF = "/opt/hamclock-backend/etc/ohb-sizes.conf"
+SIZES_FILE = os.path.join(SCRIPT_DIR, "map_sizes.txt")
+
+_SIZE_RE = re.compile(r"^[0-9]+x[0-9]+$")
+
+
+def parse_sizes(raw: str) -> list:
+    """Parse "660x330,1320x660" into [(660, 330), ...], deduped, order kept."""
+    out = []
+    for s in re.sub(r"\s+", "", raw or "").split(","):
+        if not s:
+            continue
+        if not _SIZE_RE.match(s):
+            raise ValueError(f"invalid size '{s}' (expected WxH like 660x330)")
+        wh = tuple(int(v) for v in s.split("x"))
+        if wh not in out:
+            out.append(wh)
+    return out
+
+
+def _conf_sizes(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                m = re.match(r'^\s*(?:export\s+)?OHB_SIZES=["\']?([^"\'#]*)', line)
+                if m:
+                    return m.group(1)
+    except OSError:
+        pass
+    return ""
+
+
+def default_sizes(path: str = SIZES_FILE) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [ln.strip() for ln in f]
+    return parse_sizes(",".join(ln for ln in lines if ln and not ln.startswith("#")))
+
+
+def load_sizes() -> list:
+    raw = os.environ.get("OHB_SIZES") or _conf_sizes(SIZES_CONF)
+    sizes = parse_sizes(raw) if raw else default_sizes()
+    if not sizes:
+        raise ValueError("empty size list")
+    return sizes
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+lib_zlib.py - multi-core deflate that still produces one standard zlib stream
+
+The buffer is cut into blocks that are deflated on several threads (zlib
+releases the GIL while compressing). Every block but the last ends with a
+sync flush, so the raw deflate pieces concatenate into one valid stream;
+each block is primed with the previous 32 KiB as a dictionary so the
+compression ratio stays close to a single-threaded zlib.compress(). The
+Adler-32 of the whole input is stitched from the per-block checksums, so
+any zlib decompressor (HamClock included) reads the result unchanged.
+
+Importable:
+
+  from lib_zlib import compress, ParallelCompressobj
+  data_z = compress(bmp_bytes, level=9, workers=4)
+
+  z = ParallelCompressobj(level=9, workers=4)   # zlib.compressobj() API
+  out.write(z.compress(chunk)); ...; out.write(z.flush())
+
+Benchmark against zlib.compress (any file; .z inputs are decompressed first):
+
+  lib_zlib.py bench map-D-7920x3960-Countries.bmp.z [--workers 4] [--block-kb 1024]
+
+Dependencies: python3
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+ADLER_BASE = 65521
+WINDOW = 32768
+DEFAULT_BLOCK = 1 << 20
+
+
+def adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    """Adler-32 of A+B from adler32(A), adler32(B) and len(B) (zlib's adler32_combine)."""
+    rem = len2 % ADLER_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % ADLER_BASE
+    sum1 += (adler2 & 0xFFFF) + ADLER_BASE - 1
+    sum2 += ((adler1 >> 16) & 0xFFFF) + ((adler2 >> 16) & 0xFFFF) + ADLER_BASE - rem
+    if sum1 >= ADLER_BASE:
+        sum1 -= ADLER_BASE
+    if sum1 >= ADLER_BASE:
+        sum1 -= ADLER_BASE
+    if sum2 >= ADLER_BASE << 1:
+        sum2 -= ADLER_BASE << 1
+    if sum2 >= ADLER_BASE:
+        sum2 -= ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def zlib_header(level: int) -> bytes:
+    """2-byte zlib header (deflate, 32K window) with the level hint zlib itself writes."""
+    flevel = 0 if level in (0, 1) else 1 if level in (2, 3, 4, 5) else 2 if level == 6 or level < 0 else 3
+    cmf = 0x78
+    flg = flevel << 6
+    flg += 31 - ((cmf << 8) + flg) % 31
+    return bytes((cmf, flg))
+
+
+def _deflate_block(block: bytes, dictionary: bytes, level: int, last: bool) -> tuple:
+    """Raw-deflate one block; returns (data, adler32(block), len(block))."""
+    kw = {"zdict": dictionary} if dictionary else {}
+    c = zlib.compressobj(level, zlib.DEFLATED, -15, **kw)
+    data = c.compress(block) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return data, zlib.adler32(block), len(block)
+
+
+class ParallelCompressobj:
+    """
+    zlib.compressobj() look-alike: compress() buffers input and deflates
+    whole blocks, workers at a time; flush() finishes the stream. At most
+    workers * block_size bytes of input are held at once. close() (or
+    leaving a with block) stops the threads of a stream that is abandoned
+    before flush().
+    """
+
+    def __init__(self, level: int = 9, workers: int = 0, block_size: int = DEFAULT_BLOCK):
+        self.level = level
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.block_size = max(WINDOW, block_size)
+        self._pending = bytearray()
+        self._dict = b""
+        self._adler = 1
+        self._started = False
+        self._pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+    def _run(self, blocks: list, last: bool) -> bytes:
+        jobs = []
+        prev = self._dict
+        for i, block in enumerate(blocks):
+            jobs.append((block, prev, self.level, last and i == len(blocks) - 1))
+            prev = block[-WINDOW:]
+        self._dict = prev
+        if self._pool is not None and len(jobs) > 1:
+            results = list(self._pool.map(lambda j: _deflate_block(*j), jobs))
+        else:
+            results = [_deflate_block(*j) for j in jobs]
+
+        out = [] if self._started else [zlib_header(self.level)]
+        self._started = True
+        for data, adler, n in results:
+            self._adler = adler32_combine(self._adler, adler, n)
+            out.append(data)
+        return b"".join(out)
+
+    def compress(self, data) -> bytes:
+        self._pending += data
+        batch = self.block_size * self.workers
+        # Keep at least one byte back so flush() always has a final block
+        if len(self._pending) <= batch:
+            return b""
+        nblocks = (len(self._pending) - 1) // self.block_size
+        cut = nblocks * self.block_size
+        blocks = [bytes(self._pending[i:i + self.block_size]) for i in range(0, cut, self.block_size)]
+        del self._pending[:cut]
+        return self._run(blocks, last=False)
+
+    def flush(self) -> bytes:
+        data = bytes(self._pending)
+        self._pending = bytearray()
+        blocks = [data[i:i + self.block_size] for i in range(0, len(data), self.block_size)] or [b""]
+        out = self._run(blocks, last=True) + struct.pack(">I", self._adler)
+        self.close()
+        return out
+
+    def close(self) -> None:
+        """Stop the worker threads, dropping queued blocks; the stream cannot continue."""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        self._pending = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def compressobj(level: int = 9, workers: int = 1, block_size: int = DEFAULT_BLOCK):
+    """zlib.compressobj(level) for workers == 1, else a ParallelCompressobj."""
+    if workers == 1:
+        return zlib.compressobj(level)
+    return ParallelCompressobj(level, workers, block_size)
+
+
+def compress(data, level: int = 9, workers: int = 0, block_size: int = DEFAULT_BLOCK) -> bytes:
+    """One zlib stream of data, deflated on several cores."""
+    c = ParallelCompressobj(level, workers, block_size)
+    return c.compress(data) + c.flush()
+
+
+def _bench(path: str, level: int, workers: int, block_kb: int, repeat: int) -> None:
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".z"):
+        data = zlib.decompress(data)
+    print(f"{os.path.basename(path)}: {len(data)} bytes, level {level}")
+
+    def best(fn):
+        t = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn()
+            t = min(t, time.perf_counter() - t0)
+        return out, t
+
+    ref, t_ref = best(lambda: zlib.compress(data, level))
+    print(f"  zlib.compress          {len(ref):>10} bytes  {t_ref:7.3f}s")
+    for n in sorted({1, workers}):
+        out, t = best(lambda: compress(data, level, n, block_kb * 1024))
+        ok = zlib.decompress(out) == data
+        print(f"  parallel workers={n:<3}  {len(out):>10} bytes  {t:7.3f}s  "
+              f"size {100.0 * len(out) / len(ref):6.2f}%  speedup {t_ref / t:5.2f}x  "
+              f"{'ok' if ok else 'MISMATCH'}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="parallel deflate producing one zlib stream")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    bench = sub.add_parser("bench", help="compare size/time with zlib.compress")
+    bench.add_argument("files", nargs="+")
+    bench.add_argument("--level", type=int, default=9)
+    bench.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    bench.add_argument("--block-kb", type=int, default=DEFAULT_BLOCK // 1024)
+    bench.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    for path in args.files:
+        try:
+            _bench(path, args.level, workers, args.block_kb, args.repeat)
+        except (OSError, zlib.error) as e:
+            print(f"ERROR: {path}: {e}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -10,69 +10,111 @@ exceeded on half the days of the month). Matches HamClock user guide:
 Fallback: for long/multi-hop paths where dvoacap returns all zeros,
 estimates MUF from a simplified foF2 model at the path midpoint.
 
+--engine fast evaluates that model alone over the whole grid as array
+operations (no dvoacap, no worker pool): a sub-second preview tier.
+--compare-engines reports how far it is from dvoacap over REFERENCE_TX.
+
 Grid → scipy bicubic interpolation → full-resolution PNG.
 Color scale: jet 3–35 MHz (same as the freq legend bar).
+
+Adaptive mode (--max-predictions N): start from a ~20° subset of the --grid
+lattice and spend the remaining dvoacap calls on the cells with the largest
+estimated interpolation error (terminator, skip zone, auroral ovals); cells
+left unrefined are filled bilinearly. A budget below the coarsest start
+lattice is rejected rather than exceeded.
+
+Batch mode (--batch-tx LIST --batch-hours 0-23) pre-generates every
+(TX, UTC hour) map into the --cache-dir layout with one warm worker pool;
+results stream back per chunk and each map is written as soon as it is
+complete. Later requests are then cache hits, as long as their --cache-ttl
+covers the age of the batch.
+
+Service mode (--serve SOCKET) keeps the imports and a warm worker pool
+resident behind a Unix socket; map runs pass --service SOCKET and fall back
+to computing locally when it is not up. Identical in-flight requests share
+one computation, and --coarse returns the fast-engine map at once while
+the dvoacap map finishes in the background (and lands in the cache).
+The service is opt-in: no OHB job calls muf_map.py, so whoever runs maps
+with --service also starts (and supervises) muf_map.py --serve SOCKET.
+
+Results are cached in --cache-dir under an sqlite index with LRU eviction
+beyond --cache-max-mb; --cache-stats reports hits, misses and the most
+used entries. Maps are computed for the exact TX and SSN by default. With
+--cache-cell (e.g. subsquare) TX is snapped to the centre of that cell and
+with --ssn-bucket SSN is rounded to its steps before the map is computed,
+so nearby stations share entries at the cost of drawing the cell's map.
+
+SSN tables (--build-tables DIR) hold dvoacap grids per TX cell, month and
+UTC hour at a few SSN anchors; with --tables DIR a request interpolates
+between the anchors instead of running dvoacap (build and look up with the
+same --cache-cell, e.g. subsquare, so requests land on the built cells). --table-error measures
+that interpolation against direct dvoacap runs to pick the anchor spacing.
+
+--format picks the encoding: png (zlib --png-level, no optimize pass),
+rgb565 (raw little-endian top-down pixels, no header) or bmpz (the BMPv4
+RGB565 .bmp.z of the HamClock maps directory, as build_muf_rt.py writes
+it). Each format is cached as its own entry.
 """
-import argparse, hashlib, io, math, os, sys, time
+import argparse, functools, hashlib, heapq, io, itertools, json, math, os, sqlite3, sys, threading, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+import multiprocessing
 from multiprocessing import Pool, cpu_count
 from pathlib import Path
 import numpy as np
 
+from lib_bmp import DECODED_CACHE_DIR, decoded_map, encode_bmp, rgb888_to_rgb565
+from lib_cpt import get_palette
+
 # Probe frequencies to bracket the median MUF
 PROBE_FREQS = [3.5, 7.0, 14.0, 21.0, 28.0]
 MUF_MIN =  3.0
 MUF_MAX = 35.0
 
+# Skip zone: F2 reflection needs a minimum path of ~300-500 km
+EARTH_R_KM   = 6371.0
+SKIP_ZONE_KM = 500.0
+
 
 # ---------------------------------------------------------------------------
 # Jet colormap: blue(3MHz) → cyan → green → yellow → orange → red(35MHz)
+# (shared palette definition lives in lib_cpt.py)
 # ---------------------------------------------------------------------------
-def _jet(t):
-    t = max(0.0, min(1.0, t))
-    if   t < 0.125: return (0,   int(128 + t/0.125*127),         255)
-    elif t < 0.375: return (0,   255,                             int(255-(t-0.125)/0.25*255))
-    elif t < 0.625: return (int((t-0.375)/0.25*255), 255,        int(255-(t-0.375)/0.25*255))
-    elif t < 0.875: return (255, int(255-(t-0.625)/0.25*255),    0)
-    else:           return (int(255-(t-0.875)/0.125*128), 0,     0)
-
 def mhz_to_rgba(mhz):
-    t = max(0.0, min(1.0, (mhz - MUF_MIN) / (MUF_MAX - MUF_MIN)))
-    r, g, b = _jet(t)
+    r, g, b = get_palette('muf-jet').rgb(mhz)
     return (r, g, b, 255)
 
 
 # ---------------------------------------------------------------------------
-# foF2 fallback model — used when dvoacap fails for long paths
+# foF2 fallback model — used when dvoacap fails for long paths, and alone by
+# --engine fast. Takes scalars or numpy arrays (RX points) alike.
 # ---------------------------------------------------------------------------
 def _solar_dec(month):
     return 23.45 * math.sin(math.radians(360/365 * ((month-1)*30.4+15 - 81)))
 
 def _cos_zenith(lat, lng, utc, month):
     decl = math.radians(_solar_dec(month))
-    ha   = math.radians(lng - (-15.0*(utc-12.0)))
-    la   = math.radians(lat)
-    return math.sin(la)*math.sin(decl) + math.cos(la)*math.cos(decl)*math.cos(ha)
+    ha   = np.radians(lng - (-15.0*(utc-12.0)))
+    la   = np.radians(lat)
+    return np.sin(la)*math.sin(decl) + np.cos(la)*math.cos(decl)*np.cos(ha)
 
 def _foF2(lat, lng, utc, month, ssn):
     cz      = _cos_zenith(lat, lng, utc, month)
-    abs_lat = abs(lat)
+    abs_lat = np.abs(lat)
     ssn_f   = 1.0 + ssn / 100.0
-    lat_f   = max(0.20, math.cos(math.radians(min(85, abs_lat) * 0.90)))
-    if cz > 0:
-        fof2 = 7.0 * ssn_f * max(0.15, cz**0.25) * lat_f
-    else:
-        lf = max(0.15, 1.0 - abs_lat / 85.0)
-        if cz > -0.07:
-            lf *= 1.0 + 0.4*(cz+0.07)/0.07
-        fof2 = 1.6 * ssn_f * lf
-    return max(1.5, min(12.0, fof2))
+    lat_f   = np.maximum(0.20, np.cos(np.radians(np.minimum(85, abs_lat) * 0.90)))
+    day     = 7.0 * ssn_f * np.maximum(0.15, np.maximum(cz, 0.0)**0.25) * lat_f
+    lf      = np.maximum(0.15, 1.0 - abs_lat / 85.0)
+    lf      = np.where(cz > -0.07, lf * (1.0 + 0.4*(cz+0.07)/0.07), lf)
+    night   = 1.6 * ssn_f * lf
+    return np.clip(np.where(cz > 0, day, night), 1.5, 12.0)
 
 def _great_circle_km(la1, lo1, la2, lo2):
-    R = 6371.0
-    la1,lo1,la2,lo2 = map(math.radians, [la1,lo1,la2,lo2])
-    a = (math.sin((la2-la1)/2)**2 +
-         math.cos(la1)*math.cos(la2)*math.sin((lo2-lo1)/2)**2)
-    return 2*R*math.asin(math.sqrt(max(0.0, min(1.0, a))))
+    R = EARTH_R_KM
+    la1,lo1,la2,lo2 = map(np.radians, [la1,lo1,la2,lo2])
+    a = (np.sin((la2-la1)/2)**2 +
+         np.cos(la1)*np.cos(la2)*np.sin((lo2-lo1)/2)**2)
+    return 2*R*np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
 
 def _fallback_muf(tx_lat, tx_lng, rx_lat, rx_lng, utc, month, ssn):
     """
@@ -88,40 +130,74 @@ def _fallback_muf(tx_lat, tx_lng, rx_lat, rx_lng, utc, month, ssn):
     fof2_mid = _foF2(mid_lat, mid_lng, utc, month, ssn)
     fof2_rx  = _foF2(rx_lat,  rx_lng,  utc, month, ssn)
     # MUF is limited by the weakest hop
-    fof2 = min(fof2_tx, fof2_mid, fof2_rx)
+    fof2 = np.minimum(np.minimum(fof2_tx, fof2_mid), fof2_rx)
 
     # M-factor by distance
-    if dist < 100:
-        m = 1.1
-    elif dist < 4000:
-        m = 2.5 + 1.0 * min(1.0, dist/3000.0)
-    elif dist < 8000:
-        m = 3.5 - 0.5*(dist-4000)/4000.0
-    else:
-        m = max(1.8, 3.0 - 0.8*(dist-8000)/4000.0)
-    return max(MUF_MIN, min(MUF_MAX, fof2 * m))
+    m = np.select(
+        [dist < 100, dist < 4000, dist < 8000],
+        [1.1,
+         2.5 + 1.0 * np.minimum(1.0, dist/3000.0),
+         3.5 - 0.5*(dist-4000)/4000.0],
+        np.maximum(1.8, 3.0 - 0.8*(dist-8000)/4000.0))
+    muf = np.clip(fof2 * m, MUF_MIN, MUF_MAX)
+    return float(muf) if muf.ndim == 0 else muf
+
+
+def fast_muf_grid(tx_lat, tx_lng, utc, month, ssn, grid_lats, grid_lngs):
+    """--engine fast: the fallback model over the whole (lat, lng) grid at once."""
+    la, lo = np.meshgrid(grid_lats, grid_lngs, indexing='ij')
+    return _fallback_muf(tx_lat, tx_lng, la, lo, utc, month, ssn)
+
+
+# TX sites for --compare-engines: mid/high/low latitudes, both hemispheres
+REFERENCE_TX = [
+    ('W1AW Newington',  41.71,  -72.73),
+    ('London',          51.50,   -0.12),
+    ('Tokyo',           35.68,  139.69),
+    ('Sydney',         -33.87,  151.21),
+    ('Cape Town',      -33.92,   18.42),
+    ('Anchorage',       61.22, -149.90),
+    ('Buenos Aires',   -34.60,  -58.38),
+    ('Honolulu',        21.31, -157.86),
+    ('Reykjavik',       64.15,  -21.94),
+    ('Singapore',        1.35,  103.82),
+]
 
 
 # ---------------------------------------------------------------------------
 # dvoacap worker — one engine per process
 # ---------------------------------------------------------------------------
 def _worker_init(tx_lat, tx_lng, utc, ssn, month):
-    global _engine, _tx_lat, _tx_lng, _utc, _ssn, _month
+    global _engine
     import numpy as _np
-    from dvoacap.path_geometry import GeoPoint
     from dvoacap.prediction_engine import PredictionEngine
     _engine = PredictionEngine()
-    _engine.params.ssn                  = float(ssn)
-    _engine.params.month                = int(month)
-    _engine.params.tx_location          = GeoPoint.from_degrees(tx_lat, tx_lng)
+    _worker_set(tx_lat, tx_lng, utc, ssn, month)
     _engine.params.tx_power             = 100.0
     _engine.params.min_angle            = _np.deg2rad(3.0)
     _engine.params.long_path            = False
     _engine.params.required_snr         = 3.0
     _engine.params.required_reliability = 0.1
+
+
+def _worker_set(tx_lat, tx_lng, utc, ssn, month):
+    """Point this worker's (already warm) engine at another TX / hour / month."""
+    global _tx_lat, _tx_lng, _utc, _ssn, _month
+    from dvoacap.path_geometry import GeoPoint
+    _engine.params.ssn                  = float(ssn)
+    _engine.params.month                = int(month)
+    _engine.params.tx_location          = GeoPoint.from_degrees(tx_lat, tx_lng)
     _tx_lat, _tx_lng, _utc, _ssn, _month = tx_lat, tx_lng, utc, ssn, month
 
 
+def _worker_batch(task):
+    """Batch mode: (key, tx_lat, tx_lng, utc, ssn, month, points) -> (key, results)."""
+    key, tx_lat, tx_lng, utc, ssn, month, points = task
+    if (tx_lat, tx_lng, utc, ssn, month) != (_tx_lat, _tx_lng, _utc, _ssn, _month):
+        _worker_set(tx_lat, tx_lng, utc, ssn, month)
+    return key, [_worker_predict(p) for p in points]
+
+
 def _worker_predict(args):
     """
     Returns (rx_lat, rx_lng, muf_mhz) where muf_mhz is the median MUF
@@ -175,9 +251,171 @@ def build_grid(grid_deg):
     return [(float(la), float(lo)) for la in lats for lo in lngs], lats, lngs
 
 
+# ---------------------------------------------------------------------------
+# Adaptive grid
+# ---------------------------------------------------------------------------
+ADAPTIVE_START_DEG = 20.0
+ADAPTIVE_TOL_MHZ   = 0.1
+
+
+def _bilinear(muf, cell, ii, jj):
+    """Bilinear estimate inside cell (i0, i1, j0, j1) from its corners; j1 may equal ncols (wrap)."""
+    i0, i1, j0, j1 = cell
+    n  = muf.shape[1]
+    ti = (ii - i0) / (i1 - i0) if i1 > i0 else np.zeros_like(ii, dtype=float)
+    tj = (jj - j0) / (j1 - j0)
+    c00, c01 = muf[i0, j0], muf[i0, j1 % n]
+    c10, c11 = muf[i1, j0], muf[i1, j1 % n]
+    return ((1-ti)*(1-tj)*c00 + (1-ti)*tj*c01 +
+            ti*(1-tj)*c10 + ti*tj*c11)
+
+
+def _split(cell):
+    """Refinement of a cell: (new points, child cells); no points if it is one lattice step."""
+    i0, i1, j0, j1 = cell
+    im = (i0 + i1) // 2 if i1 - i0 >= 2 else None
+    jm = (j0 + j1) // 2 if j1 - j0 >= 2 else None
+    ris = [i0, i1] if im is None else [i0, im, i1]
+    rjs = [j0, j1] if jm is None else [j0, jm, j1]
+    pts = [(i, j) for i in ris for j in rjs
+           if (i, j) not in ((i0, j0), (i0, j1), (i1, j0), (i1, j1))]
+    kids = [(a, b, c, d) for a, b in zip(ris, ris[1:]) for c, d in zip(rjs, rjs[1:])]
+    return pts, kids
+
+
+def _start_lattice(nlat, nlng, grid_deg, max_predictions):
+    """(rows, cols, step) of the adaptive start lattice, coarsened (as far as it goes) to fit the budget."""
+    step = 1
+    while step * 2 * grid_deg <= ADAPTIVE_START_DEG and nlng % (step * 2) == 0:
+        step *= 2
+    # A budget below the start lattice gets a coarser start
+    while (len(range(0, nlat, step)) + 1) * (nlng // step) > max_predictions \
+            and nlng % (step * 2) == 0 and step * 2 < nlat:
+        step *= 2
+    rows = sorted(set(range(0, nlat, step)) | {nlat - 1})
+    cols = list(range(0, nlng, step))
+    return rows, cols, step
+
+
+def adaptive_min_predictions(grid_deg):
+    """Smallest --max-predictions adaptive mode can keep to: the coarsest start lattice."""
+    _, lats, lngs = build_grid(grid_deg)
+    rows, cols, _ = _start_lattice(len(lats), len(lngs), grid_deg, 0)
+    return len(rows) * len(cols)
+
+
+def adaptive_grid(predict, grid_deg, max_predictions, tol=ADAPTIVE_TOL_MHZ, batch=64):
+    """
+    MUF on the build_grid(grid_deg) lattice from at most max_predictions
+    calls of predict([(lat, lng), ...]) -> [(lat, lng, mhz), ...].
+
+    A ~ADAPTIVE_START_DEG subset of the lattice is predicted first. Cells
+    are then refined (edge midpoints + centre) in order of estimated
+    linear-interpolation error: second differences of the coarse lattice
+    to begin with, then a quarter of the error actually seen at the points
+    a cell's parent added. Cells estimated below tol are not refined.
+    Raises ValueError when max_predictions is below the coarsest start
+    lattice (adaptive_min_predictions). Returns (muf_grid, grid_lats,
+    grid_lngs, results).
+    """
+    _, lats, lngs = build_grid(grid_deg)
+    nlat, nlng = len(lats), len(lngs)
+    muf = np.full((nlat, nlng), np.nan)
+    results = []
+
+    rows, cols, step = _start_lattice(nlat, nlng, grid_deg, max_predictions)
+    if len(rows) * len(cols) > max_predictions:
+        raise ValueError(f"max_predictions {max_predictions} is below the {len(rows) * len(cols)}-point "
+                         f"start lattice of a {grid_deg:g} deg grid")
+
+    def run(idx):
+        idx = [p for p in dict.fromkeys(idx) if np.isnan(muf[p])]
+        res = predict([(float(lats[i]), float(lngs[j])) for i, j in idx]) if idx else []
+        for (i, j), r in zip(idx, res):
+            muf[i, j] = r[2]
+        results.extend(res)
+
+    run([(i, j) for i in rows for j in cols])
+
+    # Error estimate of the start cells: |second difference| / 8 at their corners
+    coarse = muf[np.ix_(rows, cols)]
+    d2 = np.abs(np.roll(coarse, 1, axis=1) - 2*coarse + np.roll(coarse, -1, axis=1))
+    d2lat = np.zeros_like(coarse)
+    d2lat[1:-1] = np.abs(coarse[:-2] - 2*coarse[1:-1] + coarse[2:])
+    corner_err = np.maximum(d2, d2lat) / 8.0
+
+    heap, seq = [], 0
+    for a, (i0, i1) in enumerate(zip(rows, rows[1:])):
+        for b, j0 in enumerate(cols):
+            b1 = (b + 1) % len(cols)
+            err = max(corner_err[a, b], corner_err[a, b1], corner_err[a+1, b], corner_err[a+1, b1])
+            heapq.heappush(heap, (-err, seq, (i0, i1, j0, j0 + step)))
+            seq += 1
+
+    while heap and len(results) < max_predictions and -heap[0][0] >= tol:
+        chosen, new = [], set()
+        while heap and len(chosen) < batch and -heap[0][0] >= tol:
+            pts, _ = _split(heap[0][2])
+            pts = {(i, j % nlng) for i, j in pts if np.isnan(muf[i, j % nlng])} - new
+            if len(results) + len(new) + len(pts) > max_predictions:
+                break
+            new |= pts
+            chosen.append(heapq.heappop(heap)[2])
+        if not chosen:
+            break
+        run(sorted(new))
+        for cell in chosen:
+            pts, kids = _split(cell)
+            ii = np.array([i for i, _ in pts], dtype=float)
+            jj = np.array([j for _, j in pts], dtype=float)
+            seen = muf[ii.astype(int), jj.astype(int) % nlng]
+            err = float(np.max(np.abs(seen - _bilinear(muf, cell, ii, jj)))) / 4.0
+            for kid in kids:
+                if _split(kid)[0]:
+                    heapq.heappush(heap, (-err, seq, kid))
+                    seq += 1
+
+    # Unrefined cells: bilinear from their corners
+    for _, _, cell in heap:
+        i0, i1, j0, j1 = cell
+        ii, jj = np.meshgrid(np.arange(i0, i1 + 1), np.arange(j0, j1 + 1), indexing='ij')
+        hole = np.isnan(muf[ii, jj % nlng])
+        if hole.any():
+            muf[ii[hole], jj[hole] % nlng] = _bilinear(muf, cell, ii[hole].astype(float),
+                                                       jj[hole].astype(float))
+    return muf, lats, lngs, results
+
+
 # ---------------------------------------------------------------------------
 # Render
 # ---------------------------------------------------------------------------
+@functools.lru_cache(maxsize=64)
+def skip_zone(tx_lat, tx_lng, width, height):
+    """
+    Skip-zone blend for one TX and map size: (row0, row1, near, weight)
+    where near marks pixels of rows row0..row1 within SKIP_ZONE_KM of TX
+    and weight is (dist / SKIP_ZONE_KM) ** 1.5 there. Only that row band
+    can be in range (distance >= R * |dlat|). Cached per process, so
+    repeated renders for a TX reuse it.
+    """
+    lats = 90.0 - np.arange(height) * 180.0 / height
+    band = np.flatnonzero(np.abs(np.radians(lats - tx_lat)) * EARTH_R_KM < SKIP_ZONE_KM)
+    if band.size == 0:
+        return 0, 0, np.zeros((0, width), bool), np.zeros((0, width))
+    row0, row1 = int(band[0]), int(band[-1]) + 1
+    la = np.radians(lats[row0:row1])[:, None]
+    lo = np.radians(-180.0 + np.arange(width) * 360.0 / width)[None, :]
+    la1, lo1 = math.radians(tx_lat), math.radians(tx_lng)
+    a = (np.sin((la - la1) / 2) ** 2 +
+         math.cos(la1) * np.cos(la) * np.sin((lo - lo1) / 2) ** 2)
+    dist = 2 * EARTH_R_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    near = dist < SKIP_ZONE_KM
+    weight = np.where(near, dist / SKIP_ZONE_KM, 1.0) ** 1.5
+    near.flags.writeable = False
+    weight.flags.writeable = False
+    return row0, row1, near, weight
+
+
 def render_map(muf_grid, grid_lats, grid_lngs,
                tx_lat, tx_lng, utc, month,
                width=660, height=330):
@@ -194,24 +432,12 @@ def render_map(muf_grid, grid_lats, grid_lngs,
     ll, gg   = np.meshgrid(map_lats, map_lngs, indexing='ij')
     full     = interp(np.stack([ll.ravel(), gg.ravel()], axis=-1)).reshape(height, width)
 
-    # Pre-compute TX pixel
-    tx_px = (tx_lng + 180) / 360 * width
-    tx_py = (90 - tx_lat)  / 180 * height
-
-    # Pixel colors
-    rgba = np.zeros((height, width, 4), dtype=np.uint8)
-    for row in range(height):
-        lat = 90.0 - row * 180.0 / height
-        for col in range(width):
-            lng = -180.0 + col * 360.0 / width
-            mhz = float(full[row, col])
-            # Skip zone: F2 reflection needs minimum path ~300-500km
-            # Blend toward MUF_MIN within 500km of TX
-            dist = _great_circle_km(tx_lat, tx_lng, lat, lng)
-            if dist < 500:
-                t    = dist / 500.0
-                mhz  = MUF_MIN + (mhz - MUF_MIN) * (t ** 1.5)
-            rgba[row, col] = mhz_to_rgba(mhz)
+    # Skip zone: blend toward MUF_MIN within SKIP_ZONE_KM of TX, then
+    # colorize the whole grid in one LUT lookup
+    row0, row1, near, weight = skip_zone(float(tx_lat), float(tx_lng), width, height)
+    band = full[row0:row1]
+    band[near] = MUF_MIN + (band[near] - MUF_MIN) * weight[near]
+    rgba = get_palette('muf-jet').colorize(full)
 
     img  = Image.fromarray(rgba, 'RGBA')
     draw = ImageDraw.Draw(img)
@@ -224,116 +450,960 @@ def render_map(muf_grid, grid_lats, grid_lngs,
     draw.ellipse([(tx_x-2, tx_y-2),(tx_x+2, tx_y+2)],
                  fill=(255,255,255,255))
 
-    img = _overlay_borders(img, width, height)
+    mask = border_mask(width, height)
+    if mask is not None:
+        rgba = np.array(img)
+        rgba[mask, :3] = _border_shade()[rgba[mask, :3]]
+        img = Image.fromarray(rgba, 'RGBA')
     return img
 
 
-def _overlay_borders(img, width, height):
+# Country borders: the bright lines of a Countries base map, as a bit mask per
+# output size. Masks are built once (resizing another size's map if needed),
+# stored packed 8 px/byte as .npy next to lib_bmp's decoded maps and
+# memory-mapped on every later render; a .src stamp beside each mask records
+# which base map (path, size, mtime) it came from.
+BORDER_MAPS_DIR  = '/opt/hamclock-backend/htdocs/ham/HamClock/maps'
+BORDER_CACHE_DIR = os.path.join(DECODED_CACHE_DIR, 'borders') if DECODED_CACHE_DIR else ''
+BORDER_ALPHA     = 200
+
+
+def _border_candidates(base_dir, width, height):
     import glob as _glob
-    from PIL import Image
-    base_dir = '/opt/hamclock-backend/htdocs/ham/HamClock/maps'
-    all_bmps = sorted(_glob.glob(f'{base_dir}/map-*-Countries.bmp'),
+    yield f'{base_dir}/map-N-{width}x{height}-Countries.bmp'
+    yield f'{base_dir}/map-D-{width}x{height}-Countries.bmp'
+    # Other sizes only if this one is missing (the glob is not free)
+    yield from sorted(_glob.glob(f'{base_dir}/map-*-Countries.bmp'),
                       key=lambda p: os.path.getsize(p))
-    candidates = ([f'{base_dir}/map-N-{width}x{height}-Countries.bmp',
-                   f'{base_dir}/map-D-{width}x{height}-Countries.bmp']
-                  + all_bmps)
-    for path in candidates:
-        if os.path.exists(path):
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return f"{path} {st.st_size} {st.st_mtime_ns}"
+
+
+def _cached_border_source(stamp_path, base_dir, width, height):
+    """Stamp of the base map the cached mask came from, if it is still the one to use."""
+    try:
+        with open(stamp_path, encoding='utf-8') as f:
+            stamp = f.read().strip()
+        src = stamp.rsplit(' ', 2)[0]
+        # An exact-size map that appeared since takes over from a resized one
+        for exact in itertools.islice(_border_candidates(base_dir, width, height), 2):
+            if exact == src:
+                break
+            if os.path.exists(exact):
+                return None
+        return stamp if _source_stamp(src) == stamp else None
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _tmp_suffix():
+    """Temp file suffix unique per process and thread (the service renders on several threads)."""
+    return f".tmp{os.getpid()}.{threading.get_ident()}"
+
+
+def _build_border_mask(path, width, height):
+    from PIL import Image
+    # Decoded once per source mtime, then memory-mapped (lib_bmp)
+    base = Image.fromarray(np.asarray(decoded_map(path)), 'RGB')
+    if base.size != (width, height):
+        base = base.resize((width, height))
+    arr  = np.array(base)
+    brightness = (arr[:,:,0].astype(int) +
+                  arr[:,:,1].astype(int) +
+                  arr[:,:,2].astype(int))
+    border     = brightness > 80
+    # Remove outermost edge pixels — the BMP has a frame border
+    border[ :3, :]  = False
+    border[-3:, :]  = False
+    border[:,  :3]  = False
+    border[:, -3:]  = False
+    return border
+
+
+def border_mask(width, height, base_dir=BORDER_MAPS_DIR, cache_dir=None):
+    """(height, width) bool country-border mask, or None when no Countries map is found."""
+    cache_dir = BORDER_CACHE_DIR if cache_dir is None else cache_dir
+    if cache_dir:
+        npy   = os.path.join(cache_dir, f'border-{width}x{height}.npy')
+        stamp = os.path.join(cache_dir, f'border-{width}x{height}.src')
+        if _cached_border_source(stamp, base_dir, width, height):
             try:
-                base = Image.open(path).convert('RGB').resize((width, height))
-                arr  = np.array(base)
-                brightness = (arr[:,:,0].astype(int) +
-                              arr[:,:,1].astype(int) +
-                              arr[:,:,2].astype(int))
-                border     = brightness > 80
-                # Remove outermost edge pixels — the BMP has a frame border
-                border[ :3, :]  = False
-                border[-3:, :]  = False
-                border[:,  :3]  = False
-                border[:, -3:]  = False
-                ov         = np.zeros((height, width, 4), dtype=np.uint8)
-                ov[border] = [0, 0, 0, 200]
-                return Image.alpha_composite(img, Image.fromarray(ov, 'RGBA'))
-            except Exception as e:
-                print(f"Border load failed: {e}", file=sys.stderr)
-    return img
+                packed = np.load(npy, mmap_mode='r')
+                return np.unpackbits(packed, axis=1, count=width).view(bool)
+            except (OSError, ValueError):
+                pass
+    for path in _border_candidates(base_dir, width, height):
+        if not os.path.exists(path):
+            continue
+        try:
+            mask = _build_border_mask(path, width, height)
+        except Exception as e:
+            print(f"Border load failed: {e}", file=sys.stderr)
+            continue
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = npy + _tmp_suffix()
+                with open(tmp, 'wb') as f:
+                    np.save(f, np.packbits(mask, axis=1))
+                os.replace(tmp, npy)
+                tmp = stamp + _tmp_suffix()
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(_source_stamp(path) + '\n')
+                os.replace(tmp, stamp)
+            except OSError as e:
+                print(f"Border cache not written: {e}", file=sys.stderr)
+        return mask
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _border_shade():
+    """uint8 LUT: channel value after compositing black at BORDER_ALPHA over it (as PIL does)."""
+    from PIL import Image
+    ramp = np.zeros((1, 256, 4), dtype=np.uint8)
+    ramp[..., :3] = np.arange(256, dtype=np.uint8)[None, :, None]
+    ramp[..., 3]  = 255
+    ov = np.zeros_like(ramp)
+    ov[..., 3] = BORDER_ALPHA
+    out = Image.alpha_composite(Image.fromarray(ramp, 'RGBA'), Image.fromarray(ov, 'RGBA'))
+    return np.asarray(out)[0, :, 0].copy()
+
+
+# ---------------------------------------------------------------------------
+# Result cache
+# ---------------------------------------------------------------------------
+# --cache-cell names: Maidenhead field / square / subsquare as (dlng, dlat)
+CACHE_CELLS = {'field': (20.0, 10.0), 'square': (2.0, 1.0), 'subsquare': (2.0 / 24, 1.0 / 24)}
+CACHE_INDEX = 'muf-index.sqlite'
+CACHE_MAX_MB = 512
+
+
+def cache_cell(spec):
+    """(dlng, dlat) of a --cache-cell (a CACHE_CELLS name or degrees), None for 0 = exact TX."""
+    if spec in CACHE_CELLS:
+        return CACHE_CELLS[spec]
+    deg = float(spec)
+    if not 0 <= deg <= 90:
+        raise ValueError(f"cache cell out of range: {spec}")
+    return (deg, deg) if deg else None
+
+
+def quantize_tx(tx_lat, tx_lng, cell):
+    """Centre of the cell (see cache_cell) holding the TX; the TX itself when cell is None."""
+    if cell is None:
+        return tx_lat, tx_lng
+    dlng, dlat = cell
+    lat = min(90.0, -90 + (min(math.floor((tx_lat + 90) / dlat), math.ceil(180 / dlat) - 1) + 0.5) * dlat)
+    lng = -180 + (math.floor(((tx_lng + 180) % 360) / dlng) + 0.5) * dlng
+    return round(lat, 4), round(lng if lng <= 180 else lng - 360, 4)
+
+
+def quantize_ssn(ssn, bucket):
+    return float(round(ssn / bucket) * bucket) if bucket > 0 else ssn
+
+
+class MufCache:
+    """
+    Encoded maps in cache_dir, indexed in CACHE_INDEX (sqlite: size, age and
+    last use of every entry, plus hit / miss / eviction counters). Entries
+    younger than ttl seconds are hits; put() evicts the least recently used
+    entries beyond max_bytes (0 = no cap). Cache trouble never fails a map
+    run: the entry simply misses.
+    """
+
+    def __init__(self, cache_dir, ttl, max_bytes=CACHE_MAX_MB << 20):
+        self.dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(tx_lat, tx_lng, utc, ssn, month, mhz, grid, w, h, variant='', fmt='png'):
+        key = f"{tx_lat:.4f},{tx_lng:.4f},{utc},{ssn:g},{month},{mhz:.3f},{grid},{w},{h}"
+        for tag in (variant, '' if fmt == 'png' else f"fmt={fmt}"):
+            key += f",{tag}" if tag else ''
+        return key
+
+    def path(self, key, fmt='png'):
+        return self.dir / f"muf-{hashlib.md5(key.encode()).hexdigest()[:12]}{OUTPUT_FORMATS[fmt]}"
+
+    def _db(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.dir / CACHE_INDEX), timeout=10)
+        db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, file TEXT, "
+                   "bytes INTEGER, created REAL, used REAL, hits INTEGER)")
+        db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, n INTEGER)")
+        return db
+
+    @staticmethod
+    def _count(db, name, n=1):
+        db.execute("INSERT INTO counters VALUES (?, ?) "
+                   "ON CONFLICT(name) DO UPDATE SET n = n + excluded.n", (name, n))
+
+    def get(self, key, count=True):
+        """(data, age) of a fresh entry, else (None, None); count=False leaves the stats alone."""
+        now = time.time()
+        try:
+            with closing(self._db()) as db, db:
+                row = db.execute("SELECT file, created FROM entries WHERE key = ?", (key,)).fetchone()
+                data = None
+                if row and self.ttl > 0 and now - row[1] < self.ttl:
+                    try:
+                        data = (self.dir / row[0]).read_bytes()
+                    except OSError:
+                        pass
+                if count:
+                    self._count(db, 'misses' if data is None else 'hits')
+                if data is None:
+                    return None, None
+                db.execute("UPDATE entries SET used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                return data, now - row[1]
+        except (OSError, sqlite3.Error):
+            return None, None
+
+    def put(self, key, data, fmt='png'):
+        """Store data (encoded as fmt) under key, then evict LRU entries over max_bytes."""
+        cp = self.path(key, fmt)
+        now = time.time()
+        try:
+            cp.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cp.with_name(cp.name + _tmp_suffix())
+            tmp.write_bytes(data)
+            os.replace(tmp, cp)
+            with closing(self._db()) as db, db:
+                db.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, 0) ON CONFLICT(key) DO UPDATE SET "
+                           "file = excluded.file, bytes = excluded.bytes, created = excluded.created, "
+                           "used = excluded.used", (key, cp.name, len(data), now, now))
+                if self.max_bytes:
+                    self._evict(db, keep=key)
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _evict(self, db, keep):
+        total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, name, size in db.execute("SELECT key, file, bytes FROM entries "
+                                          "WHERE key != ? ORDER BY used", (keep,)).fetchall():
+            try:
+                (self.dir / name).unlink()
+            except FileNotFoundError:
+                pass
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            evicted += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._count(db, 'evictions', evicted)
+
+    def stats(self, top=10):
+        with closing(self._db()) as db:
+            n, size = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+            counters = dict(db.execute("SELECT name, n FROM counters"))
+            popular = db.execute("SELECT key, hits FROM entries WHERE hits > 0 "
+                                 "ORDER BY hits DESC LIMIT ?", (top,)).fetchall()
+        return {'entries': n, 'bytes': size, 'hits': counters.get('hits', 0),
+                'misses': counters.get('misses', 0), 'evictions': counters.get('evictions', 0),
+                'top': popular}
+
+
+def print_cache_stats(cache):
+    st = cache.stats()
+    lookups = st['hits'] + st['misses']
+    cap = f"{cache.max_bytes >> 20} MB cap" if cache.max_bytes else "no cap"
+    print(f"{cache.dir}: {st['entries']} entries, {st['bytes'] / (1 << 20):.1f} MB ({cap})")
+    print(f"hits {st['hits']}, misses {st['misses']} "
+          f"({100.0 * st['hits'] / lookups if lookups else 0:.1f}% hit rate), evictions {st['evictions']}")
+    for key, hits in st['top']:
+        print(f"{hits:8d}  {key}")
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+
+def dvoacap_grid(tx_lat, tx_lng, utc, month, ssn, grid, workers,
+                 max_predictions=0, tol=ADAPTIVE_TOL_MHZ):
+    """dvoacap median MUF on the grid lattice: (muf_grid, grid_lats, grid_lngs, results)."""
+    points, grid_lats, grid_lngs = build_grid(grid)
+    with Pool(processes=workers,
+              initializer=_worker_init,
+              initargs=(tx_lat, tx_lng, utc, ssn, month)) as pool:
+        if max_predictions:
+            return adaptive_grid(lambda pts: pool.map(_worker_predict, pts),
+                                 grid, max_predictions, tol)
+        results = pool.map(_worker_predict, points)
+    return _assemble_grid(results, grid_lats, grid_lngs), grid_lats, grid_lngs, results
+
+
+def _assemble_grid(results, grid_lats, grid_lngs):
+    muf_grid = np.full((len(grid_lats), len(grid_lngs)), MUF_MIN)
+    lat_idx  = {round(float(v), 4): i for i, v in enumerate(grid_lats)}
+    lng_idx  = {round(float(v), 4): i for i, v in enumerate(grid_lngs)}
+    for rx_lat, rx_lng, mhz in results:
+        li = lat_idx.get(round(rx_lat, 4))
+        lj = lng_idx.get(round(rx_lng, 4))
+        if li is not None and lj is not None:
+            muf_grid[li, lj] = mhz
+    return muf_grid
+
+
+# --format -> cache file extension
+OUTPUT_FORMATS = {'png': '.png', 'rgb565': '.rgb565', 'bmpz': '.bmp.z'}
+PNG_LEVEL = 6
+
+
+def encode_map(img, fmt='png', png_level=PNG_LEVEL):
+    """Bytes of a rendered map in one of OUTPUT_FORMATS."""
+    if fmt == 'png':
+        buf = io.BytesIO()
+        img.save(buf, format='PNG', compress_level=png_level)
+        return buf.getvalue()
+    px = rgb888_to_rgb565(np.asarray(img.convert('RGB')))
+    if fmt == 'rgb565':
+        return px.astype('<u2').tobytes()
+    if fmt == 'bmpz':
+        return zlib.compress(encode_bmp(px), 9)
+    raise ValueError(f"unknown output format: {fmt}")
+
+
+# ---------------------------------------------------------------------------
+# Batch mode
+# ---------------------------------------------------------------------------
+BATCH_CHUNK = 64
+
+
+def parse_tx_list(spec):
+    """'lat,lng;lat,lng' or a file of 'lat,lng' lines (# comments) -> [(lat, lng), ...]."""
+    if os.path.isfile(spec):
+        with open(spec, encoding='utf-8') as f:
+            items = [ln.split('#', 1)[0] for ln in f]
+    else:
+        items = spec.split(';')
+    txs = []
+    for item in items:
+        parts = item.replace(',', ' ').split()
+        if not parts:
+            continue
+        if len(parts) != 2:
+            raise ValueError(f"bad TX '{item.strip()}' (expected lat,lng)")
+        lat, lng = float(parts[0]), float(parts[1])
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f"TX out of range: '{item.strip()}'")
+        if (lat, lng) not in txs:
+            txs.append((lat, lng))
+    if not txs:
+        raise ValueError("empty TX list")
+    return txs
+
+
+def parse_hours(spec, lo=0, hi=23, what='UTC hours'):
+    """'0-23', '0,6,12,18' or a mix of both -> sorted UTC hours (or other values in lo..hi)."""
+    hours = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        a, _, b = part.partition('-')
+        hours.update(range(int(a), int(b or a) + 1))
+    if not hours or min(hours) < lo or max(hours) > hi:
+        raise ValueError(f"{what} must be within {lo}-{hi}: '{spec}'")
+    return sorted(hours)
+
+
+def run_batch(args, workers, cache, cell):
+    """Render every (TX, UTC hour) map of the batch into the cache; returns the count written."""
+    txs   = list(dict.fromkeys(quantize_tx(lat, lng, cell) for lat, lng in parse_tx_list(args.batch_tx)))
+    hours = parse_hours(args.batch_hours)
+    fast  = args.engine == 'fast'
+    jobs  = []
+    for tx_lat, tx_lng in txs:
+        for utc in hours:
+            key = cache.key(tx_lat, tx_lng, utc, args.ssn, args.month, args.mhz,
+                            args.grid, args.width, args.height, 'fast' if fast else '', args.format)
+            if cache.get(key, count=False)[0] is not None:
+                continue
+            jobs.append((tx_lat, tx_lng, utc, key))
+    print(f"Batch: {len(txs)} TX x {len(hours)} hours, {len(jobs)} maps to render "
+          f"({'fast engine' if fast else f'{workers} workers'})", file=sys.stderr)
+    if not jobs:
+        return 0
+
+    t0 = time.time()
+    points, grid_lats, grid_lngs = build_grid(args.grid)
+    done = 0
+
+    def finish(key, muf_grid):
+        nonlocal done
+        tx_lat, tx_lng, utc, ckey = jobs[key]
+        img = render_map(muf_grid, grid_lats, grid_lngs, tx_lat, tx_lng, utc, args.month,
+                         args.width, args.height)
+        cache.put(ckey, encode_map(img, args.format, args.png_level), args.format)
+        done += 1
+        print(f"  [{done}/{len(jobs)}] TX {tx_lat:.4f},{tx_lng:.4f} UTC {utc:02d} -> {cache.path(ckey, args.format)} "
+              f"({time.time()-t0:.1f}s)", file=sys.stderr)
+
+    if fast:
+        for key, (tx_lat, tx_lng, utc, _) in enumerate(jobs):
+            finish(key, fast_muf_grid(tx_lat, tx_lng, utc, args.month, args.ssn,
+                                      grid_lats, grid_lngs))
+        return done
+
+    params = [(tx_lat, tx_lng, utc, args.ssn, args.month) for tx_lat, tx_lng, utc, _ in jobs]
+    for key, muf_grid in pool_grids(params, args.grid, workers):
+        finish(key, muf_grid)
+    return done
+
+
+def pool_grids(jobs, grid, workers):
+    """
+    dvoacap grids for jobs [(tx_lat, tx_lng, utc, ssn, month), ...] on one
+    warm pool: yields (job index, muf_grid) as each grid completes.
+    """
+    points, grid_lats, grid_lngs = build_grid(grid)
+    # Tasks are generated job-major, so chunks of one map finish close together
+    # and a worker only re-points its engine when it crosses to the next map
+    chunks  = [points[i:i + BATCH_CHUNK] for i in range(0, len(points), BATCH_CHUNK)]
+    pending = [[len(chunks), []] for _ in jobs]
+    tasks   = ((key, *job, chunk) for key, job in enumerate(jobs) for chunk in chunks)
+    with Pool(processes=workers, initializer=_worker_init, initargs=jobs[0]) as pool:
+        for key, results in pool.imap_unordered(_worker_batch, tasks):
+            pending[key][0] -= 1
+            pending[key][1].extend(results)
+            if pending[key][0] == 0:
+                yield key, _assemble_grid(pending[key][1], grid_lats, grid_lngs)
+                pending[key] = None
+
+
+# ---------------------------------------------------------------------------
+# SSN tables
+# ---------------------------------------------------------------------------
+# Per TX cell, month and UTC hour: dvoacap grids at a few SSN anchors,
+# float16 (anchors, lat, lng) .npy memory-mapped at request time, next to a
+# bool (anchors,) .filled.npy marking the anchors actually computed; MUF is
+# interpolated linearly in SSN between the bracketing anchors.
+TABLE_ANCHORS  = (0, 50, 100, 150, 200)
+TABLE_MANIFEST = 'tables.json'
+
+
+def _table_path(table_dir, tx_lat, tx_lng, month, utc, grid):
+    return Path(table_dir) / f"muf-table-{month:02d}-{tx_lat:+.4f}{tx_lng:+.4f}-g{grid}-h{utc:02d}.npy"
+
+
+def _filled_path(path):
+    return path.with_name(path.name[:-len('.npy')] + '.filled.npy')
+
+
+def _load_table(table_dir, tx_lat, tx_lng, month, utc, grid):
+    """(table, filled) of one TX / month / hour, memory-mapped read-only (raises OSError / ValueError)."""
+    path = _table_path(table_dir, tx_lat, tx_lng, month, utc, grid)
+    return np.load(path, mmap_mode='r'), np.load(_filled_path(path))
+
+
+def table_anchors(table_dir):
+    """SSN anchors of a table directory (raises OSError / ValueError when there is none)."""
+    with open(Path(table_dir) / TABLE_MANIFEST, encoding='utf-8') as f:
+        anchors = [float(a) for a in json.load(f)['anchors']]
+    if len(anchors) < 2 or anchors != sorted(set(anchors)):
+        raise ValueError(f"bad SSN anchors in {table_dir}: {anchors}")
+    return anchors
+
+
+def parse_anchors(spec):
+    anchors = sorted({float(v) for v in spec.split(',') if v.strip()})
+    if len(anchors) < 2 or anchors[0] < 0:
+        raise ValueError(f"need at least two SSN anchors >= 0: '{spec}'")
+    return anchors
+
+
+def _interp_ssn(tab, filled, anchors, ssn):
+    """float32 grid at ssn from the bracketing anchors, None unless both are filled."""
+    s = min(max(ssn, anchors[0]), anchors[-1])
+    i = min(int(np.searchsorted(anchors, s, side='right')) - 1, len(anchors) - 2)
+    if not (filled[i] and filled[i + 1]):
+        return None
+    t = (s - anchors[i]) / (anchors[i + 1] - anchors[i])
+    return (1 - t) * tab[i].astype(np.float32) + t * tab[i + 1].astype(np.float32)
+
+
+def table_grid(table_dir, tx_lat, tx_lng, utc, month, ssn, grid):
+    """MUF grid at ssn from the precomputed table of this TX cell, or None if it is not there."""
+    try:
+        anchors = table_anchors(table_dir)
+        tab, filled = _load_table(table_dir, tx_lat, tx_lng, month, utc, grid)
+        if tab.shape[0] != len(anchors) or filled.shape != (len(anchors),):
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    muf = _interp_ssn(tab, filled, anchors, ssn)
+    return None if muf is None else muf.astype(float)
+
+
+def build_tables(args, workers, cell):
+    """Fill the SSN tables of --build-tables for --batch-tx x --months x --batch-hours."""
+    table_dir = Path(args.build_tables)
+    anchors = parse_anchors(args.ssn_anchors)
+    try:
+        if table_anchors(table_dir) != anchors:
+            raise ValueError(f"{table_dir} was built with other SSN anchors; use another directory")
+    except OSError:
+        table_dir.mkdir(parents=True, exist_ok=True)
+        with open(table_dir / TABLE_MANIFEST, 'w', encoding='utf-8') as f:
+            json.dump({'anchors': anchors}, f)
+    txs    = list(dict.fromkeys(quantize_tx(lat, lng, cell) for lat, lng in parse_tx_list(args.batch_tx)))
+    months = parse_hours(args.months, 1, 12, 'months') if args.months else [args.month]
+    hours  = parse_hours(args.batch_hours)
+    _, grid_lats, grid_lngs = build_grid(args.grid)
+
+    # One table per requested hour, resumed: only anchors not marked filled are computed
+    tables, jobs, slots = {}, [], []
+    for tx_lat, tx_lng in txs:
+        for month in months:
+            for utc in hours:
+                path = _table_path(table_dir, tx_lat, tx_lng, month, utc, args.grid)
+                fpath = _filled_path(path)
+                shape = (len(anchors), len(grid_lats), len(grid_lngs))
+                try:
+                    tab = np.load(path, mmap_mode='r+')
+                    filled = np.load(fpath, mmap_mode='r+')
+                    if tab.shape != shape or filled.shape != (len(anchors),):
+                        raise ValueError(f"{path.name} does not match --grid / SSN anchors")
+                except FileNotFoundError:
+                    tab = np.lib.format.open_memmap(path, mode='w+', dtype=np.float16, shape=shape)
+                    filled = np.lib.format.open_memmap(fpath, mode='w+', dtype=bool, shape=(len(anchors),))
+                tables[path] = tab, filled
+                for i, ssn in enumerate(anchors):
+                    if not filled[i]:
+                        jobs.append((tx_lat, tx_lng, utc, ssn, month))
+                        slots.append((path, i))
+    print(f"Tables: {len(txs)} TX x {len(months)} months x {len(hours)} hours x {len(anchors)} SSN, "
+          f"{len(jobs)} grids to compute ({workers} workers)", file=sys.stderr)
+    t0 = time.time()
+    for n, (key, muf_grid) in enumerate(pool_grids(jobs, args.grid, workers) if jobs else (), 1):
+        path, i = slots[key]
+        tab, filled = tables[path]
+        tab[i] = muf_grid
+        # Grid on disk before it is marked filled, so an interrupted build resumes cleanly
+        tab.flush()
+        filled[i] = True
+        filled.flush()
+        if n % 24 == 0 or n == len(jobs):
+            print(f"  [{n}/{len(jobs)}] ({time.time()-t0:.1f}s)", file=sys.stderr)
+    return len(jobs)
+
+
+def table_error(args, workers, cell):
+    """Print SSN-table interpolation error against direct dvoacap at --test-ssn values."""
+    table_dir = Path(args.table_error)
+    anchors = table_anchors(table_dir)
+    test = (parse_anchors(args.test_ssn) if args.test_ssn else
+            [(a + b) / 2 for a, b in zip(anchors, anchors[1:])])
+    txs    = list(dict.fromkeys(quantize_tx(lat, lng, cell) for lat, lng in parse_tx_list(args.batch_tx)))
+    months = parse_hours(args.months, 1, 12, 'months') if args.months else [args.month]
+    hours  = parse_hours(args.batch_hours)
+    jobs, interp = [], []
+    for tx_lat, tx_lng in txs:
+        for month in months:
+            for utc in hours:
+                try:
+                    tab, filled = _load_table(table_dir, tx_lat, tx_lng, month, utc, args.grid)
+                except (OSError, ValueError):
+                    print(f"no table for TX {tx_lat:.4f},{tx_lng:.4f} month {month} {utc:02d} UTC",
+                          file=sys.stderr)
+                    continue
+                for ssn in test:
+                    muf = _interp_ssn(tab, filled, anchors, ssn)
+                    if muf is not None:
+                        jobs.append((tx_lat, tx_lng, utc, ssn, month))
+                        interp.append(muf)
+    if not jobs:
+        raise ValueError("nothing to compare: no matching tables / hours")
+    diffs = {ssn: [] for ssn in test}
+    for key, muf_grid in pool_grids(jobs, args.grid, workers):
+        diffs[jobs[key][3]].append((interp[key] - muf_grid).ravel())
+    print(f"SSN anchors {', '.join(f'{a:g}' for a in anchors)}: table vs dvoacap, "
+          f"{len(jobs)} grids at {args.grid} deg")
+    print(f"{'SSN':>6} {'grids':>6} {'mean|d|':>8} {'p90|d|':>8} {'max|d|':>8} {'bias':>7}")
+    for ssn in test:
+        if diffs[ssn]:
+            d = np.concatenate(diffs[ssn])
+            print(f"{ssn:6g} {len(diffs[ssn]):6d} {np.mean(np.abs(d)):8.2f} "
+                  f"{np.percentile(np.abs(d), 90):8.2f} {np.max(np.abs(d)):8.2f} {np.mean(d):+7.2f}")
 
 
 # ---------------------------------------------------------------------------
-# Cache / main
+# Service mode
 # ---------------------------------------------------------------------------
-def _cache_path(cache_dir, tx_lat, tx_lng, utc, ssn, month, mhz, grid, w, h):
-    key = f"{tx_lat:.2f},{tx_lng:.2f},{utc},{ssn},{month},{mhz:.3f},{grid},{w},{h}"
-    return Path(cache_dir) / f"muf-{hashlib.md5(key.encode()).hexdigest()[:12]}.png"
+SERVICE_TIMEOUT = 120.0
+SERVICE_DEFAULTS = {'mhz': 14.0, 'width': 660, 'height': 330, 'grid': 10, 'engine': 'dvoacap', 'format': 'png'}
+
+
+def _service_params(req):
+    """Validated map parameters of a service request (missing optional ones defaulted)."""
+    p = dict(SERVICE_DEFAULTS)
+    p.update({k: req[k] for k in ('txlat', 'txlng', 'utc', 'month', 'ssn', *SERVICE_DEFAULTS) if k in req})
+    try:
+        for k in ('txlat', 'txlng', 'ssn', 'mhz'):
+            p[k] = float(p[k])
+        for k in ('utc', 'month', 'width', 'height', 'grid'):
+            p[k] = int(p[k])
+    except KeyError as e:
+        raise ValueError(f"missing {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("bad numeric parameter")
+    if not (-90 <= p['txlat'] <= 90 and -180 <= p['txlng'] <= 180):
+        raise ValueError("TX out of range")
+    if not (0 <= p['utc'] <= 23 and 1 <= p['month'] <= 12):
+        raise ValueError("utc/month out of range")
+    if not (0 < p['width'] <= 8192 and 0 < p['height'] <= 4096 and 1 <= p['grid'] <= 90):
+        raise ValueError("size/grid out of range")
+    if p['engine'] not in ('dvoacap', 'fast'):
+        raise ValueError(f"unknown engine {p['engine']}")
+    if p['format'] not in OUTPUT_FORMATS:
+        raise ValueError(f"unknown format {p['format']}")
+    return p
+
+
+class MufMapService:
+    """
+    Map requests against one warm dvoacap pool, quantized and cached exactly
+    like a muf_map run. Requests for a map already being computed wait on
+    that computation instead of starting their own; at most max_jobs maps
+    are computed at once (their chunks interleave on the pool).
+    """
+
+    def __init__(self, workers, cache, cell=None, ssn_bucket=0, max_jobs=2, png_level=PNG_LEVEL):
+        self.cache = cache
+        self.cell = cell
+        self.ssn_bucket = ssn_bucket
+        self.png_level = png_level
+        # Workers are re-pointed per task (_worker_batch); these TX params are placeholders
+        self.pool = Pool(processes=workers, initializer=_worker_init, initargs=(0.0, 0.0, 0, 100.0, 1))
+        self.jobs = ThreadPoolExecutor(max_workers=max_jobs)
+        self.lock = threading.Lock()
+        self.inflight = {}
+        # Warm the render path (scipy / PIL imports, border mask) before the first request
+        _, grid_lats, grid_lngs = build_grid(SERVICE_DEFAULTS['grid'])
+        render_map(fast_muf_grid(0.0, 0.0, 0, 1, 100.0, grid_lats, grid_lngs), grid_lats, grid_lngs,
+                   0.0, 0.0, 0, 1, SERVICE_DEFAULTS['width'], SERVICE_DEFAULTS['height'])
+
+    def _compute(self, p, key):
+        points, grid_lats, grid_lngs = build_grid(p['grid'])
+        if p['engine'] == 'fast':
+            muf_grid = fast_muf_grid(p['txlat'], p['txlng'], p['utc'], p['month'], p['ssn'],
+                                     grid_lats, grid_lngs)
+        else:
+            tasks = [(0, p['txlat'], p['txlng'], p['utc'], p['ssn'], p['month'], points[i:i + BATCH_CHUNK])
+                     for i in range(0, len(points), BATCH_CHUNK)]
+            results = [r for _, chunk in self.pool.imap_unordered(_worker_batch, tasks) for r in chunk]
+            muf_grid = _assemble_grid(results, grid_lats, grid_lngs)
+        img = render_map(muf_grid, grid_lats, grid_lngs, p['txlat'], p['txlng'], p['utc'], p['month'],
+                         p['width'], p['height'])
+        data = encode_map(img, p['format'], self.png_level)
+        self.cache.put(key, data, p['format'])
+        return data
+
+    def _done(self, key):
+        with self.lock:
+            self.inflight.pop(key, None)
+
+    def get(self, p, coarse=False):
+        """(map bytes, how) with how one of cached / computed / coalesced / coarse."""
+        p = dict(p, ssn=quantize_ssn(p['ssn'], self.ssn_bucket))
+        p['txlat'], p['txlng'] = quantize_tx(p['txlat'], p['txlng'], self.cell)
+        key = self.cache.key(p['txlat'], p['txlng'], p['utc'], p['ssn'], p['month'], p['mhz'],
+                             p['grid'], p['width'], p['height'], 'fast' if p['engine'] == 'fast' else '',
+                             p['format'])
+        data, _ = self.cache.get(key)
+        if data is not None:
+            return data, 'cached'
+        if p['engine'] == 'fast':
+            # Sub-second and no pool: never queue it behind dvoacap maps
+            return self._compute(p, key), 'computed'
+        with self.lock:
+            fut = self.inflight.get(key)
+            how = 'coalesced' if fut else 'computed'
+            if fut is None:
+                fut = self.jobs.submit(self._compute, p, key)
+                self.inflight[key] = fut
+                fut.add_done_callback(lambda _, key=key: self._done(key))
+        if coarse and not fut.done():
+            return self.get(dict(p, engine='fast'))[0], 'coarse'
+        return fut.result(timeout=SERVICE_TIMEOUT), how
+
+
+def _service_handler(service):
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        # One JSON request line in; one JSON header line and the map bytes out
+        def handle(self):
+            t0 = time.time()
+            try:
+                req = json.loads(self.rfile.readline(4096))
+                p = _service_params(req)
+                data, how = service.get(p, bool(req.get('coarse')))
+                head = {'ok': True, 'bytes': len(data), 'how': how}
+                print(f"{p['txlat']:.2f},{p['txlng']:.2f} UTC {p['utc']:02d} {p['width']}x{p['height']} "
+                      f"{p['engine']}: {how} in {time.time()-t0:.2f}s", file=sys.stderr)
+            except Exception as e:
+                data, head = b'', {'ok': False, 'error': str(e) or type(e).__name__}
+                print(f"Request failed: {head['error']}", file=sys.stderr)
+            try:
+                self.wfile.write(json.dumps(head).encode() + b'\n' + data)
+            except OSError:
+                pass
+
+    return Handler
+
+
+def serve(sock_path, workers, cache, cell, ssn_bucket, max_jobs, png_level):
+    """Run the map service on a Unix socket until SIGTERM / SIGINT."""
+    import signal, socketserver
+    service = MufMapService(workers, cache, cell, ssn_bucket, max_jobs, png_level)
+    if os.path.exists(sock_path):
+        os.unlink(sock_path)
+    server = socketserver.ThreadingUnixStreamServer(sock_path, _service_handler(service))
+    server.daemon_threads = True
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Serving on {sock_path} ({workers} workers, {max_jobs} concurrent maps)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(sock_path):
+            os.unlink(sock_path)
+        service.jobs.shutdown(wait=False, cancel_futures=True)
+        # Not pool.terminate() (nor its exit finalizer): it takes a queue lock
+        # that a worker killed along with us (systemd signals the whole
+        # cgroup) may still hold
+        for proc in multiprocessing.active_children():
+            proc.kill()
+        sys.stderr.flush()
+        os._exit(0)
+
+
+def service_request(sock_path, req, timeout=SERVICE_TIMEOUT):
+    """(map bytes, how) from a running service; raises OSError / ValueError on failure."""
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(sock_path)
+        s.sendall(json.dumps(req).encode() + b'\n')
+        f = s.makefile('rb')
+        head = json.loads(f.readline(4096) or b'{}')
+        if not head.get('ok'):
+            raise ValueError(head.get('error', 'no response'))
+        data = f.read(head['bytes'])
+        if len(data) != head['bytes']:
+            raise ValueError("truncated response")
+        return data, head['how']
+
+
+def compare_engines(args, workers):
+    """Print --engine fast vs dvoacap error (MHz) on the --grid lattice for each REFERENCE_TX."""
+    print(f"fast vs dvoacap, {args.grid} deg grid, UTC {args.utc}, month {args.month}, SSN {args.ssn:g}")
+    print(f"{'TX':<16} {'mean|d|':>8} {'p90|d|':>8} {'max|d|':>8} {'bias':>7} {'dvoacap s':>10} {'fast s':>8}")
+    diffs = []
+    for name, lat, lng in REFERENCE_TX:
+        t0 = time.time()
+        ref, grid_lats, grid_lngs, _ = dvoacap_grid(lat, lng, args.utc, args.month, args.ssn,
+                                                    args.grid, workers)
+        t1 = time.time()
+        fast = fast_muf_grid(lat, lng, args.utc, args.month, args.ssn, grid_lats, grid_lngs)
+        t2 = time.time()
+        d = fast - ref
+        diffs.append(d.ravel())
+        print(f"{name:<16} {np.mean(np.abs(d)):8.2f} {np.percentile(np.abs(d), 90):8.2f} "
+              f"{np.max(np.abs(d)):8.2f} {np.mean(d):+7.2f} {t1-t0:10.2f} {t2-t1:8.3f}")
+    d = np.concatenate(diffs)
+    print(f"{'all':<16} {np.mean(np.abs(d)):8.2f} {np.percentile(np.abs(d), 90):8.2f} "
+          f"{np.max(np.abs(d)):8.2f} {np.mean(d):+7.2f}")
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument('--txlat',     type=float, required=True)
-    ap.add_argument('--txlng',     type=float, required=True)
-    ap.add_argument('--utc',       type=int,   required=True)
-    ap.add_argument('--month',     type=int,   required=True)
-    ap.add_argument('--ssn',       type=float, required=True)
+    ap.add_argument('--txlat',     type=float)
+    ap.add_argument('--txlng',     type=float)
+    ap.add_argument('--utc',       type=int)
+    ap.add_argument('--month',     type=int)
+    ap.add_argument('--ssn',       type=float)
     ap.add_argument('--mhz',       type=float, default=14.0)
     ap.add_argument('--width',     type=int,   default=660)
     ap.add_argument('--height',    type=int,   default=330)
     ap.add_argument('--grid',      type=int,   default=10,
                     help='Grid spacing in degrees (default 10 = 648 points)')
+    ap.add_argument('--engine',    choices=('dvoacap', 'fast'), default='dvoacap',
+                    help='fast = vectorized foF2 model only (no dvoacap, no worker pool)')
+    ap.add_argument('--compare-engines', action='store_true',
+                    help='print fast vs dvoacap error over REFERENCE_TX instead of a map')
+    ap.add_argument('--max-predictions', type=int, default=0,
+                    help='adaptive mode: at most this many dvoacap calls, refining a '
+                         '--grid lattice where the map needs it (0 = uniform grid; must cover '
+                         'the coarsest start lattice, 54 points at --grid 10)')
+    ap.add_argument('--adaptive-tol', type=float, default=ADAPTIVE_TOL_MHZ,
+                    help='adaptive mode: do not refine cells with a smaller estimated error (MHz)')
     ap.add_argument('--workers',   type=int,   default=0)
     ap.add_argument('--cache-dir', type=str,   default='/tmp')
     ap.add_argument('--cache-ttl', type=int,   default=1800)
+    ap.add_argument('--cache-max-mb', type=int, default=CACHE_MAX_MB,
+                    help=f'evict least recently used maps beyond this (default {CACHE_MAX_MB}, 0 = no cap)')
+    ap.add_argument('--cache-cell', type=str,  default='0',
+                    help='snap TX to the centre of this cell before computing: field, square, '
+                         'subsquare (Maidenhead) or degrees; 0 = exact TX (default)')
+    ap.add_argument('--ssn-bucket', type=float, default=0.0,
+                    help='round SSN to a multiple of this before computing (0 = exact, default)')
+    ap.add_argument('--cache-stats', action='store_true',
+                    help='print cache hit / miss statistics and the most used entries')
     ap.add_argument('--output',    type=str,   default='-')
+    ap.add_argument('--format',    choices=tuple(OUTPUT_FORMATS), default='png',
+                    help='png, rgb565 (raw pixels) or bmpz (HamClock BMPv4 RGB565 .bmp.z)')
+    ap.add_argument('--png-level', type=int,   default=PNG_LEVEL, choices=range(10), metavar='0-9',
+                    help=f'PNG zlib level (default {PNG_LEVEL})')
     ap.add_argument('--timing',    action='store_true')
+    ap.add_argument('--batch-tx',  type=str,
+                    help="batch mode: pre-generate maps into --cache-dir for these TX "
+                         "('lat,lng;lat,lng' or a file of lat,lng lines)")
+    ap.add_argument('--batch-hours', type=str, default='0-23',
+                    help='batch mode: UTC hours, e.g. 0-23 or 0,6,12,18 (default 0-23)')
+    ap.add_argument('--tables',    type=str,   metavar='DIR',
+                    help='interpolate dvoacap maps from precomputed SSN tables in DIR when present')
+    ap.add_argument('--build-tables', type=str, metavar='DIR',
+                    help='precompute SSN tables into DIR for --batch-tx x --months x --batch-hours')
+    ap.add_argument('--months',    type=str,
+                    help='table modes: months, e.g. 1-12 or 3,6 (default --month)')
+    ap.add_argument('--ssn-anchors', type=str, default=','.join(map(str, TABLE_ANCHORS)),
+                    help='build mode: SSN anchors (default %(default)s)')
+    ap.add_argument('--table-error', type=str, metavar='DIR',
+                    help='print table interpolation error vs direct dvoacap for --batch-tx x --months '
+                         'x --batch-hours at --test-ssn')
+    ap.add_argument('--test-ssn',  type=str,
+                    help='table error: SSN values to test (default: midpoints between anchors)')
+    ap.add_argument('--serve',     type=str,   metavar='SOCKET',
+                    help='run the map service on this Unix socket (warm pool, shared requests)')
+    ap.add_argument('--max-jobs',  type=int,   default=2,
+                    help='service mode: maps computed at once (default 2)')
+    ap.add_argument('--service',   type=str,   metavar='SOCKET',
+                    help='ask the map service on this socket first; compute locally if it is down')
+    ap.add_argument('--coarse',    action='store_true',
+                    help='with --service: take the fast-engine map now if the full one is not ready')
     args = ap.parse_args()
 
     workers = args.workers or max(1, cpu_count() - 1)
+    try:
+        cell = cache_cell(args.cache_cell)
+    except ValueError:
+        ap.error(f'bad --cache-cell: {args.cache_cell}')
+    cache = MufCache(args.cache_dir, args.cache_ttl, max(0, args.cache_max_mb) << 20)
+
+    if args.cache_stats:
+        print_cache_stats(cache)
+        return
+    if args.serve:
+        serve(args.serve, workers, cache, cell, args.ssn_bucket, max(1, args.max_jobs), args.png_level)
+        return
+    if args.build_tables or args.table_error:
+        if not args.batch_tx or (args.month is None and not args.months):
+            ap.error('--batch-tx and --month or --months are required')
+        try:
+            if args.build_tables:
+                build_tables(args, workers, cell)
+            else:
+                table_error(args, workers, cell)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(2)
+        return
+    if args.month is None or args.ssn is None:
+        ap.error('--month and --ssn are required')
+    args.ssn = quantize_ssn(args.ssn, args.ssn_bucket)
+    if args.batch_tx:
+        if args.max_predictions:
+            print("WARNING: --max-predictions is ignored in batch mode", file=sys.stderr)
+        try:
+            run_batch(args, workers, cache, cell)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(2)
+        return
+    if args.utc is None:
+        ap.error('--utc is required')
+    if args.compare_engines:
+        compare_engines(args, workers)
+        return
+    if args.txlat is None or args.txlng is None:
+        ap.error('--txlat and --txlng are required')
 
-    cp = _cache_path(args.cache_dir, args.txlat, args.txlng,
-                     args.utc, args.ssn, args.month, args.mhz,
-                     args.grid, args.width, args.height)
-    if args.cache_ttl > 0 and cp.exists():
-        age = time.time() - cp.stat().st_mtime
-        if age < args.cache_ttl:
+    fast = args.engine == 'fast'
+    if args.max_predictions and not fast:
+        least = adaptive_min_predictions(args.grid)
+        if args.max_predictions < least:
+            ap.error(f'--max-predictions must be at least {least} for --grid {args.grid:g}')
+    args.txlat, args.txlng = quantize_tx(args.txlat, args.txlng, cell)
+    t0 = time.time()
+    table = None
+    if args.tables and not fast and not args.max_predictions:
+        table = table_grid(args.tables, args.txlat, args.txlng, args.utc, args.month, args.ssn, args.grid)
+    variant = ('fast' if fast else 'tables' if table is not None else
+               'adaptive=%d:%g' % (args.max_predictions, args.adaptive_tol) if args.max_predictions else '')
+    key = cache.key(args.txlat, args.txlng, args.utc, args.ssn, args.month, args.mhz,
+                    args.grid, args.width, args.height, variant, args.format)
+    data, age = cache.get(key)
+    if data is not None:
+        if args.timing:
+            print(f"Cache hit ({age:.0f}s old)", file=sys.stderr)
+        (sys.stdout.buffer if args.output=='-'
+         else open(args.output,'wb')).write(data)
+        return
+    if args.service and not args.max_predictions and table is None:
+        req = {k: getattr(args, k) for k in ('txlat', 'txlng', 'utc', 'month', 'ssn', *SERVICE_DEFAULTS)}
+        try:
+            t0 = time.time()
+            data, how = service_request(args.service, dict(req, coarse=args.coarse))
             if args.timing:
-                print(f"Cache hit ({age:.0f}s old)", file=sys.stderr)
-            data = cp.read_bytes()
+                print(f"Service: {how} in {time.time()-t0:.2f}s", file=sys.stderr)
             (sys.stdout.buffer if args.output=='-'
              else open(args.output,'wb')).write(data)
             return
+        except (OSError, ValueError) as e:
+            print(f"Service unavailable ({e}), computing locally", file=sys.stderr)
 
-    t0 = time.time()
-    points, grid_lats, grid_lngs = build_grid(args.grid)
-    if args.timing:
-        print(f"Grid: {len(points)} pts, {workers} workers", file=sys.stderr)
-
-    with Pool(processes=workers,
-              initializer=_worker_init,
-              initargs=(args.txlat, args.txlng,
-                        args.utc, args.ssn, args.month)) as pool:
-        results = pool.map(_worker_predict, points)
-
-    t1 = time.time()
-    if args.timing:
-        print(f"Predictions: {t1-t0:.2f}s", file=sys.stderr)
-
-    # Assemble grid
-    muf_grid = np.full((len(grid_lats), len(grid_lngs)), MUF_MIN)
-    lat_idx  = {round(float(v), 4): i for i, v in enumerate(grid_lats)}
-    lng_idx  = {round(float(v), 4): i for i, v in enumerate(grid_lngs)}
-    n_dvocap = 0
-    n_fallbk = 0
-    for rx_lat, rx_lng, mhz in results:
-        li = lat_idx.get(round(rx_lat, 4))
-        lj = lng_idx.get(round(rx_lng, 4))
-        if li is not None and lj is not None:
-            muf_grid[li, lj] = mhz
-            if mhz > MUF_MIN + 0.1:
-                n_dvocap += 1
-            else:
-                n_fallbk += 1
+    if table is not None:
+        _, grid_lats, grid_lngs = build_grid(args.grid)
+        muf_grid = table
+        t1 = time.time()
+        if args.timing:
+            print(f"SSN table: {t1-t0:.3f}s", file=sys.stderr)
+    elif fast:
+        _, grid_lats, grid_lngs = build_grid(args.grid)
+        if args.timing:
+            print(f"Grid: {len(grid_lats) * len(grid_lngs)} pts, fast engine", file=sys.stderr)
+        muf_grid = fast_muf_grid(args.txlat, args.txlng, args.utc, args.month, args.ssn,
+                                 grid_lats, grid_lngs)
+        t1 = time.time()
+        if args.timing:
+            print(f"Model: {t1-t0:.3f}s", file=sys.stderr)
+    else:
+        if args.timing:
+            npts = len(build_grid(args.grid)[0])
+            budget = f" (adaptive, <= {args.max_predictions} predictions)" if args.max_predictions else ""
+            print(f"Grid: {npts} pts{budget}, {workers} workers", file=sys.stderr)
+        muf_grid, grid_lats, grid_lngs, results = dvoacap_grid(
+            args.txlat, args.txlng, args.utc, args.month, args.ssn, args.grid, workers,
+            args.max_predictions, args.adaptive_tol)
 
-    if args.timing:
-        print(f"dvoacap: {n_dvocap} pts, fallback: {n_fallbk} pts", file=sys.stderr)
+        t1 = time.time()
+        if args.timing:
+            print(f"Predictions: {len(results)} in {t1-t0:.2f}s", file=sys.stderr)
+            n_dvocap = sum(1 for _, _, mhz in results if mhz > MUF_MIN + 0.1)
+            print(f"dvoacap: {n_dvocap} pts, fallback: {len(results) - n_dvocap} pts", file=sys.stderr)
 
     img = render_map(muf_grid, grid_lats, grid_lngs,
                      args.txlat, args.txlng,
@@ -344,18 +1414,14 @@ def main():
     if args.timing:
         print(f"Render: {t2-t1:.2f}s  Total: {t2-t0:.2f}s", file=sys.stderr)
 
-    buf = io.BytesIO()
-    img.save(buf, format='PNG', optimize=True)
-    png_bytes = buf.getvalue()
-    try:
-        cp.parent.mkdir(parents=True, exist_ok=True)
-        cp.write_bytes(png_bytes)
-    except Exception:
-        pass
+    data = encode_map(img, args.format, args.png_level)
+    cache.put(key, data, args.format)
+    if args.timing:
+        print(f"Encode ({args.format}): {time.time()-t2:.2f}s", file=sys.stderr)
     if args.output == '-':
-        sys.stdout.buffer.write(png_bytes)
+        sys.stdout.buffer.write(data)
     else:
-        Path(args.output).write_bytes(png_bytes)
+        Path(args.output).write_bytes(data)
 
 
 if __name__ == '__main__':
@@ -47,68 +47,13 @@ gmt grdclip aurora.nc -Sb1/NaN -Gaurora_clipped.nc
 VMAX=$(gmt grdinfo aurora.nc -C | awk '{v=int($7); print (v>20)?v:20}')
 echo "Aurora vmax: $VMAX"
 
-V15=$(echo "$VMAX * 15 / 100" | bc)
-V40=$(echo "$VMAX * 40 / 100" | bc)
-V65=$(echo "$VMAX * 65 / 100" | bc)
-
-cat > aurora.cpt <<EOF
-0      0/0/0    1      0/0/0
-1      0/20/0   $V15   0/80/0
-$V15   0/80/0   $V40   0/160/0
-$V40   0/160/0  $V65   0/220/0
-$V65   0/220/0  $VMAX  1/251/0
-EOF
+# Palette shared with the python renderers (lib_cpt.py)
+python3 /opt/hamclock-backend/scripts/lib_cpt.py dump aurora --vmax "$VMAX" > aurora.cpt
 
-# Write BMPv4 (BITMAPV4HEADER), 16bpp RGB565, top-down — matches ClearSkyInstitute format
-make_bmp_v4_rgb565_topdown() {
-  local inraw="$1" outbmp="$2" W="$3" H="$4"
-  python3 - <<'PY' "$inraw" "$outbmp" "$W" "$H"
-import struct, sys
-inraw, outbmp, W, H = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
-
-raw = open(inraw, "rb").read()
-exp = W*H*3
-if len(raw) != exp:
-    raise SystemExit(f"RAW size {len(raw)} != expected {exp}")
-
-pix = bytearray(W*H*2)
-j = 0
-for i in range(0, len(raw), 3):
-    r = raw[i]; g = raw[i+1]; b = raw[i+2]
-    v = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
-    pix[j:j+2] = struct.pack("<H", v)
-    j += 2
-
-bfOffBits = 14 + 108
-bfSize = bfOffBits + len(pix)
-filehdr = struct.pack("<2sIHHI", b"BM", bfSize, 0, 0, bfOffBits)
-
-biSize = 108
-rmask, gmask, bmask, amask = 0xF800, 0x07E0, 0x001F, 0x0000
-cstype = 0x73524742  # sRGB
-endpoints = b"\x00"*36
-gamma = b"\x00"*12
-
-v4hdr = struct.pack("<IiiHHIIIIII",
-    biSize, W, -H, 1, 16, 3, len(pix), 0, 0, 0, 0
-) + struct.pack("<IIII", rmask, gmask, bmask, amask) \
-  + struct.pack("<I", cstype) + endpoints + gamma
-
-with open(outbmp, "wb") as f:
-    f.write(filehdr)
-    f.write(v4hdr)
-    f.write(pix)
-PY
-}
-
-zlib_compress() {
-  local in="$1" out="$2"
-  python3 -c "
-import zlib, sys
-data = open(sys.argv[1], 'rb').read()
-open(sys.argv[2], 'wb').write(zlib.compress(data, 9))
-" "$in" "$out"
-}
+# Shared BMPv4 RGB565 encoder (one python process for every size)
+LIB_BMP="/opt/hamclock-backend/scripts/lib_bmp.py"
+ENCODE_JOBS=()
+ENCODE_TMP=()
 
 echo "Rendering maps..."
 
@@ -140,20 +85,23 @@ for SZ in "${SIZES[@]}"; do
   gmt end || { echo "gmt failed for $SZ"; continue; }
 
   convert "$PNG" -filter Lanczos -resize "${SZ}!" "$PNG_FIXED" || { echo "resize failed for $SZ"; continue; }
+  rm -f "$PNG"
 
-  RAW="$GMT_USERDIR/aurora_${DN}_${SZ}.raw"
-  convert "$PNG_FIXED" RGB:"$RAW" || { echo "raw extract failed for $SZ"; continue; }
-  make_bmp_v4_rgb565_topdown "$RAW" "$BMP" "$W" "$H" || { echo "bmp write failed for $SZ"; continue; }
-  rm -f "$RAW" "$PNG" "$PNG_FIXED"
-
-  zlib_compress "$BMP" "${BMP}.z"
-
-  echo "  -> Done: $BMP"
+  # Queue BMPv4 RGB565 .bmp.z encode, matching ClearSkyInstitute format
+  # (compressed only; an unchanged map is not rewritten)
+  ENCODE_JOBS+=( --job "$PNG_FIXED" "$BMP" "$SZ" )
+  ENCODE_TMP+=( "$PNG_FIXED" )
 
 done
 
 done
 
+if [[ ${#ENCODE_JOBS[@]} -gt 0 ]]; then
+  echo "Encoding $(( ${#ENCODE_JOBS[@]} / 4 )) aurora maps..."
+  python3 "$LIB_BMP" encode --zlevel 9 --zlib-workers "${OHB_ZLIB_WORKERS:-0}" --compressed-only "${ENCODE_JOBS[@]}" || echo "bmp encode failed for one or more maps"
+  rm -f "${ENCODE_TMP[@]}"
+fi
+
 rm -f aurora_native.nc aurora_raw.nc aurora.nc aurora_clipped.nc aurora.cpt ovation.xyz
 
 echo "Done."
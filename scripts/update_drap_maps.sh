@@ -80,71 +80,13 @@ else
     gmt grdmath -R-180/180/-90/90 -I0.5 0 = drap.nc
 fi
 
-cat > drap.cpt <<'CPTEOF'
-0.0    0/0/0         0.1   20/0/40
-0.1   20/0/40        1.0   60/0/90
-1.0   60/0/90        2.0   100/0/150
-2.0   100/0/150      4.0   130/0/200
-4.0   130/0/200      6.0   80/0/255
-6.0   80/0/255       9.0   0/80/255
-9.0   0/80/255      12.0   0/200/220
-12.0  0/200/220     16.0   0/220/100
-16.0  0/220/100     20.0   180/255/0
-20.0  180/255/0     24.0   255/200/0
-24.0  255/200/0     28.0   255/100/0
-28.0  255/100/0     35.0   255/0/0
-N     0/0/0
-CPTEOF
-
-zlib_compress() {
-  local in="$1" out="$2"
-  python3 -c "
-import zlib, sys
-data = open(sys.argv[1], 'rb').read()
-open(sys.argv[2], 'wb').write(zlib.compress(data, 9))
-" "$in" "$out"
-}
-
-# Write BMPv4 (BITMAPV4HEADER), 16bpp RGB565, top-down — matches ClearSkyInstitute format
-make_bmp_v4_rgb565_topdown() {
-  local inraw="$1" outbmp="$2" W="$3" H="$4"
-  python3 - <<'PY' "$inraw" "$outbmp" "$W" "$H"
-import struct, sys
-inraw, outbmp, W, H = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
-
-raw = open(inraw, "rb").read()
-exp = W*H*3
-if len(raw) != exp:
-    raise SystemExit(f"RAW size {len(raw)} != expected {exp}")
-
-pix = bytearray(W*H*2)
-j = 0
-for i in range(0, len(raw), 3):
-    r = raw[i]; g = raw[i+1]; b = raw[i+2]
-    v = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
-    pix[j:j+2] = struct.pack("<H", v)
-    j += 2
-
-bfOffBits = 14 + 108
-bfSize = bfOffBits + len(pix)
-filehdr = struct.pack("<2sIHHI", b"BM", bfSize, 0, 0, bfOffBits)
-
-biSize = 108
-rmask, gmask, bmask, amask = 0xF800, 0x07E0, 0x001F, 0x0000
-cstype = 0x73524742  # sRGB
-endpoints = b"\x00"*36
-gamma = b"\x00"*12
-
-v4hdr = struct.pack("<IiiHHIIIIII",
-    biSize, W, -H, 1, 16, 3, len(pix), 0, 0, 0, 0
-) + struct.pack("<IIII", rmask, gmask, bmask, amask)   + struct.pack("<I", cstype) + endpoints + gamma
-
-with open(outbmp, "wb") as f:
-    f.write(filehdr)
-    f.write(v4hdr)
-    f.write(pix)
-PY
-}
+# Palette shared with the python renderers (lib_cpt.py)
+python3 /opt/hamclock-backend/scripts/lib_cpt.py dump drap > drap.cpt
+
+# Shared BMPv4 RGB565 encoder (one python process for every size)
+LIB_BMP="/opt/hamclock-backend/scripts/lib_bmp.py"
+ENCODE_JOBS=()
+ENCODE_TMP=()
 
 echo "Rendering DRAP maps..."
 
@@ -174,20 +116,21 @@ for DN in D N; do
     gmt end || { echo "gmt failed for $DN $SZ"; continue; }
 
     convert "$PNG" -resize "${SZ}!" "$PNG_FIXED" || { echo "resize failed for $DN $SZ"; continue; }
+    rm -f "$PNG"
 
-    # Extract raw RGB then write proper BMPv4 RGB565 matching ClearSkyInstitute format
-    RAW="$GMT_USERDIR/drap_${DN}_${SZ}.raw"
-    convert "$PNG_FIXED" RGB:"$RAW" || { echo "raw extract failed for $DN $SZ"; continue; }
-    make_bmp_v4_rgb565_topdown "$RAW" "$BMP" "$W" "$H" || { echo "bmp write failed for $DN $SZ"; continue; }
-    rm -f "$RAW"
-
-    zlib_compress "$BMP" "${BMP}.z"
-
-    rm -f "$PNG" "$PNG_FIXED"
-    echo "  -> Done: $BMP"
+    # Queue BMPv4 RGB565 .bmp.z encode, matching ClearSkyInstitute format
+    # (compressed only; an unchanged map is not rewritten)
+    ENCODE_JOBS+=( --job "$PNG_FIXED" "$BMP" "$SZ" )
+    ENCODE_TMP+=( "$PNG_FIXED" )
   done
 done
 
+if [[ ${#ENCODE_JOBS[@]} -gt 0 ]]; then
+  echo "Encoding $(( ${#ENCODE_JOBS[@]} / 4 )) DRAP maps..."
+  python3 "$LIB_BMP" encode --zlevel 9 --zlib-workers "${OHB_ZLIB_WORKERS:-0}" --compressed-only "${ENCODE_JOBS[@]}" || echo "bmp encode failed for one or more maps"
+  rm -f "${ENCODE_TMP[@]}"
+fi
+
 rm -f drap_nn.nc drap_s1.nc drap.nc drap.cpt drap.xyz "$TXT"
 
 echo "OK: DRAP maps updated into $OUTDIR"
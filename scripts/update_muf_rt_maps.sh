@@ -13,34 +13,75 @@ PY="${PY:-python3}"
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 BUILDER="${BUILDER:-$SCRIPT_DIR/build_muf_rt.py}"
 
-for sz in "${SIZES[@]}"; do
-  w="${sz%x*}"
-  h="${sz#*x}"
-
-  base_day="$MAPDIR/map-D-$sz-Countries.bmp.z"
-  base_night="$MAPDIR/map-N-$sz-Countries.bmp.z"
-
-  if [[ ! -s "$base_day" ]]; then
-    echo "WARN: missing base day $base_day; skipping $sz" >&2
-    continue
-  fi
-  if [[ ! -s "$base_night" ]]; then
-    echo "WARN: missing base night $base_night; skipping $sz" >&2
-    continue
-  fi
-
-  echo "Rendering MUF-RT $sz (D+N) ..."
-  "$PY" "$BUILDER" \
-    --width "$w" --height "$h" \
-    --base-day "$base_day" \
-    --base-night "$base_night" \
-    --outdir "$OUTDIR" \
-    --product "MUF-RT" \
-    --alpha 0.55 \
-    --active-seconds 3600 \
-    --min-confidence 0.0 \
-    --k 24 \
-    --p 2.0 \
-    --debug-png
-done
+# Where the MUF field comes from: contours (KC2G model contours, gridded
+# once; what the old GMT pipeline rendered), stations (KC2G station IDW) or
+# blend (stations where they have coverage, contours elsewhere). This is the
+# only MUF-RT job; kc2g_muf_heatmap.sh now runs this script.
+MUF_SOURCE="${MUF_SOURCE:-contours}"
 
+# Colour scale: muf-hamclock is the HamClock colorbar (muf_hamclock.cpt) the
+# maps have always used. Opt in to the station-style look with
+#   MUF_SOURCE=blend MUF_PALETTE=muf-rt
+MUF_PALETTE="${MUF_PALETTE:-muf-hamclock}"
+
+# Interpolate once on a lat/lon grid of this spacing (degrees) and resample
+# to every size; empty = exact per-pixel IDW (0.5 deg for contours/blend).
+# Check the error first with:
+#   build_muf_rt.py --grid-deg 0.25 --grid-check ...
+MUF_GRID_DEG="${MUF_GRID_DEG:-}"
+GRID_ARGS=()
+if [[ -n "$MUF_GRID_DEG" ]]; then
+  GRID_ARGS=( --grid-deg "$MUF_GRID_DEG" --resample bilinear )
+fi
+
+# Render in bands of this many rows so peak memory follows the band height
+# (e.g. 128 on 1 GB boards with 7920x3960 enabled); empty = whole maps.
+MUF_BAND_ROWS="${MUF_BAND_ROWS:-}"
+if [[ -n "$MUF_BAND_ROWS" ]]; then
+  GRID_ARGS+=( --band-rows "$MUF_BAND_ROWS" )
+fi
+
+# Working-memory budget in MB (e.g. 256 on small boards): IDW runs in float32
+# chunks sized to fit, and sizes too big to hold whole are banded on their own.
+MUF_MAX_MEMORY_MB="${MUF_MAX_MEMORY_MB:-}"
+if [[ -n "$MUF_MAX_MEMORY_MB" ]]; then
+  GRID_ARGS+=( --max-memory "$MUF_MAX_MEMORY_MB" )
+fi
+
+# Also write map-*-MUF-RT.png next to the maps (debugging only; costs a PNG
+# encode per map and run).
+if [[ -n "${MUF_DEBUG_PNG:-}" ]]; then
+  GRID_ARGS+=( --debug-png )
+fi
+
+# Extra maps from the same interpolation pass, e.g. "fof2,confidence" for
+# map-{D,N}-<size>-FOF2-RT.bmp.z and -CONF-RT.bmp.z (station coverage).
+MUF_EXTRA_PRODUCTS="${MUF_EXTRA_PRODUCTS:-}"
+if [[ -n "$MUF_EXTRA_PRODUCTS" ]]; then
+  GRID_ARGS+=( --extra-products "$MUF_EXTRA_PRODUCTS" )
+fi
+
+# One process renders every size (D+N) from a single stations.json fetch;
+# sizes whose Countries base maps are missing are skipped with a warning.
+# --incremental only re-renders tiles near stations whose MUF changed since
+# the last run; anything else (new station set, edited maps) renders in full.
+echo "Rendering MUF-RT ${OHB_SIZES_NORM} (D+N, source ${MUF_SOURCE}, palette ${MUF_PALETTE}) ..."
+"$PY" "$BUILDER" \
+  --sizes "$OHB_SIZES_NORM" \
+  --mapdir "$MAPDIR" \
+  --outdir "$OUTDIR" \
+  --compressed-only \
+  --zlib-workers "${OHB_ZLIB_WORKERS:-0}" \
+  --product "MUF-RT" \
+  --source "$MUF_SOURCE" \
+  --palette "$MUF_PALETTE" \
+  --alpha 0.55 \
+  --active-seconds 3600 \
+  --min-confidence 0.0 \
+  --k 24 \
+  --p 2.0 \
+  --workers "${MUF_WORKERS:-0}" \
+  --weights-cache "${MUF_WEIGHTS_CACHE:-/opt/hamclock-backend/cache/muf-rt-weights}" \
+  --incremental \
+  --state-dir "${MUF_STATE_DIR:-/opt/hamclock-backend/cache/muf-rt-state}" \
+  "${GRID_ARGS[@]}"
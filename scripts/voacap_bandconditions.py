@@ -18,12 +18,24 @@ Fields used from dvoacap Prediction:
 
 Sigmoid parameters (c=-2.0, k=0.14, N=0.40) were grid-search optimised against the
 full CSI 24-hour reference output for FL→CA path, Jan 2026, SSN=39.
+
+Service mode (--serve SOCKET) answers the same requests over a Unix socket
+from warm PredictionEngines kept per (month, SSN), with at most
+--max-concurrent predictions at once. fetchBandConditions.pl asks it first
+and falls back to running this script when it is down. Protocol: one JSON
+line {"argv": [...the command line options...]} in; one JSON line
+{"ok": true, "bytes": N} followed by the N bytes of output (or
+{"ok": false, "error": ...}) out.
 """
 import argparse
 import json
 import math
+import os
 import sys
+import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Optional
 
@@ -48,6 +60,11 @@ MUF_EXPONENT      =  0.40  # muf_day^N — suppresses near/above-MUF bands
 # muf_day below this is treated as "band above MUF" → score = 0
 MUF_DEAD_THRESHOLD = 1e-4
 
+# Service mode
+SERVICE_MAX_ENGINES = 8      # warm engines kept, one per (month, SSN)
+SERVICE_CONCURRENCY = 2      # predictions running at once
+SERVICE_TIMEOUT     = 20.0   # seconds a request may wait for a free slot
+
 
 def clamp01(x: float) -> float:
     if x != x:
@@ -176,25 +193,150 @@ def save_cache(cache_dir: Path, key: str, rows: List[List[float]]) -> None:
         pass
 
 
-def compute_rows(args: argparse.Namespace, debug: bool = False) -> List[List[float]]:
-    tx = GeoPoint.from_degrees(args.txlat, args.txlng)
+def make_engine(month: int, ssn: float) -> PredictionEngine:
+    eng = PredictionEngine()
+    eng.params.ssn                  = float(ssn)
+    eng.params.month                = int(month)
+    eng.params.required_snr         = CW_REQUIRED_SNR
+    eng.params.required_reliability = CW_REQUIRED_RELIABILITY
+    eng.params.man_made_noise_at_3mhz = MAN_MADE_NOISE
+    return eng
+
+
+def compute_rows(args: argparse.Namespace, debug: bool = False,
+                 eng: Optional[PredictionEngine] = None) -> List[List[float]]:
+    """24 hourly rows for args; eng, if given, must come from make_engine(args.month, args.ssn)."""
     rx = resolve_rx(args)
 
-    eng = PredictionEngine()
-    eng.params.ssn                  = float(args.ssn)
-    eng.params.month                = int(args.month)
-    eng.params.tx_location          = tx
+    eng = eng or make_engine(args.month, args.ssn)
+    eng.params.tx_location          = GeoPoint.from_degrees(args.txlat, args.txlng)
     eng.params.tx_power             = float(args.pow)
     eng.params.min_angle            = np.deg2rad(float(args.toa))
     eng.params.long_path            = bool(int(args.path) == 1)
-    eng.params.required_snr         = CW_REQUIRED_SNR
-    eng.params.required_reliability = CW_REQUIRED_RELIABILITY
-    eng.params.man_made_noise_at_3mhz = MAN_MADE_NOISE
 
     return [compute_hour_row(eng, rx, h, debug=debug) for h in range(24)]
 
 
-def main() -> int:
+def format_output(args: argparse.Namespace, rows: List[List[float]]) -> str:
+    utc = int(args.utc) % 24
+    header = (
+        f"{int(args.pow)}W,"
+        f"{mode_int_to_string(int(args.mode))},"
+        f"TOA>{float(args.toa):g},"
+        f"{path_int_to_string(int(args.path))},"
+        f"S={int(round(float(args.ssn)))}"
+    )
+
+    lines = [fmt_row(rows[utc]), header]
+    lines += [f"{h} {fmt_row(rows[h])}" for h in range(1, 24)]
+    lines.append(f"0 {fmt_row(rows[0])}")
+    return "\n".join(lines) + "\n"
+
+
+def check_args(args: argparse.Namespace) -> Optional[str]:
+    if not (1 <= args.month <= 12):
+        return "bad month"
+    if not (0 <= args.utc <= 23):
+        return "bad utc"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Service mode
+# ---------------------------------------------------------------------------
+class EngineCache:
+    """Warm PredictionEngines keyed by (month, SSN); least recently used beyond max_engines are dropped."""
+
+    def __init__(self, max_engines: int = SERVICE_MAX_ENGINES):
+        self.max_engines = max_engines
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def engine(self, month: int, ssn: float):
+        """Exclusive use of a warm engine (a concurrent request for the same key builds another)."""
+        key = (int(month), float(ssn))
+        with self._lock:
+            eng = self._engines.pop(key, None)
+        if eng is None:
+            eng = make_engine(month, ssn)
+        try:
+            yield eng
+        finally:
+            with self._lock:
+                self._engines[key] = eng
+                while len(self._engines) > self.max_engines:
+                    self._engines.popitem(last=False)
+
+
+def serve(sock_path: str, max_concurrent: int = SERVICE_CONCURRENCY,
+          max_engines: int = SERVICE_MAX_ENGINES, timeout: float = SERVICE_TIMEOUT) -> int:
+    """Answer band-condition requests on a Unix socket until SIGTERM / SIGINT."""
+    import signal
+    import socketserver
+
+    engines = EngineCache(max_engines)
+    slots = threading.BoundedSemaphore(max_concurrent)
+
+    def answer(argv: List[str]) -> str:
+        try:
+            args = build_parser().parse_args(argv)
+        except SystemExit:
+            raise ValueError("bad request")
+        err = check_args(args)
+        if err:
+            raise ValueError(err)
+        cache_dir = Path(args.cache_dir)
+        key = cache_key(args)
+        rows = load_cache(cache_dir, key, args.cache_ttl)
+        if rows is None:
+            if not slots.acquire(timeout=timeout):
+                raise RuntimeError("busy")
+            try:
+                with engines.engine(args.month, args.ssn) as eng:
+                    rows = compute_rows(args, eng=eng)
+            finally:
+                slots.release()
+            save_cache(cache_dir, key, rows)
+        return format_output(args, rows)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            t0 = time.time()
+            try:
+                req = json.loads(self.rfile.readline(65536))
+                body = answer([str(a) for a in req["argv"]]).encode("utf-8")
+                head = {"ok": True, "bytes": len(body)}
+            except Exception as e:
+                body, head = b"", {"ok": False, "error": str(e) or type(e).__name__}
+                print(f"request failed: {head['error']}", file=sys.stderr)
+            try:
+                self.wfile.write(json.dumps(head).encode("utf-8") + b"\n" + body)
+            except OSError:
+                pass
+            if head["ok"]:
+                print(f"request in {time.time() - t0:.2f}s", file=sys.stderr)
+
+    if os.path.exists(sock_path):
+        os.unlink(sock_path)
+    server = socketserver.ThreadingUnixStreamServer(sock_path, Handler)
+    server.daemon_threads = True
+    os.chmod(sock_path, 0o660)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"serving on {sock_path} ({max_concurrent} concurrent, {max_engines} warm engines)",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(sock_path):
+            os.unlink(sock_path)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser()
     ap.add_argument("--year",   type=int,   required=True)
     ap.add_argument("--month",  type=int,   required=True)
@@ -214,14 +356,25 @@ def main() -> int:
     ap.add_argument("--rx-default-lon", type=float, default=None)
     ap.add_argument("--debug",  action="store_true",
                     help="Print raw dvoacap values to stderr for diagnostics")
+    return ap
 
-    args = ap.parse_args()
 
-    if not (1 <= args.month <= 12):
-        print("bad month", file=sys.stderr)
-        return 2
-    if not (0 <= args.utc <= 23):
-        print("bad utc", file=sys.stderr)
+def main() -> int:
+    sp = argparse.ArgumentParser(add_help=False)
+    sp.add_argument("--serve", metavar="SOCKET",
+                    help="run as a resident service on this Unix socket")
+    sp.add_argument("--max-concurrent", type=int, default=SERVICE_CONCURRENCY)
+    sp.add_argument("--max-engines",    type=int, default=SERVICE_MAX_ENGINES)
+    sp.add_argument("--timeout",        type=float, default=SERVICE_TIMEOUT)
+    svc, rest = sp.parse_known_args()
+    if svc.serve:
+        return serve(svc.serve, max(1, svc.max_concurrent), max(1, svc.max_engines), svc.timeout)
+
+    args = build_parser().parse_args(rest)
+
+    err = check_args(args)
+    if err:
+        print(err, file=sys.stderr)
         return 2
 
     cache_dir = Path(args.cache_dir)
@@ -232,21 +385,7 @@ def main() -> int:
         rows = compute_rows(args, debug=args.debug)
         save_cache(cache_dir, key, rows)
 
-    utc = int(args.utc) % 24
-    header = (
-        f"{int(args.pow)}W,"
-        f"{mode_int_to_string(int(args.mode))},"
-        f"TOA>{float(args.toa):g},"
-        f"{path_int_to_string(int(args.path))},"
-        f"S={int(round(float(args.ssn)))}"
-    )
-
-    print(fmt_row(rows[utc]))
-    print(header)
-    for h in range(1, 24):
-        print(f"{h} {fmt_row(rows[h])}")
-    print(f"0 {fmt_row(rows[0])}")
-
+    sys.stdout.write(format_output(args, rows))
     return 0
 
 